@@ -5,6 +5,7 @@ envelope: an item-sequence fingerprint plus a bitmap of delivered items. See
 docs/superpowers/specs/2026-08-05-batch-envelope-dedup-design.md for why the
 fingerprint is load-bearing.
 """
+import contextvars
 import hashlib
 import logging
 
@@ -15,6 +16,11 @@ logger = logging.getLogger(__name__)
 KEY_PREFIX = "batch_progress"
 FINGERPRINT_BYTES = 8
 
+# Record read by pending_count() before admission, handed to the batch
+# dispatcher's read_progress() in the same task instead of a second GET.
+# Each request runs in its own asyncio task, with its own copy of the context.
+_prefetched = contextvars.ContextVar("prefetched_batch_progress", default=None)
+
 
 def progress_key(batch_id, destination_id, provider_key):
     # provider_key MUST participate: cdip-routing groups transformed items per
@@ -56,22 +62,51 @@ def fingerprint(items):
     across every envelope in the system. Widen FINGERPRINT_BYTES if that
     scoping assumption ever stops holding.
     """
+    return fingerprint_ids([item.gundi_id for item in items])
+
+
+def fingerprint_ids(gundi_ids):
+    """fingerprint() of the items with these gundi_ids, in order."""
     h = hashlib.sha256()
-    h.update(len(items).to_bytes(4, "big"))
-    for item in items:
-        raw = str(item.gundi_id).encode()
+    h.update(len(gundi_ids).to_bytes(4, "big"))
+    for gundi_id in gundi_ids:
+        raw = str(gundi_id).encode()
         h.update(len(raw).to_bytes(4, "big"))
         h.update(raw)
     return h.digest()[:FINGERPRINT_BYTES]
 
 
-def encode(fp, delivered, n):
-    """fingerprint || bitmap, where bit i is set when item i was delivered."""
+def _bitmap(indices, n):
     bitmap = bytearray((n + 7) // 8)
-    for index in delivered:
+    for index in indices:
         if 0 <= index < n:
             bitmap[index // 8] |= 1 << (index % 8)
-    return bytes(fp) + bytes(bitmap)
+    return bytes(bitmap)
+
+
+def _indices(bitmap, n):
+    indices = set()
+    for index in range(n):
+        byte_index = index // 8
+        if byte_index >= len(bitmap):
+            break  # bitmap shorter than n: the remaining bits are absent
+        if bitmap[byte_index] & (1 << (index % 8)):
+            indices.add(index)
+    return indices
+
+
+def encode(fp, delivered, n, failed=()):
+    """fingerprint || bitmap, where bit i is set when item i was delivered.
+
+    Items that failed permanently (ER rejected them on their own) follow in a
+    second bitmap of the same size, only present when there are any. decode()
+    reads the first bitmap only, so records with or without the second one
+    read the same to it.
+    """
+    record = bytes(fp) + _bitmap(delivered, n)
+    if failed:
+        record += _bitmap(failed, n)
+    return record
 
 
 def decode(raw, expected_fingerprint, n):
@@ -84,30 +119,53 @@ def decode(raw, expected_fingerprint, n):
     is acceptable, a silently skipped observation is not.
     """
     try:
-        if len(expected_fingerprint) != FINGERPRINT_BYTES:
-            # A caller-supplied fingerprint of the wrong length can never
-            # match a validly-encoded record; trusting it anyway risks a
-            # spurious match on truncated/malformed input.
+        if not _matches(raw, expected_fingerprint):
             return set()
-        if not raw or len(raw) < FINGERPRINT_BYTES:
-            return set()
-        if bytes(raw[:FINGERPRINT_BYTES]) != bytes(expected_fingerprint):
-            return set()
-        bitmap = raw[FINGERPRINT_BYTES:]
-        delivered = set()
-        for index in range(n):
-            byte_index = index // 8
-            if byte_index >= len(bitmap):
-                break  # bitmap shorter than n: the remaining bits are absent
-            if bitmap[byte_index] & (1 << (index % 8)):
-                delivered.add(index)
-        return delivered
+        return _indices(raw[FINGERPRINT_BYTES:], n)
     except (TypeError, ValueError) as e:
         # A cache returning an unexpected type must fail open, never raise.
         logger.warning(f"Discarding unusable batch progress record: {type(e).__name__} {e}")
         return set()
 
 
+def _matches(raw, expected_fingerprint):
+    if len(expected_fingerprint) != FINGERPRINT_BYTES:
+        # A caller-supplied fingerprint of the wrong length can never
+        # match a validly-encoded record; trusting it anyway risks a
+        # spurious match on truncated/malformed input.
+        return False
+    if not raw or len(raw) < FINGERPRINT_BYTES:
+        return False
+    return bytes(raw[:FINGERPRINT_BYTES]) == bytes(expected_fingerprint)
+
+
+def decode_failed(raw, expected_fingerprint, n):
+    """Indices of the items that failed permanently, or an empty set.
+
+    Empty when the record has no failed bitmap or is unusable (see decode()),
+    in which case those items are posted again: a repeated failure report is
+    acceptable, a skipped observation is not.
+    """
+    try:
+        if not _matches(raw, expected_fingerprint):
+            return set()
+        return _indices(raw[FINGERPRINT_BYTES + (n + 7) // 8:], n)
+    except (TypeError, ValueError):
+        return set()
+
+
+def pending_count(batch_id, destination_id, provider_key, gundi_ids):
+    """How many of the envelope's items were neither delivered nor failed. Never raises.
+
+    Counts every item when the record is missing or unusable, like decode().
+    The record is kept for the read_progress() that follows in the same task.
+    """
+    raw = read_progress(batch_id, destination_id, provider_key)
+    _prefetched.set((progress_key(batch_id, destination_id, provider_key), raw))
+    fp, n = fingerprint_ids(gundi_ids), len(gundi_ids)
+    return n - len(decode(raw, fp, n) | decode_failed(raw, fp, n))
+
+
 def read_progress(batch_id, destination_id, provider_key):
     """Raw record bytes, or None. Never raises.
 
@@ -115,22 +173,27 @@ def read_progress(batch_id, destination_id, provider_key):
     test suite's `mocker.patch("core.utils._cache_db", ...)` takes effect -
     same pattern as core/throttling.py.
     """
+    key = progress_key(batch_id, destination_id, provider_key)
+    prefetched = _prefetched.get()
+    if prefetched is not None and prefetched[0] == key:
+        _prefetched.set(None)
+        return prefetched[1]
     try:
-        return utils._cache_db.get(progress_key(batch_id, destination_id, provider_key))
+        return utils._cache_db.get(key)
     except Exception as e:
         logger.warning(f"Error reading batch progress from cache: {e}", exc_info=True)
         return None
 
 
-def write_progress(batch_id, destination_id, provider_key, fp, delivered, n, ttl):
-    """Persist the record. No-op when nothing was delivered. Never raises."""
-    if not delivered:
+def write_progress(batch_id, destination_id, provider_key, fp, delivered, n, ttl, failed=()):
+    """Persist the record. No-op when nothing was delivered or failed. Never raises."""
+    if not delivered and not failed:
         return
     try:
         utils._cache_db.setex(
             name=progress_key(batch_id, destination_id, provider_key),
             time=ttl,
-            value=encode(fp, delivered, n),
+            value=encode(fp, delivered, n, failed),
         )
     except Exception as e:
         logger.warning(f"Error writing batch progress to cache: {e}", exc_info=True)
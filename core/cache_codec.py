@@ -0,0 +1,127 @@
+import datetime
+import functools
+import importlib.metadata
+import uuid
+from enum import Enum
+from typing import Any, Union, get_args, get_origin
+
+import msgpack
+from pydantic import BaseModel, ConstrainedStr
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
+
+# Cached configuration objects are stored as msgpack [version, data, meta],
+# data being model.dict(by_alias=True), which is what parse_obj() and
+# _construct() read back. Entries tagged with this version were written by
+# this code from already validated models, so they're rebuilt without
+# validation; any other version (an older layout, or a gundi-core upgrade that
+# may have changed the schemas) goes through full validation.
+CACHE_FORMAT_VERSION = 1
+SCHEMA_VERSION = f"{CACHE_FORMAT_VERSION}/gundi-core-{importlib.metadata.version('gundi-core')}"
+
+# msgpack extension types for values it has no native type for
+_EXT_UUID = 1
+_EXT_DATETIME = 2
+
+# Field types whose msgpack-decoded values are already what validation returns
+_PLAIN_TYPES = (str, int, float, bool, uuid.UUID, datetime.datetime, Any)
+
+
+def _encode_ext(value):
+    if isinstance(value, uuid.UUID):
+        return msgpack.ExtType(_EXT_UUID, value.bytes)
+    if isinstance(value, datetime.datetime):
+        return msgpack.ExtType(_EXT_DATETIME, value.isoformat().encode())
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Cannot encode {type(value).__name__} for the cache")
+
+
+def _decode_ext(code, data):
+    if code == _EXT_UUID:
+        return uuid.UUID(bytes=data)
+    if code == _EXT_DATETIME:
+        return datetime.datetime.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+def dumps(model, **meta):
+    """Encode a pydantic model (plus optional metadata) for the cache."""
+    return msgpack.packb([SCHEMA_VERSION, model.dict(by_alias=True), meta], default=_encode_ext)
+
+
+def dumps_tombstone(**meta):
+    """Encode an entry holding only metadata (e.g. why there's no object)."""
+    return msgpack.packb([SCHEMA_VERSION, None, meta], default=_encode_ext)
+
+
+def loads(model_class, cached):
+    """
+    Decode an entry written by dumps() into (model, meta), or by
+    dumps_tombstone() into (None, meta).
+    Raises TypeError or ValueError (incl. pydantic's ValidationError) for
+    unreadable entries.
+    """
+    version, data, meta = msgpack.unpackb(cached, ext_hook=_decode_ext)
+    if data is None:
+        return None, meta
+    if version == SCHEMA_VERSION:
+        return _construct(model_class, data), meta
+    return model_class.parse_obj(data), meta
+
+
+def _is_plain(field):
+    field_type = field.type_
+    if get_origin(field_type) is Union:
+        return all(_is_plain_type(t) for t in get_args(field_type))
+    return _is_plain_type(field_type)
+
+
+def _is_plain_type(field_type):
+    if field_type in _PLAIN_TYPES or field_type is type(None):
+        return True
+    return isinstance(field_type, type) and issubclass(field_type, ConstrainedStr)
+
+
+@functools.lru_cache(maxsize=None)
+def _construction_plan(model_class):
+    # (name, alias, how) per field, how being "plain" (used as decoded),
+    # "model"/"models" (a nested model or a list of them, rebuilt the same
+    # way) or "validate" (e.g. HttpUrl, enums: validated on their own)
+    plan = []
+    for name, field in model_class.__fields__.items():
+        nested = isinstance(field.type_, type) and issubclass(field.type_, BaseModel)
+        if nested and field.shape == SHAPE_SINGLETON:
+            how = "model"
+        elif nested and field.shape == SHAPE_LIST:
+            how = "models"
+        elif not nested and field.shape == SHAPE_SINGLETON and _is_plain(field):
+            how = "plain"
+        elif not nested and field.sub_fields and all(_is_plain(f) for f in field.sub_fields):
+            how = "plain"  # List[str], Dict[str, Any], ...
+        else:
+            how = "validate"
+        plan.append((name, field.alias, how, field))
+    return tuple(plan)
+
+
+def _construct(model_class, data):
+    # construct() skips validation but isn't recursive, so nested models are
+    # built here following the model's fields
+    values = {}
+    for name, alias, how, field in _construction_plan(model_class):
+        if alias not in data:
+            continue
+        value = data[alias]
+        if value is None or how == "plain":
+            values[name] = value
+        elif how == "model":
+            values[name] = _construct(field.type_, value)
+        elif how == "models":
+            values[name] = [_construct(field.type_, v) for v in value]
+        else:
+            value, errors = field.validate(value, values, loc=alias, cls=model_class)
+            if errors:
+                # Not what this code wrote: validate the whole entry instead
+                return model_class.parse_obj(data)
+            values[name] = value
+    return model_class.construct(**values)
@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+
+from core import settings
+from core import utils
+
+logger = logging.getLogger(__name__)
+
+# Cache entries derived from an integration's configuration, by key prefix
+# (see core.utils). All of them are dropped when the portal reports a change,
+# including the integration_details entry marking it unavailable.
+CONFIG_CACHE_KEY_PREFIXES = (
+    utils.INTEGRATION_DETAILS_KEY_PREFIX, utils.OUTBOUND_DETAIL_KEY_PREFIX, utils.INBOUND_DETAIL_KEY_PREFIX,
+)
+
+# Portal config-change events and the payload field holding the integration id
+INTEGRATION_ID_FIELD_BY_EVENT_TYPE = {
+    "IntegrationCreated": "id",
+    "IntegrationUpdated": "id",
+    "IntegrationDeleted": "id",
+    "ActionConfigCreated": "integration",
+    "ActionConfigUpdated": "integration_id",
+    "ActionConfigDeleted": "integration_id",
+}
+
+# Published instead of an id to drop every in-process copy
+INVALIDATE_ALL = "*"
+LISTENER_RETRY_SECONDS = 5
+
+_listener = None
+_listener_guard = threading.Lock()
+
+
+def is_config_event(event):
+    return isinstance(event, dict) and event.get("event_type") in INTEGRATION_ID_FIELD_BY_EVENT_TYPE
+
+
+def invalidate_integration(integration_id):
+    # Deletes the shared entries and tells every instance to drop its
+    # in-process copy. Redis errors propagate: the portal event is then
+    # nacked and redelivered rather than the invalidation being lost.
+    integration_id = str(integration_id)
+    utils._cache_db.delete(*(f"{prefix}.{integration_id}" for prefix in CONFIG_CACHE_KEY_PREFIXES))
+    utils.forget_integration_details(integration_id)
+    utils._cache_db.publish(settings.CONFIG_INVALIDATION_CHANNEL, integration_id)
+
+
+def handle_config_event(event):
+    """Invalidate the cached configuration an event from the portal refers to."""
+    event_type = event.get("event_type")
+    payload = event.get("payload") or {}
+    integration_id = payload.get(INTEGRATION_ID_FIELD_BY_EVENT_TYPE[event_type])
+    if not integration_id:
+        logger.warning(f"Config event {event_type} carries no integration id, ignored.")
+        return
+    logger.info(f"Invalidating cached configuration of integration {integration_id} ({event_type}).")
+    invalidate_integration(integration_id)
+
+
+def _on_invalidation_message(message):
+    data = message.get("data")
+    integration_id = data.decode() if isinstance(data, bytes) else str(data)
+    if integration_id == INVALIDATE_ALL:
+        utils.forget_integration_details()
+    else:
+        utils.forget_integration_details(integration_id)
+
+
+def _listen():
+    while True:
+        try:
+            pubsub = utils._cache_db.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(settings.CONFIG_INVALIDATION_CHANNEL)
+            for message in pubsub.listen():
+                if message.get("type") == "message":
+                    _on_invalidation_message(message)
+        except Exception as e:
+            logger.warning(f"Config invalidation listener disconnected: {e}")
+        # Invalidations published while disconnected are lost: start over
+        # from the shared cache instead of trusting the in-process copies
+        utils.forget_integration_details()
+        time.sleep(LISTENER_RETRY_SECONDS)
+
+
+def start_listener():
+    """Start the per-instance listener thread (once). Never raises."""
+    global _listener
+    with _listener_guard:
+        if _listener and _listener.is_alive():
+            return
+        try:
+            _listener = threading.Thread(target=_listen, name="config-invalidation", daemon=True)
+            _listener.start()
+        except Exception as e:
+            logger.warning(f"Could not start the config invalidation listener: {e}")
@@ -0,0 +1,38 @@
+import logging
+
+from core import settings
+from core.tracing.payload_capture import bounded_repr
+
+# Payload dumps (request bodies, messages, events) go to their own logger, off
+# unless DIAGNOSTICS_LOGGING_LEVEL=DEBUG (see core.settings), whatever
+# LOGGING_LEVEL is.
+logger = logging.getLogger("diagnostics")
+
+
+class _Capped:
+    # Rendered only if a handler formats the record
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return bounded_repr(self.value, settings.DIAGNOSTICS_MAX_FIELD_BYTES)
+
+
+def dump(title, /, **fields):
+    """
+    Log title with fields (payloads, headers, attributes...) at DEBUG.
+
+    Returns right away when diagnostics are off. Otherwise each field is cut
+    at DIAGNOSTICS_MAX_FIELD_BYTES, and only rendered when the record is
+    formatted. The field names are also attached as structured extras.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    names = list(fields)
+    logger.debug(
+        title + "".join(f"\n {name}: %s" for name in names),
+        *(_Capped(fields[name]) for name in names),
+        extra={"diagnostic_title": title, "diagnostic_fields": names},
+    )
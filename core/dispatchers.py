@@ -7,8 +7,8 @@ from erclient.er_errors import ERClientBadCredentials
 from typing import Union, List
 from urllib.parse import urlparse
 from gundi_core import schemas
-from cdip_connector.core.cloudstorage import get_cloud_storage
 
+from core import memory_tracking
 from core.utils import find_config_for_action
 from core.er_auth import TokenCachingAsyncERClient, invalidate_cached_token
 
@@ -17,6 +17,13 @@ logger = logging.getLogger(__name__)
 DEFAULT_TIMEOUT = (3.1, 20)
 
 
+def get_cloud_storage():
+    # Imported here so only the attachment dispatchers load the storage client
+    from cdip_connector.core.cloudstorage import get_cloud_storage
+
+    return get_cloud_storage()
+
+
 class Dispatcher(ABC):
     stream_type: schemas.StreamPrefixEnum
     destination_type: schemas.DestinationTypes
@@ -341,16 +348,18 @@ class ERObservationsBatchDispatcher(ERDispatcherV2):
         # behavior directly against the pinned client's building blocks.
         async with self.er_client as client:
             try:
-                observations_cleaned = [
-                    json.loads(o.json(exclude_none=True, exclude_unset=True))
-                    for o in observations
-                ]
-                for obs in observations_cleaned:
-                    client._clean_observation(obs)
-                return await client._post(
-                    f"sensors/generic/{client.provider_key}/status",
-                    payload=observations_cleaned,
-                )
+                with memory_tracking.tracked("serialize"):
+                    observations_cleaned = [
+                        json.loads(o.json(exclude_none=True, exclude_unset=True))
+                        for o in observations
+                    ]
+                    for obs in observations_cleaned:
+                        client._clean_observation(obs)
+                with memory_tracking.tracked("post"):
+                    return await client._post(
+                        f"sensors/generic/{client.provider_key}/status",
+                        payload=observations_cleaned,
+                    )
             except Exception as ex:
                 logger.exception(
                     f"Error sending observations batch to {client.service_root}: \n{type(ex)}: {ex}"
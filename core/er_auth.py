@@ -1,7 +1,12 @@
+import asyncio
 import base64
+import functools
 import hashlib
 import json
 import logging
+import threading
+import time
+import uuid
 from datetime import datetime, timedelta, timezone
 from urllib.parse import urlparse
 
@@ -10,8 +15,8 @@ import httpx
 from cryptography.fernet import Fernet, InvalidToken
 from erclient import AsyncERClient
 
-from core import settings
-from core.utils import get_redis_db
+from core import settings, stage_timing
+from core.utils import LazyRedisDB
 
 logger = logging.getLogger(__name__)
 
@@ -20,34 +25,111 @@ TOKEN_CACHE_KEY_PREFIX = "er_dispatcher.auth_token"
 MIN_REMAINING_VALIDITY_SECONDS = 60
 LOGIN_MAX_TRIES = 3
 LOGIN_MAX_TIME_SECONDS = 10
+# Held by the instance refreshing a token ahead of expiry. Left to expire
+# rather than released: after a successful refresh the fresh cache entry stops
+# further refreshes anyway, and after a failed one it spaces out the retries.
+REFRESH_LOCK_TTL_SECONDS = 60
+# Login mutex: one caller per credential runs the password grant while the
+# others poll the token cache. The lock outlives a worst-case login (backoff
+# plus request timeouts); waiters give up sooner and log in themselves.
+LOGIN_LOCK_TTL_SECONDS = 30
+LOGIN_WAIT_MAX_SECONDS = 15
+LOGIN_WAIT_POLL_SECONDS = 0.25
+# Deletes the lock only if it still holds our token, so a login that outlived
+# its lock can't release the next holder's.
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
 
-_cache_db = get_redis_db()
+_cache_db = LazyRedisDB()
 
+# Cache keys with a background refresh running in this process
+_refreshes_in_flight = set()
+# In-process copies of cached tokens, checked before Redis:
+# (cache_key, cache secret) -> (access_token, expires_at, recheck_at), with
+# recheck_at on time.monotonic(), at most ER_TOKEN_MEMORY_TTL_SECONDS ahead.
+_token_memory = {}
+_refreshes_guard = threading.Lock()
 
-def _token_cache_key(token_url, username, password):
+
+@functools.lru_cache(maxsize=256)
+def _derive_cache_entry_keys(token_url, username, password, cache_secret):
+    # Returns (cache_key, cipher). Every token read and write needs both, so
+    # they are derived once per credential and kept in memory (never in
+    # Redis); the cache secret is part of the memo key so a changed secret
+    # derives a new cipher.
+    host = urlparse(token_url).hostname or token_url
     # The credential fingerprint binds the cache entry to the full credential
     # pair: a client presenting the right username but a wrong password must
     # miss the cache and go through a real (validating) password grant.
-    host = urlparse(token_url).hostname or token_url
     credential_fingerprint = hashlib.sha256(f"{username}:{password}".encode()).hexdigest()[:16]
-    return f"{TOKEN_CACHE_KEY_PREFIX}.{host}.{username}.{credential_fingerprint}"
-
-
-def _entry_cipher(token_url, username, password):
+    cache_key = f"{TOKEN_CACHE_KEY_PREFIX}.{host}.{username}.{credential_fingerprint}"
     # Entries are encrypted under a key derived from the credentials the
     # legitimate reader must already hold (plus an optional deployment
     # secret), so Redis contents alone are neither readable nor forgeable.
-    # ER_TOKEN_CACHE_SECRET is read at call time so all deployments sharing
-    # the cache must present the same value.
-    host = urlparse(token_url).hostname or token_url
     key_material = hashlib.sha256(
-        f"{settings.ER_TOKEN_CACHE_SECRET}:{host}:{username}:{password}".encode()
+        f"{cache_secret}:{host}:{username}:{password}".encode()
     ).digest()
-    return Fernet(base64.urlsafe_b64encode(key_material))
+    return cache_key, Fernet(base64.urlsafe_b64encode(key_material))
+
+
+def _token_cache_key(token_url, username, password):
+    return _derive_cache_entry_keys(
+        token_url, username, password, settings.ER_TOKEN_CACHE_SECRET
+    )[0]
+
+
+def _entry_cipher(token_url, username, password):
+    # ER_TOKEN_CACHE_SECRET is read at call time so all deployments sharing
+    # the cache must present the same value.
+    return _derive_cache_entry_keys(
+        token_url, username, password, settings.ER_TOKEN_CACHE_SECRET
+    )[1]
+
+
+def _memory_key(token_url, username, password):
+    # The cache secret is part of the key, like for the cipher: a token cached
+    # under one secret is never served under another
+    return _token_cache_key(token_url, username, password), settings.ER_TOKEN_CACHE_SECRET
+
+
+def _remember_token(token_url, username, password, access_token, expires_at):
+    if settings.ER_TOKEN_MEMORY_TTL_SECONDS <= 0:
+        return
+    recheck_at = time.monotonic() + settings.ER_TOKEN_MEMORY_TTL_SECONDS
+    _token_memory[_memory_key(token_url, username, password)] = (access_token, expires_at, recheck_at)
+
+
+def forget_tokens():
+    _token_memory.clear()
 
 
 def read_cached_token(token_url, username, password):
-    """Return (access_token, expires_at) from the cache, or None. Never raises."""
+    """Return (access_token, expires_at) from memory or the cache, or None. Never raises."""
+    try:
+        remembered = _token_memory.get(_memory_key(token_url, username, password))
+    except Exception as e:
+        logger.warning(f"Error reading ER auth token from memory: {e}")
+        return None
+    if remembered:
+        access_token, expires_at, recheck_at = remembered
+        # A remembered token too close to expiry to be used is skipped, so the
+        # cache is read for the one another instance may have logged in for
+        min_valid_until = datetime.now(tz=timezone.utc) + timedelta(
+            seconds=MIN_REMAINING_VALIDITY_SECONDS
+        )
+        if recheck_at > time.monotonic() and expires_at > min_valid_until:
+            return access_token, expires_at
+    cached = _read_shared_token(token_url, username, password)
+    if cached:
+        _remember_token(token_url, username, password, *cached)
+    return cached
+
+
+def _read_shared_token(token_url, username, password):
     try:
         raw_entry = _cache_db.get(_token_cache_key(token_url, username, password))
     except Exception as e:
@@ -84,6 +166,7 @@ def write_cached_token(token_url, username, password, access_token, expires_at):
             {"access_token": access_token, "expires_at": expires_at.isoformat()}
         ).encode()
     )
+    _remember_token(token_url, username, password, access_token, expires_at)
     try:
         _cache_db.setex(_token_cache_key(token_url, username, password), ttl_seconds, entry)
     except Exception as e:
@@ -93,11 +176,120 @@ def write_cached_token(token_url, username, password, access_token, expires_at):
 def invalidate_cached_token(token_url, username, password):
     """Delete a cached token (e.g. after ER rejects it). Never raises."""
     try:
+        _token_memory.pop(_memory_key(token_url, username, password), None)
         _cache_db.delete(_token_cache_key(token_url, username, password))
     except Exception as e:
         logger.warning(f"Error deleting ER auth token from cache: {e}")
 
 
+def acquire_login_lock(token_url, username, password):
+    """Return a lock token if this caller should log in, else None.
+
+    Redis errors return a token too: without the mutex everyone logs in, as
+    before, rather than waiting on a cache that can't be read.
+    """
+    lock_token = uuid.uuid4().hex
+    try:
+        acquired = _cache_db.set(
+            f"{_token_cache_key(token_url, username, password)}.login",
+            lock_token, ex=LOGIN_LOCK_TTL_SECONDS, nx=True,
+        )
+    except Exception as e:
+        logger.warning(f"Error acquiring ER login lock: {e}")
+        return lock_token
+    return lock_token if acquired else None
+
+
+def release_login_lock(token_url, username, password, lock_token):
+    """Release a lock taken by acquire_login_lock. Never raises."""
+    try:
+        _cache_db.eval(
+            _RELEASE_LOCK_SCRIPT, 1,
+            f"{_token_cache_key(token_url, username, password)}.login", lock_token,
+        )
+    except Exception as e:
+        logger.warning(f"Error releasing ER login lock: {e}")
+
+
+def _needs_refresh(expires_at):
+    refresh_ahead = settings.ER_TOKEN_REFRESH_AHEAD_SECONDS
+    if refresh_ahead <= 0:
+        return False
+    return expires_at <= datetime.now(tz=timezone.utc) + timedelta(seconds=refresh_ahead)
+
+
+async def refresh_token(client_kwargs):
+    """Log in and re-cache the token, unless another instance holds the refresh lock."""
+    credentials = client_kwargs["token_url"], client_kwargs["username"], client_kwargs["password"]
+    cache_key = _token_cache_key(*credentials)
+    # This instance may have been serving a remembered copy: if another
+    # instance already replaced the shared token, adopting it is enough.
+    shared = _read_shared_token(*credentials)
+    if shared and not _needs_refresh(shared[1]):
+        _remember_token(*credentials, *shared)
+        return
+    try:
+        acquired = _cache_db.set(
+            f"{cache_key}.refresh", "1", ex=REFRESH_LOCK_TTL_SECONDS, nx=True
+        )
+    except Exception as e:
+        logger.warning(f"Error acquiring ER auth token refresh lock: {e}")
+        return
+    if not acquired:
+        return
+    login_lock = acquire_login_lock(*credentials)
+    if not login_lock:
+        return  # a login is already replacing the token
+    client = TokenCachingAsyncERClient(**client_kwargs)
+    try:
+        await client.login()  # writes the fresh token to the cache
+    finally:
+        release_login_lock(*credentials, login_lock)
+        await client.close()
+
+
+def _run_refresh(client_kwargs, cache_key):
+    try:
+        asyncio.run(refresh_token(client_kwargs))
+    except Exception as e:
+        # The current token is still valid; the next read past the threshold
+        # (once the lock expires) tries again.
+        logger.warning(f"Background ER auth token refresh failed: {e}")
+    finally:
+        with _refreshes_guard:
+            _refreshes_in_flight.discard(cache_key)
+
+
+def schedule_token_refresh(client):
+    """Refresh the client's token in a background thread. Never raises.
+
+    A thread with its own event loop, not a task: a task on the request's
+    loop only makes progress while that thread is serving a request.
+    """
+    cache_key = _token_cache_key(client.token_url, client.username, client.password)
+    with _refreshes_guard:
+        if cache_key in _refreshes_in_flight:
+            return
+        _refreshes_in_flight.add(cache_key)
+    client_kwargs = {
+        "service_root": client.service_root,
+        "username": client.username,
+        "password": client.password,
+        "token_url": client.token_url,
+        "client_id": client.client_id,
+        "provider_key": client.provider_key,
+    }
+    try:
+        threading.Thread(
+            target=_run_refresh, args=(client_kwargs, cache_key),
+            name="er-token-refresh", daemon=True,
+        ).start()
+    except Exception as e:
+        logger.warning(f"Could not start ER auth token refresh: {e}")
+        with _refreshes_guard:
+            _refreshes_in_flight.discard(cache_key)
+
+
 def _is_permanent_login_error(exception):
     """4xx from the token endpoint (bad credentials/request) — do not retry."""
     return (
@@ -113,32 +305,64 @@ class TokenCachingAsyncERClient(AsyncERClient):
 
     ER's /oauth2/token endpoint has a concurrency bug (django-oauth-toolkit
     #995/#960) triggered by simultaneous password grants for the same user,
-    so logins are also retried with backoff on transient failures.
+    so logins are serialized per credential by a Redis lock and also
+    retried with backoff on transient failures.
     The refresh-token grant is deliberately never used: refresh rotation is
     racy under concurrency, and a fresh password grant every ~47h is cheap.
+    Cached tokens within ER_TOKEN_REFRESH_AHEAD_SECONDS of expiry are still
+    used, while one instance replaces them in the background, so messages
+    don't wait on a login when the shared token runs out.
     """
 
     async def auth_headers(self):
         # Static-token clients and clients that already logged in have valid
         # auth; a client with a year-2099 expiry (token= kwarg) always hits this.
         if not self._auth_is_valid():
-            cached = read_cached_token(self.token_url, self.username, self.password)
-            if cached:
-                access_token, expires_at = cached
-                min_valid_until = datetime.now(tz=timezone.utc) + timedelta(
-                    seconds=MIN_REMAINING_VALIDITY_SECONDS
-                )
-                if expires_at > min_valid_until:
-                    self.auth = {"token_type": "Bearer", "access_token": access_token}
-                    self.auth_expires = expires_at
-        if not self._auth_is_valid():
-            # No refresh grant here on purpose (see class docstring).
-            await self.login()
+            with stage_timing.timed("token_resolution"):
+                self._use_cached_token()
+                if not self._auth_is_valid():
+                    # No refresh grant here on purpose (see class docstring).
+                    await self._login_or_wait()
         return {
             "Authorization": f'{self.auth["token_type"]} {self.auth["access_token"]}',
             "Accept-Type": "application/json",
         }
 
+    def _use_cached_token(self):
+        cached = read_cached_token(self.token_url, self.username, self.password)
+        if not cached:
+            return
+        access_token, expires_at = cached
+        min_valid_until = datetime.now(tz=timezone.utc) + timedelta(
+            seconds=MIN_REMAINING_VALIDITY_SECONDS
+        )
+        if expires_at > min_valid_until:
+            self.auth = {"token_type": "Bearer", "access_token": access_token}
+            self.auth_expires = expires_at
+            if _needs_refresh(expires_at):
+                schedule_token_refresh(self)
+
+    async def _login_or_wait(self):
+        # Concurrent password grants for one user are what break ER's token
+        # endpoint, so only the lock holder logs in; the rest wait for its
+        # token to show up in the cache.
+        lock_token = acquire_login_lock(self.token_url, self.username, self.password)
+        if lock_token:
+            try:
+                await self.login()
+            finally:
+                release_login_lock(self.token_url, self.username, self.password, lock_token)
+            return
+        for _ in range(int(LOGIN_WAIT_MAX_SECONDS / LOGIN_WAIT_POLL_SECONDS)):
+            await asyncio.sleep(LOGIN_WAIT_POLL_SECONDS)
+            self._use_cached_token()
+            if self._auth_is_valid():
+                return
+        logger.warning(
+            f"Timed out waiting for a concurrent ER login for {self.username}, logging in"
+        )
+        await self.login()
+
     @backoff.on_exception(
         backoff.expo,
         (httpx.HTTPStatusError, httpx.RequestError),
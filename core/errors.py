@@ -4,5 +4,11 @@ class ReferenceDataError(Exception):
     pass
 
 
+class IntegrationUnavailable(ReferenceDataError):
+    # The integration was deleted or can't be used as configured; remembered
+    # for a while so messages for it fail without asking the portal again
+    pass
+
+
 class DispatcherException(Exception):
     pass
\ No newline at end of file
@@ -13,7 +13,7 @@ from gundi_core.events.transformers import (
 # NOTE: ObservationsBatchTransformedER lives in gundi_core.events.batches, not
 # .transformers (verified against gundi_core 1.13.0's actual module layout).
 from gundi_core.events import ObservationsBatchTransformedER
-from core import tracing, dispatchers, settings, throttling, batch_progress
+from core import tracing, dispatchers, settings, throttling, batch_progress, stage_timing
 from core.errors import ReferenceDataError, DispatcherException
 from core.utils import (
     ExtraKeys,
@@ -116,7 +116,8 @@ async def dispatch_transformed_observation_v2(observation, attributes: dict):
             raise ReferenceDataError(error_msg)
 
         # Get details about the destination
-        destination_integration = await get_integration_details(integration_id=destination_id)
+        with stage_timing.timed("config_lookup"):
+            destination_integration = await get_integration_details(integration_id=destination_id)
         if not destination_integration:
             error_msg = f"No destination config details found for destination_id {destination_id}"
             logger.error(
@@ -128,7 +129,8 @@ async def dispatch_transformed_observation_v2(observation, attributes: dict):
         # Check for related observations
         if not is_null(related_to):
             # Check if the related object was dispatched
-            related_observation = await get_dispatched_observation(gundi_id=related_to, destination_id=destination_id)
+            with stage_timing.timed("related_lookup"):
+                related_observation = await get_dispatched_observation(gundi_id=related_to, destination_id=destination_id)
             if not related_observation:
                 error_msg = f"Error getting related observation {related_to}. Will retry later.",
                 logger.error(
@@ -148,7 +150,8 @@ async def dispatch_transformed_observation_v2(observation, attributes: dict):
 
         # If it's an update, get the external id (ER Event uuid)
         if stream_type == schemas.v2.StreamPrefixEnum.event_update:
-            dispatched_observation = await get_dispatched_observation(gundi_id=gundi_id, destination_id=destination_id)
+            with stage_timing.timed("related_lookup"):
+                dispatched_observation = await get_dispatched_observation(gundi_id=gundi_id, destination_id=destination_id)
             if not dispatched_observation or not dispatched_observation.external_id:
                 error_msg = f"Event {gundi_id} wasn't delivered yet. Will retry later."
                 logger.warning(
@@ -197,7 +200,8 @@ async def dispatch_transformed_observation_v2(observation, attributes: dict):
                     "external_id": external_id,  # Used in updates
                     "related_observation": related_observation  # Used in attachments
                 }
-                result = await dispatcher.send(observation, **kwargs)
+                with stage_timing.timed("er_post"):
+                    result = await dispatcher.send(observation, **kwargs)
             except Exception as e:
                 error = f"{type(e).__name__}: {e}"
                 error_msg = f"Exception occurred dispatching observation {gundi_id}: {error}"
@@ -271,18 +275,19 @@ async def dispatch_transformed_observation_v2(observation, attributes: dict):
                 )
                 # Emit events for the portal and other interested services (EDA)
                 if stream_type == schemas.v2.StreamPrefixEnum.event_update.value:
-                    await publish_event(
-                        event=system_events.ObservationUpdated(
-                            payload=gundi_schemas_v2.UpdatedObservation(
-                                gundi_id=gundi_id,
-                                related_to=related_to,
-                                data_provider_id=data_provider_id,
-                                destination_id=destination_id,
-                                updated_at=datetime.now(timezone.utc)  # UTC
-                            )
-                        ),
-                        topic_name=settings.DISPATCHER_EVENTS_TOPIC
-                    )
+                    with stage_timing.timed("event_publish"):
+                        await publish_event(
+                            event=system_events.ObservationUpdated(
+                                payload=gundi_schemas_v2.UpdatedObservation(
+                                    gundi_id=gundi_id,
+                                    related_to=related_to,
+                                    data_provider_id=data_provider_id,
+                                    destination_id=destination_id,
+                                    updated_at=datetime.now(timezone.utc)  # UTC
+                                )
+                            ),
+                            topic_name=settings.DISPATCHER_EVENTS_TOPIC
+                        )
 
                 else:
                     # Cache data related to the dispatched observation
@@ -296,14 +301,16 @@ async def dispatch_transformed_observation_v2(observation, attributes: dict):
                         destination_id=destination_id,
                         delivered_at=datetime.now(timezone.utc)  # UTC
                     )
-                    cache_dispatched_observation(observation=dispatched_observation)
+                    with stage_timing.timed("cache_write"):
+                        cache_dispatched_observation(observation=dispatched_observation)
                     # Emit events for the portal and other interested services (EDA)
-                    await publish_event(
-                        event=system_events.ObservationDelivered(
-                            payload=dispatched_observation
-                        ),
-                        topic_name=settings.DISPATCHER_EVENTS_TOPIC
-                    )
+                    with stage_timing.timed("event_publish"):
+                        await publish_event(
+                            event=system_events.ObservationDelivered(
+                                payload=dispatched_observation
+                            ),
+                            topic_name=settings.DISPATCHER_EVENTS_TOPIC
+                        )
 
 
 async def handle_er_event(event: EventTransformedER, attributes: dict):
@@ -311,7 +318,7 @@ async def handle_er_event(event: EventTransformedER, attributes: dict):
     with tracing.tracer.start_as_current_span(
             "er_dispatcher.handle_er_event", kind=SpanKind.CONSUMER
     ) as current_span:
-        current_span.set_attribute("payload", repr(event.payload))
+        tracing.payload_capture.set_payload_attribute(current_span, "payload", event.payload)
         return await dispatch_transformed_observation_v2(observation=event.payload, attributes=attributes)
 
 
@@ -321,8 +328,8 @@ async def handle_er_event_update(event: EventUpdateTransformedER, attributes: di
             "er_dispatcher.handle_er_event_update", kind=SpanKind.CONSUMER
     ) as current_span:
         event_update = event.payload
-        current_span.set_attribute("payload", repr(event.payload))
-        current_span.set_attribute("changes", str(event_update.changes))
+        tracing.payload_capture.set_payload_attribute(current_span, "payload", event.payload)
+        tracing.payload_capture.set_payload_attribute(current_span, "changes", event_update.changes)
         return await dispatch_transformed_observation_v2(observation=event.payload, attributes=attributes)
 
 
@@ -331,7 +338,7 @@ async def handle_er_attachment(event: AttachmentTransformedER, attributes: dict)
     with tracing.tracer.start_as_current_span(
             "er_dispatcher.handle_er_attachment", kind=SpanKind.CONSUMER
     ) as current_span:
-        current_span.set_attribute("payload", repr(event.payload))
+        tracing.payload_capture.set_payload_attribute(current_span, "payload", event.payload)
         return await dispatch_transformed_observation_v2(observation=event.payload, attributes=attributes)
 
 
@@ -340,7 +347,7 @@ async def handle_er_observation(event: AttachmentTransformedER, attributes: dict
     with tracing.tracer.start_as_current_span(
             "er_dispatcher.handle_er_observation", kind=SpanKind.CONSUMER
     ) as current_span:
-        current_span.set_attribute("payload", repr(event.payload))
+        tracing.payload_capture.set_payload_attribute(current_span, "payload", event.payload)
         return await dispatch_transformed_observation_v2(observation=event.payload, attributes=attributes)
 
 
@@ -349,7 +356,7 @@ async def handle_er_message(event: MessageTransformedER, attributes: dict):
     with tracing.tracer.start_as_current_span(
             "er_dispatcher.handle_er_message", kind=SpanKind.CONSUMER
     ) as current_span:
-        current_span.set_attribute("payload", repr(event.payload))
+        tracing.payload_capture.set_payload_attribute(current_span, "payload", event.payload)
         return await dispatch_transformed_observation_v2(observation=event.payload, attributes=attributes)
 
 
@@ -371,18 +378,19 @@ def _chunked(items, size):
 async def _publish_batch_delivered(batch, delivered_gundi_ids):
     if not delivered_gundi_ids:
         return
-    await publish_event(
-        event=system_events.ObservationsBatchDelivered(
-            payload=system_events.ObservationsBatchDeliveryDetails(
-                batch_id=batch.batch_id,
-                data_provider_id=batch.data_provider_id,
-                destination_id=batch.destination_id,
-                delivered_at=datetime.now(timezone.utc),
-                gundi_ids=delivered_gundi_ids,
-            )
-        ),
-        topic_name=settings.DISPATCHER_EVENTS_TOPIC,
-    )
+    with stage_timing.timed("event_publish"):
+        await publish_event(
+            event=system_events.ObservationsBatchDelivered(
+                payload=system_events.ObservationsBatchDeliveryDetails(
+                    batch_id=batch.batch_id,
+                    data_provider_id=batch.data_provider_id,
+                    destination_id=batch.destination_id,
+                    delivered_at=datetime.now(timezone.utc),
+                    gundi_ids=delivered_gundi_ids,
+                )
+            ),
+            topic_name=settings.DISPATCHER_EVENTS_TOPIC,
+        )
 
 
 async def _publish_item_delivery_failed(batch, item, exception):
@@ -407,18 +415,22 @@ async def _publish_item_delivery_failed(batch, item, exception):
     )
 
 
-def _flush_progress(batch, destination_id, fp, delivered):
+def _flush_progress(batch, destination_id, fp, delivered, failed):
     # One write per chunk, not per item. Called after every successful chunk so
     # progress is durable BEFORE the transient-error branch raises to nack.
-    batch_progress.write_progress(
-        batch_id=batch.batch_id,
-        destination_id=destination_id,
-        provider_key=batch.provider_key,
-        fp=fp,
-        delivered=delivered,
-        n=len(batch.items),
-        ttl=settings.DISPATCHED_BATCH_PROGRESS_CACHE_TTL,
-    )
+    # Permanently failed items are recorded too, so a redelivery (after a
+    # partial admission or a transient error) doesn't post them again.
+    with stage_timing.timed("progress_flush"):
+        batch_progress.write_progress(
+            batch_id=batch.batch_id,
+            destination_id=destination_id,
+            provider_key=batch.provider_key,
+            fp=fp,
+            delivered=delivered,
+            n=len(batch.items),
+            ttl=settings.DISPATCHED_BATCH_PROGRESS_CACHE_TTL,
+            failed=failed,
+        )
 
 
 def _legacy_delivered_indices(batch, destination_id):
@@ -449,16 +461,19 @@ async def dispatch_observations_batch_v2(batch, attributes: dict):
             # (see gundi_core/events/batches.py).
             return
 
-        destination_integration = await get_integration_details(integration_id=destination_id)
+        with stage_timing.timed("config_lookup"):
+            destination_integration = await get_integration_details(integration_id=destination_id)
         if not destination_integration:
             error_msg = f"No destination config details found for destination_id {destination_id}"
             logger.error(error_msg)
             raise ReferenceDataError(error_msg)
 
-        fp = batch_progress.fingerprint(batch.items)
-        raw = batch_progress.read_progress(batch.batch_id, destination_id, batch.provider_key)
-        delivered = batch_progress.decode(raw, fp, len(batch.items))
-        if delivered:
+        with stage_timing.timed("progress_read"):
+            fp = batch_progress.fingerprint(batch.items)
+            raw = batch_progress.read_progress(batch.batch_id, destination_id, batch.provider_key)
+            delivered = batch_progress.decode(raw, fp, len(batch.items))
+            failed = batch_progress.decode_failed(raw, fp, len(batch.items))
+        if delivered or failed:
             dedup_source = "batch_progress"
         elif raw:
             # A record was present but decode() couldn't use it - a
@@ -470,27 +485,42 @@ async def dispatch_observations_batch_v2(batch, attributes: dict):
             dedup_source = "unusable_record"
         else:
             dedup_source = "none"
-        if not delivered and settings.BATCH_DEDUP_LEGACY_FALLBACK_ENABLED:
+        if not (delivered or failed) and settings.BATCH_DEDUP_LEGACY_FALLBACK_ENABLED:
             legacy = _legacy_delivered_indices(batch, destination_id)
             if legacy:
                 delivered = legacy
                 dedup_source = "legacy"
         current_span.set_attribute("dedup_source", dedup_source)
 
-        # Skip items already delivered — makes envelope redelivery idempotent
+        # Skip items already delivered or rejected by ER — makes envelope
+        # redelivery idempotent
         pending = [
             (index, item) for index, item in enumerate(batch.items)
-            if index not in delivered
+            if index not in delivered and index not in failed
         ]
         current_span.set_attribute("pending_count", len(pending))
+        # Partial admission: the throttle gate only had room for part of the
+        # envelope. Deliver that many now, then nack so the rest comes back
+        # later; the progress record makes the redelivery skip this part.
+        deferred_count = 0
+        admitted_count = attributes.get(throttling.ADMITTED_COUNT_ATTRIBUTE)
+        if admitted_count is not None:
+            admitted_count = max(1, int(admitted_count))
+            if admitted_count < len(pending):
+                deferred_count = len(pending) - admitted_count
+                pending = pending[:admitted_count]
+                current_span.set_attribute("deferred_count", deferred_count)
         if not pending:
             # Everything is already cached as dispatched, but the original
             # attempt may have died after caching and before publishing
             # ObservationsBatchDelivered (e.g. function timeout). Publish for
-            # ALL items so trace stamping isn't lost forever on redelivery —
-            # the portal handler is idempotent against repeat events.
+            # ALL delivered items so trace stamping isn't lost forever on
+            # redelivery — the portal handler is idempotent against repeat
+            # events. Failed items were reported when they failed.
             logger.info(f"All items in batch {batch.batch_id} already delivered. Skipping.")
-            await _publish_batch_delivered(batch, [str(item.gundi_id) for item in batch.items])
+            await _publish_batch_delivered(
+                batch, [str(item.gundi_id) for index, item in enumerate(batch.items) if index not in failed]
+            )
             return
 
         # Items a PREVIOUS attempt delivered (from the progress record or the
@@ -517,10 +547,10 @@ async def dispatch_observations_batch_v2(batch, attributes: dict):
                 provider=batch.provider_key,
             )
             try:
-                await dispatcher.send([item.observation for _, item in chunk])
+                with stage_timing.timed("er_post"):
+                    await dispatcher.send([item.observation for _, item in chunk])
             except Exception as e:
                 status_code = getattr(e, "status_code", None)
-                error = f"{type(e).__name__}: {e}"
                 if status_code in PERMANENT_ER_STATUS_CODES:
                     # Permanent: shrink the batch — post items individually so
                     # the poison record(s) get identified and failed alone.
@@ -537,17 +567,28 @@ async def dispatch_observations_batch_v2(batch, attributes: dict):
                             provider=batch.provider_key,
                         )
                         try:
-                            await single_dispatcher.send(item.observation)
+                            with stage_timing.timed("er_post"):
+                                await single_dispatcher.send(item.observation)
                         except Exception as item_exc:
+                            if getattr(item_exc, "status_code", None) not in PERMANENT_ER_STATUS_CODES:
+                                # Only rejected items are failed for good (and
+                                # skipped on redelivery); anything else nacks
+                                # the envelope so the rest is retried.
+                                _flush_progress(batch, destination_id, fp, delivered, failed)
+                                raise await _defer_after_transient_error(
+                                    batch, destination_id, stream_type, attributes, item_exc,
+                                    already_delivered_gundi_ids + delivered_gundi_ids,
+                                )
                             logger.warning(
                                 f"Observation {item.gundi_id} in batch {batch.batch_id} failed individually: {item_exc}"
                             )
                             await _publish_item_delivery_failed(batch, item, item_exc)
+                            failed.add(index)
                         else:
                             delivered.add(index)
                             delivered_gundi_ids.append(str(item.gundi_id))
                             fallback_delivered_any = True
-                    _flush_progress(batch, destination_id, fp, delivered)
+                    _flush_progress(batch, destination_id, fp, delivered, failed)
                     if fallback_delivered_any:
                         # A successful fallback delivery proves the site is
                         # reachable, same as a successful bulk chunk — clear
@@ -557,35 +598,53 @@ async def dispatch_observations_batch_v2(batch, attributes: dict):
                             destination_id=destination_id, stream_type=stream_type
                         )
                 else:
-                    # Transient: record distress, report partial progress, and
-                    # nack the envelope. Redelivery skips delivered items via
-                    # the dispatched-observation cache.
-                    notify_scope = throttling.record_distress(
-                        destination_id=destination_id,
-                        stream_type=stream_type,
-                        status_code=status_code,
-                        error=error,
-                        retry_after=getattr(e, "retry_after", None),
-                    )
-                    if notify_scope:
-                        await publish_throttling_notice(attributes=attributes, scope=notify_scope)
-                    await _publish_batch_delivered(
-                        batch, already_delivered_gundi_ids + delivered_gundi_ids
-                    )
-                    raise DispatcherException(
-                        f"Transient error dispatching batch {batch.batch_id}: {error}"
+                    raise await _defer_after_transient_error(
+                        batch, destination_id, stream_type, attributes, e,
+                        already_delivered_gundi_ids + delivered_gundi_ids,
                     )
             else:
                 for index, item in chunk:
                     delivered.add(index)
                     delivered_gundi_ids.append(str(item.gundi_id))
-                _flush_progress(batch, destination_id, fp, delivered)
+                _flush_progress(batch, destination_id, fp, delivered, failed)
                 throttling.record_success(destination_id=destination_id, stream_type=stream_type)
 
         current_span.set_attribute("delivered_count", len(delivered_gundi_ids))
         await _publish_batch_delivered(
             batch, already_delivered_gundi_ids + delivered_gundi_ids
         )
+        if deferred_count:
+            logger.info(
+                f"Batch {batch.batch_id} partially admitted: delivered {len(delivered_gundi_ids)} items, "
+                f"deferring {deferred_count} for redelivery."
+            )
+            raise throttling.ThrottledMessage(
+                destination_id=destination_id,
+                family=throttling.OBSERVATIONS_FAMILY,
+                reason="partial",
+                # The rest is admitted once the rate window has room again
+                retry_after=throttling.seconds_left_in_window(),
+            )
+
+
+async def _defer_after_transient_error(batch, destination_id, stream_type, attributes, error, delivered_gundi_ids):
+    # Transient: record distress, report partial progress, and return the
+    # exception nacking the envelope. Redelivery skips delivered items via the
+    # progress record.
+    error_description = f"{type(error).__name__}: {error}"
+    notify_scope = throttling.record_distress(
+        destination_id=destination_id,
+        stream_type=stream_type,
+        status_code=getattr(error, "status_code", None),
+        error=error_description,
+        retry_after=getattr(error, "retry_after", None),
+    )
+    if notify_scope:
+        await publish_throttling_notice(attributes=attributes, scope=notify_scope)
+    await _publish_batch_delivered(batch, delivered_gundi_ids)
+    return DispatcherException(
+        f"Transient error dispatching batch {batch.batch_id}: {error_description}"
+    )
 
 
 async def handle_er_observations_batch(event: ObservationsBatchTransformedER, attributes: dict):
@@ -0,0 +1,116 @@
+import contextlib
+import contextvars
+import threading
+import tracemalloc
+
+from core import settings
+
+# Peak memory of each stage of a batch envelope (decode, parse, serialize,
+# post): the most memory traced while in the stage, allocated since it
+# started. Only with MEMORY_TRACKING_ENABLED. tracemalloc is started when a
+# stage starts and stopped when it ends, so nothing is traced in between.
+#
+# tracemalloc is process-wide: a stage is only recorded while its message is
+# the only one the process is handling, from the stage's start to its end.
+# Stages overlapping another message, nested in another stage, or starting
+# while something else is tracing are not recorded.
+
+_NOT_TRACKED = contextlib.nullcontext()
+
+_lock = threading.Lock()
+# Messages being handled by the process, and that arrived so far
+_in_flight = 0
+_arrivals = 0
+# Whether a stage is being traced
+_tracing = False
+
+# Peaks of the batch envelope being handled, by stage. Each request runs in
+# its own asyncio task, which has its own copy of the context.
+_message_peaks = contextvars.ContextVar("message_memory_peaks", default=None)
+
+
+class _Message:
+    __slots__ = ("is_batch", "_token")
+
+    def __init__(self, is_batch):
+        self.is_batch = is_batch
+
+    def __enter__(self):
+        global _in_flight, _arrivals
+        with _lock:
+            _in_flight += 1
+            _arrivals += 1
+        self._token = _message_peaks.set({} if self.is_batch else None)
+        return self
+
+    def __exit__(self, *exc):
+        global _in_flight
+        _message_peaks.reset(self._token)
+        with _lock:
+            _in_flight -= 1
+
+
+class _Stage:
+    __slots__ = ("name", "_traced", "_arrivals")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        global _tracing
+        with _lock:
+            self._traced = _in_flight == 1 and not _tracing and not tracemalloc.is_tracing()
+            if self._traced:
+                _tracing = True
+                self._arrivals = _arrivals
+                tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc):
+        global _tracing
+        if not self._traced:
+            return
+        with _lock:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            _tracing = False
+            alone = _in_flight == 1 and _arrivals == self._arrivals
+        peaks = _message_peaks.get()
+        if alone and peaks is not None:
+            peaks[self.name] = max(peaks.get(self.name, 0), peak)
+
+
+def message(is_batch):
+    """
+    A context manager around the handling of a message, if enabled. The
+    stages of batch envelopes are tracked; other messages are only counted,
+    so that stages overlapping them are left out.
+    """
+    if not settings.MEMORY_TRACKING_ENABLED:
+        return _NOT_TRACKED
+    return _Message(is_batch)
+
+
+def tracked(stage):
+    """A context manager tracking the peak memory of stage of a batch envelope, if enabled."""
+    if not settings.MEMORY_TRACKING_ENABLED or _message_peaks.get() is None:
+        return _NOT_TRACKED
+    return _Stage(stage)
+
+
+def per_message(span):
+    """Attach the peaks of the message's stages to span, once it's handled."""
+    if not settings.MEMORY_TRACKING_ENABLED:
+        return _NOT_TRACKED
+    return _attached_to(span)
+
+
+@contextlib.contextmanager
+def _attached_to(span):
+    try:
+        yield
+    finally:
+        peaks = _message_peaks.get()
+        if peaks and span.is_recording():
+            for stage, peak in peaks.items():
+                span.set_attribute(f"memory.peak_bytes.{stage}", peak)
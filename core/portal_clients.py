@@ -0,0 +1,81 @@
+import asyncio
+import contextlib
+import logging
+import weakref
+from datetime import datetime, timezone
+
+from core import settings
+
+logger = logging.getLogger(__name__)
+
+# Portal clients (PortalApi, GundiClient) are kept open and reused by every
+# lookup on the same event loop: httpx connections belong to the loop that
+# opened them. event loop -> {client class: client}
+_loop_clients = weakref.WeakKeyDictionary()
+# Service-account tokens, shared by the clients of every loop:
+# (token url, client id, audience) -> (OAuthToken, expires_at)
+_service_tokens = {}
+
+
+def _token_key(client):
+    return client.oauth_token_url, client.client_id, client.audience
+
+
+def _adopt_service_token(client):
+    shared = _service_tokens.get(_token_key(client))
+    if shared and shared[1] > datetime.now(tz=timezone.utc):
+        client.cached_token, client.cached_token_expires_at = shared
+
+
+def _share_service_token(client):
+    expires_at = client.cached_token_expires_at
+    if not isinstance(expires_at, datetime) or not client.cached_token:
+        return
+    shared = _service_tokens.get(_token_key(client))
+    if not shared or shared[1] < expires_at:
+        _service_tokens[_token_key(client)] = (client.cached_token, expires_at)
+
+
+@contextlib.asynccontextmanager
+async def portal_client(client_class):
+    """
+    The current event loop's client_class instance, created on first use and
+    left open for the next lookup, authenticated with the shared token.
+    """
+    clients = _loop_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(client_class)
+    if client is None:
+        connect_timeout, read_timeout = settings.DEFAULT_REQUESTS_TIMEOUT
+        client = clients[client_class] = client_class(
+            connect_timeout=connect_timeout, data_timeout=read_timeout
+        )
+    _adopt_service_token(client)
+    try:
+        yield client
+    finally:
+        _share_service_token(client)
+
+
+async def close_clients():
+    """Close the current event loop's portal clients. Never raises."""
+    clients = _loop_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"Error closing portal client: {e}")
+
+
+async def closing_clients(coroutine):
+    # For short-lived loops (asyncio.run in background threads, warm-up):
+    # closes the clients the coroutine opened before the loop goes away
+    try:
+        return await coroutine
+    finally:
+        await close_clients()
+
+
+def forget_clients():
+    # Drops every loop's clients (without closing them) and the shared tokens
+    _loop_clients.clear()
+    _service_tokens.clear()
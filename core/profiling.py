@@ -0,0 +1,160 @@
+import collections
+import contextlib
+import hmac
+import io
+import logging
+import os
+import sys
+import threading
+import time
+
+from core import settings
+
+logger = logging.getLogger(__name__)
+
+# Header asking for a request to be profiled, set to PROFILING_SECRET
+PROFILE_HEADER = "X-Profile-Secret"
+# Stacks are logged (not written) at most this many, the most sampled first
+LOGGED_STACKS_MAX = 200
+
+_NOT_PROFILED = contextlib.nullcontext()
+_budget_lock = threading.Lock()
+# Requests profiled so far by this instance
+_profiled = 0
+
+
+def profiled(request):
+    """
+    Profile what runs in the returned context manager if request is to be
+    profiled (see PROFILING_* in core.settings), within the instance's
+    budget. Otherwise, and always with profiling off, it does nothing.
+    """
+    if not (settings.PROFILING_ENABLED or settings.PROFILING_SECRET):
+        return _NOT_PROFILED
+    if not _requested(request):
+        return _NOT_PROFILED
+    sequence = _take_budget()
+    if sequence is None:
+        return _NOT_PROFILED
+    return _profile(f"{int(time.time())}-{os.getpid()}-{sequence}")
+
+
+def _requested(request):
+    if settings.PROFILING_ENABLED:
+        return True
+    secret = request.headers.get(PROFILE_HEADER) or ""
+    return hmac.compare_digest(secret.encode(), settings.PROFILING_SECRET.encode())
+
+
+def _take_budget():
+    global _profiled
+    with _budget_lock:
+        if _profiled >= settings.PROFILING_MAX_REQUESTS:
+            return None
+        _profiled += 1
+        return _profiled
+
+
+class _StackSampler:
+    """Samples the stack of a thread, from a background thread."""
+
+    def __init__(self, thread_id, interval_seconds):
+        self.stacks = collections.Counter()
+        self._thread_id = thread_id
+        self._interval_seconds = interval_seconds
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        # A failure to sample ends the profile early, never the request
+        try:
+            while not self._stopped.wait(self._interval_seconds):
+                frame = sys._current_frames().get(self._thread_id)
+                if frame is not None:
+                    self.stacks[_stack_of(frame)] += 1
+        except Exception as e:
+            logger.warning(f"Error sampling stacks, profile stopped after {sum(self.stacks.values())} samples: {e}")
+
+    def collapsed(self, limit=None):
+        # One "outermost;...;innermost count" line per stack
+        return "\n".join(
+            f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common(limit)
+        )
+
+
+def _stack_of(frame):
+    # Module and function name: co_qualname (with the class) is Python 3.11+
+    stack = []
+    while frame is not None:
+        stack.append(f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}")
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+@contextlib.contextmanager
+def _profile(label):
+    started = time.perf_counter()
+    if settings.PROFILING_FORMAT == "pstats":
+        # Imported here, like pstats below: only needed when profiling
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            _save_pstats(profiler, label, time.perf_counter() - started)
+    else:
+        sampler = _StackSampler(threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL_MILLIS / 1000)
+        try:
+            with sampler:
+                yield
+        finally:
+            _save_collapsed(sampler, label, time.perf_counter() - started)
+
+
+def _output_path(label, extension):
+    os.makedirs(settings.PROFILING_OUTPUT_DIR, exist_ok=True)
+    return os.path.join(settings.PROFILING_OUTPUT_DIR, f"profile-{label}.{extension}")
+
+
+def _save_collapsed(sampler, label, seconds):
+    # A failure to save a profile never fails the request
+    try:
+        if settings.PROFILING_OUTPUT_DIR:
+            path = _output_path(label, "collapsed")
+            with open(path, "w") as output:
+                output.write(sampler.collapsed() + "\n")
+            logger.info(f"Profile {label} ({seconds:.3f}s) written to {path}")
+        else:
+            logger.info(
+                f"Profile {label} ({seconds:.3f}s, {sum(sampler.stacks.values())} samples):\n"
+                f"{sampler.collapsed(LOGGED_STACKS_MAX)}"
+            )
+    except Exception as e:
+        logger.warning(f"Error saving profile {label}: {e}")
+
+
+def _save_pstats(profiler, label, seconds):
+    try:
+        if settings.PROFILING_OUTPUT_DIR:
+            path = _output_path(label, "pstats")
+            profiler.dump_stats(path)
+            logger.info(f"Profile {label} ({seconds:.3f}s) written to {path}")
+        else:
+            import pstats
+
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(40)
+            logger.info(f"Profile {label} ({seconds:.3f}s):\n{text.getvalue()}")
+    except Exception as e:
+        logger.warning(f"Error saving profile {label}: {e}")
@@ -0,0 +1,100 @@
+import collections
+import contextlib
+import contextvars
+import functools
+import time
+
+from core import stage_timing, tracing
+
+# Commands sent to Redis and the time they took, labelled by command and by
+# operation: the stage timed when they were sent (config_lookup,
+# token_resolution, throttle_gate, progress_read...), or "unstaged". No-ops
+# unless METRICS_ENABLED configures a meter provider.
+_commands = tracing.meter.create_counter(
+    "dispatcher.redis_commands", unit="1", description="Redis commands sent",
+)
+_command_duration = tracing.meter.create_histogram(
+    "dispatcher.redis_command_duration", unit="s", description="Round trip time of Redis commands",
+)
+_commands_per_message = tracing.meter.create_histogram(
+    "dispatcher.redis_commands_per_message", unit="1", description="Redis commands sent per message handled",
+)
+
+# Client methods returning helpers rather than sending a command
+_NOT_COMMANDS = frozenset({"pubsub", "pipeline", "lock", "register_script", "client", "connection_pool"})
+
+# Totals of the message being handled (see per_message)
+_message_tally = contextvars.ContextVar("redis_message_tally", default=None)
+
+
+class _Tally:
+    __slots__ = ("commands", "seconds")
+
+    def __init__(self):
+        self.commands = collections.Counter()
+        self.seconds = collections.Counter()
+
+
+class CountingRedis:
+    """
+    Wraps a Redis client, accounting for each command sent through it.
+    Commands are counted once sent, whether they succeed or raise.
+    """
+
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        attribute = getattr(self._db, name)
+        if name in _NOT_COMMANDS or name.startswith("_") or not callable(attribute):
+            return attribute
+        command = _counted(name, attribute)
+        # Found on the instance from now on, without going through here
+        setattr(self, name, command)
+        return command
+
+
+def _counted(name, method):
+    @functools.wraps(method)
+    def command(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _account(name, time.perf_counter() - start)
+
+    return command
+
+
+def _account(command, seconds):
+    operation = stage_timing.current_stage() or "unstaged"
+    labels = {"operation": operation, "command": command}
+    _commands.add(1, labels)
+    _command_duration.record(seconds, labels)
+    tally = _message_tally.get()
+    if tally is not None:
+        tally.commands[operation] += 1
+        tally.seconds[operation] += seconds
+
+
+@contextlib.contextmanager
+def per_message(span):
+    """
+    Total the Redis commands sent while handling a message, and attach them
+    to span: redis.commands and redis.time_ms, overall and per operation.
+    Commands sent from tasks started meanwhile are included.
+    """
+    tally = _Tally()
+    token = _message_tally.set(tally)
+    try:
+        yield tally
+    finally:
+        _message_tally.reset(token)
+        total = sum(tally.commands.values())
+        _commands_per_message.record(total, {"stream_type": stage_timing.delivery_labels()["stream_type"]})
+        if span.is_recording():
+            span.set_attribute("redis.commands", total)
+            span.set_attribute("redis.time_ms", sum(tally.seconds.values()) * 1000)
+            for operation, count in tally.commands.items():
+                span.set_attribute(f"redis.commands.{operation}", count)
+                span.set_attribute(f"redis.time_ms.{operation}", tally.seconds[operation] * 1000)
@@ -1,6 +1,7 @@
 import asyncio
 import json
 import logging
+import time
 import aiohttp
 from datetime import datetime, timezone, timedelta
 from gcloud.aio import pubsub
@@ -9,7 +10,13 @@ from gundi_core import events as system_events
 from gundi_core.events import UpdateErrorDetails, DeliveryErrorDetails
 from gundi_core.schemas import v2 as gundi_schemas_v2
 from opentelemetry.trace import SpanKind
+from core import batch_progress
+from core import config_invalidation
+from core import diagnostics
 from core import dispatchers
+from core import memory_tracking
+from core import redis_accounting
+from core import stage_timing
 from core import throttling
 from core.utils import (
     extract_fields_from_message,
@@ -106,7 +113,8 @@ async def send_observation_to_dead_letter_topic(transformed_observation, attribu
             "send_message_to_dead_letter_topic", kind=SpanKind.CLIENT
     ) as current_span:
 
-        print(f"Forwarding observation to dead letter topic: {transformed_observation}")
+        logger.info("Forwarding observation to dead letter topic.")
+        diagnostics.dump("Dead-lettered observation", observation=transformed_observation, attributes=attributes)
         # Publish to another PubSub topic
         connect_timeout, read_timeout = settings.DEFAULT_REQUESTS_TIMEOUT
         timeout_settings = aiohttp.ClientTimeout(
@@ -228,7 +236,7 @@ async def process_transformed_observation(transformed_observation, attributes):
         current_span.add_event(
             name="routing_service.transformed_observation_received_at_dispatcher"
         )
-        current_span.set_attribute("transformed_message", str(transformed_observation))
+        tracing.payload_capture.set_payload_attribute(current_span, "transformed_message", transformed_observation)
         current_span.set_attribute("environment", settings.TRACE_ENVIRONMENT)
         current_span.set_attribute("service", "er-dispatcher")
         try:
@@ -237,7 +245,7 @@ async def process_transformed_observation(transformed_observation, attributes):
             integration_id = attributes.get("integration_id")
             outbound_config_id = attributes.get("outbound_config_id")
             retry_attempt: int = attributes.get("retry_attempt") or 0
-            logger.debug(f"transformed_observation: {transformed_observation}")
+            diagnostics.dump("Transformed observation received", observation=transformed_observation)
             logger.info(
                 "received transformed observation",
                 extra={
@@ -330,10 +338,10 @@ async def process_transformer_event_v2(raw_event, attributes):
         current_span.add_event(
             name="er_dispatcher.transformed_observation_received_at_dispatcher"
         )
-        current_span.set_attribute("transformed_message", str(raw_event))
+        tracing.payload_capture.set_payload_attribute(current_span, "transformed_message", raw_event)
         current_span.set_attribute("environment", settings.TRACE_ENVIRONMENT)
         current_span.set_attribute("service", "er-dispatcher")
-        logger.debug(f"Message received: \npayload: {raw_event} \nattributes: {attributes}")
+        diagnostics.dump("Message received", payload=raw_event, attributes=attributes)
         if schema_version := raw_event.get("schema_version") != "v1":
             error_message = f"Schema version '{schema_version}' not supported. Message discarded."
             logger.error(error_message)
@@ -356,7 +364,8 @@ async def process_transformer_event_v2(raw_event, attributes):
             current_span.set_attribute("error", error_message)
             await send_observation_to_dead_letter_topic(raw_event, attributes)
             return {}
-        parsed_event = schema.parse_obj(raw_event)
+        with stage_timing.timed("parse"), memory_tracking.tracked("parse"):
+            parsed_event = schema.parse_obj(raw_event)
         return await handler(event=parsed_event, attributes=attributes)
 
 
@@ -377,20 +386,42 @@ def is_too_old(timestamp):
 async def process_request(request):
     # Extract the observation and attributes from the CloudEvent
     json_data = request.get_json()
-    headers = request.headers
     pubsub_message = json_data["message"]
-    transformed_observation, attributes = extract_fields_from_message(pubsub_message)
+    # Only batch envelopes have their memory tracked: their stages are the
+    # ones that grow with the message
+    is_batch = (pubsub_message.get("attributes") or {}).get("batch") == "true"
+    with memory_tracking.message(is_batch):
+        await _process_message(pubsub_message, request.headers)
+
+
+async def _process_message(pubsub_message, headers):
+    decode_started = time.perf_counter()
+    with memory_tracking.tracked("decode"):
+        transformed_observation, attributes = extract_fields_from_message(pubsub_message)
+    labels = attributes or {}
+    stage_timing.set_delivery_labels(
+        stream_type=labels.get("stream_type"), destination_id=labels.get("destination_id")
+    )
+    stage_timing.record("decode", time.perf_counter() - decode_started)
     # Load tracing context
     tracing.pubsub_instrumentation.load_context_from_attributes(attributes)
     with tracing.tracer.start_as_current_span(
             "er_dispatcher.process_event", kind=SpanKind.CLIENT
-    ) as current_span:
+    ) as current_span, redis_accounting.per_message(current_span), memory_tracking.per_message(current_span):
         pubsub_message_id = pubsub_message.get("message_id")
         gundi_event_id = transformed_observation.get("event_id")
         current_span.set_attribute("pubsub_message_id", str(pubsub_message_id))
         current_span.set_attribute("gundi_event_id", str(gundi_event_id))
-        logger.debug(
-            f"Received PubsubMessage(PubSub ID:{pubsub_message_id}, Gundi Event ID: {gundi_event_id}): {pubsub_message}")
+        diagnostics.dump(
+            "PubSub message received",
+            pubsub_message_id=pubsub_message_id, gundi_event_id=gundi_event_id, message=pubsub_message,
+        )
+        if config_invalidation.is_config_event(transformed_observation):
+            # A portal config change, not a delivery: drop the cached config.
+            # Handled whatever its age, since invalidating late is harmless.
+            current_span.set_attribute("config_event", transformed_observation["event_type"])
+            config_invalidation.handle_config_event(transformed_observation)
+            return
         # ToDo Check duplicates using message_id / gundi_event_id
         # Handle retries
         # Check headers for backward compatibility with cloud events format
@@ -410,18 +441,78 @@ async def process_request(request):
             return  # Skip the event
         # Process the event according to the gundi version
         if attributes.get("gundi_version", "v1") == "v2":
-            # Admission gate: defer over-cap / cooling-down destinations.
-            # Runs after the too-old check above so exhausted messages always
-            # dead-letter instead of being nacked past PubSub retention.
             try:
-                admission_amount = int(attributes.get("batch_count") or 1)
-            except (TypeError, ValueError):
-                admission_amount = 1
-            await throttling.check_admission(
-                destination_id=attributes.get("destination_id"),
-                stream_type=attributes.get("stream_type"),
-                amount=admission_amount,
-            )
-            await process_transformer_event_v2(transformed_observation, attributes)
+                await admit_and_process_v2(transformed_observation, attributes, pubsub_message)
+            except throttling.ThrottledMessage as e:
+                # Kept whatever the trace's sampling decision (see core.tracing.sampling)
+                tracing.sampling.record_always_sampled(
+                    tracing.tracer, "er_dispatcher.throttle_deferred",
+                    destination_id=str(e.destination_id), family=e.family, reason=e.reason,
+                )
+                raise
+            except Exception as e:
+                tracing.sampling.record_always_sampled(
+                    tracing.tracer, "er_dispatcher.error_processing_event", error=e,
+                    destination_id=str(attributes.get("destination_id")),
+                    stream_type=str(attributes.get("stream_type")),
+                )
+                raise
         else:  # Default to v1
             await process_transformed_observation(transformed_observation, attributes)
+
+
+def _pending_batch_items(transformed_observation):
+    # From the decoded envelope, before it's parsed; None if it has no items
+    # (or items parsing will reject)
+    payload = transformed_observation.get("payload") or {}
+    items = payload.get("items") or []
+    if not items or not all(isinstance(item, dict) for item in items):
+        return None
+    return batch_progress.pending_count(
+        batch_id=payload.get("batch_id"),
+        destination_id=payload.get("destination_id"),
+        provider_key=payload.get("provider_key"),
+        gundi_ids=[item.get("gundi_id") for item in items],
+    )
+
+
+async def admit_and_process_v2(transformed_observation, attributes, pubsub_message):
+    # Admission gate: defer over-cap / cooling-down destinations.
+    # process_request runs it after the too-old check, so exhausted messages
+    # always dead-letter instead of being nacked past PubSub retention.
+    try:
+        admission_amount = int(attributes.get("batch_count") or 1)
+    except (TypeError, ValueError):
+        admission_amount = 1
+    # Encoded payload size: already in hand, no re-serialization
+    size = len(pubsub_message.get("data") or "")
+    is_batch = attributes.get("batch") == "true"
+    if is_batch and settings.THROTTLING_ENABLED:
+        # Charge the gate for the items still to deliver, not the whole
+        # envelope: a redelivery skips those delivered (or rejected by ER)
+        # by earlier attempts. Items are assumed to be of similar size.
+        pending = _pending_batch_items(transformed_observation)
+        if pending == 0:
+            # Nothing to post: the dispatcher only reports the delivery
+            await process_transformer_event_v2(transformed_observation, attributes)
+            return
+        if pending is not None and pending < admission_amount:
+            size = size * pending // admission_amount
+            admission_amount = pending
+    with stage_timing.timed("throttle_gate"):
+        admitted = await throttling.check_admission(
+            destination_id=attributes.get("destination_id"),
+            stream_type=attributes.get("stream_type"),
+            amount=admission_amount,
+            size=size,
+            partial=is_batch,
+        )
+    if is_batch and admitted < admission_amount:
+        # Partial admission: the batch dispatcher delivers this many items and
+        # nacks the envelope for the rest. A copy, so the original attributes
+        # are what a dead-letter would carry.
+        attributes = {
+            **attributes,
+            throttling.ADMITTED_COUNT_ATTRIBUTE: str(admitted),
+        }
+    await process_transformer_event_v2(transformed_observation, attributes)
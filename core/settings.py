@@ -8,6 +8,10 @@ env = Env()
 env.read_env()
 
 LOGGING_LEVEL = env.str("LOGGING_LEVEL", "INFO")
+# Payload dumps (see core.diagnostics): DEBUG turns them on. Each dumped field
+# is cut at DIAGNOSTICS_MAX_FIELD_BYTES.
+DIAGNOSTICS_LOGGING_LEVEL = env.str("DIAGNOSTICS_LOGGING_LEVEL", "INFO")
+DIAGNOSTICS_MAX_FIELD_BYTES = env.int("DIAGNOSTICS_MAX_FIELD_BYTES", 2048)
 
 DEFAULT_LOGGING = {
     "version": 1,
@@ -18,12 +22,22 @@ DEFAULT_LOGGING = {
             "class": "logging.StreamHandler",
             "stream": sys.stdout,
         },
+        "diagnostics": {
+            "level": "DEBUG",
+            "class": "logging.StreamHandler",
+            "stream": sys.stdout,
+        },
     },
     "loggers": {
         "": {
             "handlers": ["console"],
             "level": LOGGING_LEVEL,
         },
+        "diagnostics": {
+            "handlers": ["diagnostics"],
+            "level": DIAGNOSTICS_LOGGING_LEVEL,
+            "propagate": False,
+        },
     },
 }
 logging.config.dictConfig(DEFAULT_LOGGING)
@@ -48,9 +62,41 @@ REDIS_DB = env.int("REDIS_DB", 3)
 # contents alone. When empty, the key is derived from the integration
 # credentials only.
 ER_TOKEN_CACHE_SECRET = env.str("ER_TOKEN_CACHE_SECRET", "")
+# Cached ER auth tokens expiring within this many seconds are refreshed by a
+# background password grant (one instance at a time) while still being used.
+# 0 disables proactive refresh: tokens are then replaced on the request path.
+ER_TOKEN_REFRESH_AHEAD_SECONDS = env.int("ER_TOKEN_REFRESH_AHEAD_SECONDS", 3600)
+# How long an instance keeps its own copy of a cached ER token before reading
+# the shared entry again (bounds how long a token invalidated elsewhere is used).
+ER_TOKEN_MEMORY_TTL_SECONDS = env.int("ER_TOKEN_MEMORY_TTL_SECONDS", 300)
 
-# N-seconds to cache portal responses for configuration objects.
+# N-seconds to cache portal responses for configuration objects. With the
+# portal's config events routed to this function (see core.config_invalidation)
+# entries are dropped on change, so this can be raised to hours.
 PORTAL_CONFIG_OBJECT_CACHE_TTL = env.int("PORTAL_CONFIG_OBJECT_CACHE_TTL", 60)
+# In-process copy of integration details in front of the Redis cache. Kept
+# shorter than the Redis TTL; 0 disables it (every lookup reads Redis).
+INTEGRATION_DETAILS_MEMORY_TTL_SECONDS = env.int("INTEGRATION_DETAILS_MEMORY_TTL_SECONDS", 30)
+# Integration details older than PORTAL_CONFIG_OBJECT_CACHE_TTL are kept this
+# much longer and served while one instance refreshes them in the background;
+# only past both does a lookup wait for the portal. 0 disables stale serving.
+INTEGRATION_DETAILS_STALE_TTL_SECONDS = env.int("INTEGRATION_DETAILS_STALE_TTL_SECONDS", 3600)
+# A failed refresh keeps the stale copy for another stale period, until it's
+# this old (since it was fetched from the portal).
+INTEGRATION_DETAILS_MAX_STALE_SECONDS = env.int("INTEGRATION_DETAILS_MAX_STALE_SECONDS", 86400)
+# Portal requests in flight at once when resolving many integrations together
+# (see utils.get_many_integration_details).
+INTEGRATION_DETAILS_FETCH_CONCURRENCY = env.int("INTEGRATION_DETAILS_FETCH_CONCURRENCY", 5)
+# Deleted integrations (404 from the portal) are remembered this long, so
+# their messages fail without a portal call. Misconfigured ones aren't: their
+# messages must still reach the dispatcher, which reports the failure. Dropped earlier by
+# the portal's config events. 0 disables it.
+INTEGRATION_UNAVAILABLE_CACHE_TTL_SECONDS = env.int("INTEGRATION_UNAVAILABLE_CACHE_TTL_SECONDS", 300)
+# Redis pub/sub channel telling every instance to drop its in-process copy of
+# an integration's details after a portal config change. The listener holds
+# one extra Redis connection per instance.
+CONFIG_INVALIDATION_CHANNEL = env.str("CONFIG_INVALIDATION_CHANNEL", "er_dispatcher.config_invalidation")
+CONFIG_INVALIDATION_LISTENER_ENABLED = env.bool("CONFIG_INVALIDATION_LISTENER_ENABLED", False)
 DISPATCHED_OBSERVATIONS_CACHE_TTL = env.int("DISPATCHED_OBSERVATIONS_CACHE_TTL", 60 * 60)  # 1 Hour
 # Idempotency cache for batch-delivered observations. Must exceed the PubSub
 # retry window (24h) so envelope redeliveries keep skipping delivered items.
@@ -70,6 +116,47 @@ BATCH_DEDUP_LEGACY_FALLBACK_ENABLED = env.bool("BATCH_DEDUP_LEGACY_FALLBACK_ENAB
 # Used in OTel traces/spans to set the 'environment' attribute, used on metrics calculation
 TRACE_ENVIRONMENT = env.str("TRACE_ENVIRONMENT", "dev")
 TRACING_ENABLED = env.bool("TRACING_ENABLED", True)
+# Share of new traces sampled (traces started upstream follow the publisher's
+# decision). Dead-letters, errors and throttling decisions are always sampled.
+# Values outside [0, 1] are clamped.
+TRACE_SAMPLE_RATIO = env.float("TRACE_SAMPLE_RATIO", 1.0)
+# Span export (BatchSpanProcessor): spans are queued and exported in batches
+# from a background thread; once the queue is full, new spans are dropped.
+TRACE_EXPORT_MAX_QUEUE_SIZE = env.int("TRACE_EXPORT_MAX_QUEUE_SIZE", 2048)
+TRACE_EXPORT_MAX_BATCH_SIZE = env.int("TRACE_EXPORT_MAX_BATCH_SIZE", 512)
+TRACE_EXPORT_SCHEDULE_DELAY_MILLIS = env.int("TRACE_EXPORT_SCHEDULE_DELAY_MILLIS", 5000)
+TRACE_EXPORT_TIMEOUT_MILLIS = env.int("TRACE_EXPORT_TIMEOUT_MILLIS", 30000)
+# OTel metrics (throttle gate throughput/deferrals), exported over OTLP/HTTP.
+# The exporter reads OTEL_EXPORTER_OTLP_* env vars for endpoint and headers.
+METRICS_ENABLED = env.bool("METRICS_ENABLED", False)
+METRICS_EXPORT_INTERVAL_MILLIS = env.int("METRICS_EXPORT_INTERVAL_MILLIS", 60000)
+# Payloads attached to spans (transformed_message, payload, changes):
+# "off", "truncated" (on every recorded span) or "sampled" (on a
+# TRACE_PAYLOAD_SAMPLE_RATE share of them); when attached, cut at
+# TRACE_PAYLOAD_MAX_BYTES. Never built for spans that aren't recorded.
+TRACE_PAYLOAD_CAPTURE = env.str("TRACE_PAYLOAD_CAPTURE", "truncated")
+TRACE_PAYLOAD_MAX_BYTES = env.int("TRACE_PAYLOAD_MAX_BYTES", 2048)
+TRACE_PAYLOAD_SAMPLE_RATE = env.float("TRACE_PAYLOAD_SAMPLE_RATE", 0.01)
+# On-demand profiling of requests (see core.profiling). With PROFILING_ENABLED
+# the first PROFILING_MAX_REQUESTS requests of an instance are profiled; with
+# PROFILING_SECRET set, so are requests carrying it in the X-Profile-Secret
+# header, within the same per-instance budget. Profiles are written to
+# PROFILING_OUTPUT_DIR, or logged when it's empty. PROFILING_FORMAT is
+# "collapsed" (stacks sampled every PROFILING_SAMPLE_INTERVAL_MILLIS, for
+# flamegraph.pl or speedscope) or "pstats" (cProfile, much slower).
+PROFILING_ENABLED = env.bool("PROFILING_ENABLED", False)
+PROFILING_SECRET = env.str("PROFILING_SECRET", "")
+PROFILING_MAX_REQUESTS = env.int("PROFILING_MAX_REQUESTS", 10)
+PROFILING_FORMAT = env.str("PROFILING_FORMAT", "collapsed")
+PROFILING_SAMPLE_INTERVAL_MILLIS = env.int("PROFILING_SAMPLE_INTERVAL_MILLIS", 5)
+PROFILING_OUTPUT_DIR = env.str("PROFILING_OUTPUT_DIR", "")
+# Peak memory of the decode, parse, serialize and post stages of each batch
+# envelope, traced with tracemalloc and attached to its
+# er_dispatcher.process_event span (memory.peak_bytes.<stage>, see
+# core.memory_tracking). Slows allocations down while a stage is traced, and
+# stages overlapping another message are left out: turn it on for a while,
+# ideally on instances handling one message at a time.
+MEMORY_TRACKING_ENABLED = env.bool("MEMORY_TRACKING_ENABLED", False)
 
 # Retries and dead-letter settings
 # ToDo: Get retry settings from the outbound config?
@@ -97,6 +184,36 @@ THROTTLE_COOLDOWN_BASE_SECONDS = env.int("THROTTLE_COOLDOWN_BASE_SECONDS", 30)
 THROTTLE_COOLDOWN_MAX_SECONDS = env.int("THROTTLE_COOLDOWN_MAX_SECONDS", 600)
 THROTTLE_COOLDOWN_LEVEL_TTL_SECONDS = env.int("THROTTLE_COOLDOWN_LEVEL_TTL_SECONDS", 900)
 THROTTLE_NOTIFY_TTL_SECONDS = env.int("THROTTLE_NOTIFY_TTL_SECONDS", 300)
+# Optional byte budget per destination and family, tracked next to the item
+# counter and measured on the encoded PubSub payload. ER load follows payload
+# size, so this keeps a few huge envelopes from overloading a site while small
+# position fixes still run at the item cap. 0 disables the byte budget.
+DEFAULT_MAX_DELIVERY_BYTES_PER_MINUTE = env.int("DEFAULT_MAX_DELIVERY_BYTES_PER_MINUTE", 0)
+# Priority lanes: an optional destination-wide budget shared by all families
+# (0 disables). Events and messages always debit it but are only gated by
+# their own family caps; observations are admitted from what is left after
+# holding back the unused reserved share of every priority family that saw
+# traffic in the current or previous window. Idle priority families reserve
+# nothing, so a backfill borrows their capacity.
+THROTTLE_DESTINATION_MAX_DELIVERIES_PER_MINUTE = env.int("THROTTLE_DESTINATION_MAX_DELIVERIES_PER_MINUTE", 0)
+THROTTLE_EVENTS_RESERVED_SHARE = env.float("THROTTLE_EVENTS_RESERVED_SHARE", 0.3)
+THROTTLE_MESSAGES_RESERVED_SHARE = env.float("THROTTLE_MESSAGES_RESERVED_SHARE", 0.1)
+# Admit batch envelopes for just the window's remaining headroom instead of
+# all-or-nothing: the admitted items are delivered (and recorded in the batch
+# progress record) and the envelope is nacked so the rest is redelivered.
+THROTTLE_PARTIAL_ADMISSION_ENABLED = env.bool("THROTTLE_PARTIAL_ADMISSION_ENABLED", True)
+
+# Optional warm-up at instance start: resolve integration details and ER
+# tokens for the configured destinations plus the most recently used ones
+# (tracked in Redis), so the first messages after a scale-out skip the cold
+# lookups. Connections aren't pre-opened: each request thread opens its own on
+# its first message. Bounded by WARMUP_TIMEOUT_SECONDS.
+WARMUP_ENABLED = env.bool("WARMUP_ENABLED", False)
+WARMUP_DESTINATION_IDS = env.list("WARMUP_DESTINATION_IDS", [])
+WARMUP_MAX_DESTINATIONS = env.int("WARMUP_MAX_DESTINATIONS", 20)
+WARMUP_RECENT_WINDOW_SECONDS = env.int("WARMUP_RECENT_WINDOW_SECONDS", 3600)
+WARMUP_CONCURRENCY = env.int("WARMUP_CONCURRENCY", 5)
+WARMUP_TIMEOUT_SECONDS = env.float("WARMUP_TIMEOUT_SECONDS", 10)
 
 # Batch delivery (see cdip repo: docs/superpowers/specs/2026-07-29-pipeline-batch-envelope-design.md)
 # Max observations per single ER bulk request. Independent from the envelope
@@ -0,0 +1,56 @@
+import contextlib
+import contextvars
+import time
+
+from core import tracing
+
+# Time spent in each stage of a delivery (decode, parse, config_lookup,
+# token_resolution, throttle_gate, related_lookup, er_post, cache_write,
+# progress_read, progress_flush, event_publish), labelled by stage,
+# stream_type and destination_id. Stages may nest: er_post includes the
+# token_resolution it triggers. No-ops unless METRICS_ENABLED configures a
+# meter provider.
+_stage_duration = tracing.meter.create_histogram(
+    "dispatcher.stage_duration", unit="s", description="Time spent in each stage of a delivery",
+)
+
+# Labels of the delivery being handled. Each request runs in its own asyncio
+# task, which has its own copy of the context, so they don't leak across
+# requests.
+_delivery_labels = contextvars.ContextVar("delivery_labels", default={
+    "stream_type": "unknown", "destination_id": "unknown",
+})
+# Innermost stage being timed, if any
+_current_stage = contextvars.ContextVar("current_stage", default=None)
+
+
+def set_delivery_labels(stream_type=None, destination_id=None):
+    """Label the stages timed from here on in the current task."""
+    _delivery_labels.set({
+        "stream_type": str(stream_type) if stream_type else "unknown",
+        "destination_id": str(destination_id) if destination_id else "unknown",
+    })
+
+
+def delivery_labels():
+    return _delivery_labels.get()
+
+
+def current_stage():
+    return _current_stage.get()
+
+
+def record(stage, seconds):
+    _stage_duration.record(seconds, {**_delivery_labels.get(), "stage": stage})
+
+
+@contextlib.contextmanager
+def timed(stage):
+    # Recorded whether the stage succeeds or raises
+    token = _current_stage.set(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+        _current_stage.reset(token)
@@ -4,6 +4,7 @@ import time
 
 
 from core import settings
+from core import tracing
 from core import utils
 
 logger = logging.getLogger(__name__)
@@ -20,6 +21,13 @@ FAMILY_DISPLAY_NAMES = {
     MESSAGES_FAMILY: "Message",
 }
 
+# Attribute carrying a partial admission from process_request to the batch
+# dispatcher: how many of the envelope's items may be delivered now.
+ADMITTED_COUNT_ATTRIBUTE = "admitted_count"
+
+# Reasons whose retry_after is the time left in the current rate window
+WINDOW_REASONS = ("rate", "bytes", "shared")
+
 FAMILY_BY_STREAM_TYPE = {
     "ev": EVENTS_FAMILY,
     "evu": EVENTS_FAMILY,
@@ -29,6 +37,33 @@ FAMILY_BY_STREAM_TYPE = {
     "txt": MESSAGES_FAMILY,
 }
 
+# Gate metrics, labelled by destination_id and family (and reason for
+# deferrals). No-ops unless METRICS_ENABLED configures a meter provider.
+_admitted_items = tracing.meter.create_counter(
+    "throttle.admitted_items", unit="1", description="Items admitted by the throttle gate",
+)
+_deferred_items = tracing.meter.create_counter(
+    "throttle.deferred_items", unit="1", description="Items deferred by the throttle gate, by reason",
+)
+_grace_wait = tracing.meter.create_histogram(
+    "throttle.grace_wait", unit="s", description="Time spent waiting for the next rate window",
+)
+_window_utilization = tracing.meter.create_histogram(
+    "throttle.window_utilization", unit="1",
+    description="Share of the family's per-minute cap used once an admission is debited",
+)
+_cooldown_level = tracing.meter.create_histogram(
+    "throttle.cooldown_level", unit="1", description="Cooldown level reached on each distress signal",
+)
+_cooldown_seconds = tracing.meter.create_counter(
+    "throttle.cooldown_seconds", unit="s",
+    description="Cooldown time scheduled by distress signals (an early success cuts it short)",
+)
+
+
+def _metric_attributes(destination_id, family, **extra):
+    return {"destination_id": str(destination_id), "family": family, **extra}
+
 
 class ThrottledMessage(Exception):
     # Raised by check_admission when a message must be deferred. main.py turns
@@ -39,7 +74,7 @@ class ThrottledMessage(Exception):
         )
         self.destination_id = destination_id
         self.family = family
-        self.reason = reason  # "cooldown" | "rate"
+        self.reason = reason  # "cooldown" | "rate" | "bytes" | "shared" | "partial"
         self.retry_after = retry_after
 
 
@@ -56,6 +91,21 @@ def _cap_for_family(family):
     }[family]
 
 
+def _reserved_shares():
+    # Priority families and the share of the destination budget held for them
+    return {
+        EVENTS_FAMILY: settings.THROTTLE_EVENTS_RESERVED_SHARE,
+        MESSAGES_FAMILY: settings.THROTTLE_MESSAGES_RESERVED_SHARE,
+    }
+
+
+def seconds_left_in_window(now=None):
+    # Until the next rate window opens
+    if now is None:
+        now = int(time.time())
+    return 60 - now % 60
+
+
 def _cooldown_key(destination_id, scope):
     return f"throttle:cooldown:{destination_id}:{scope}"
 
@@ -68,11 +118,75 @@ def _rate_key(destination_id, family, window):
     return f"throttle:rate:{destination_id}:{family}:{window}"
 
 
-def _evaluate(destination_id, family, amount=1):
-    # Returns (admitted, reason, retry_after). Plain commands instead of a Lua
-    # script: INCR is atomic, and the check-then-increment race admits at most
-    # a few extra messages — acceptable for a kindness cap, and it keeps this
-    # module testable against the suite's MagicMock Redis.
+def _bytes_key(destination_id, family, window):
+    return f"throttle:bytes:{destination_id}:{family}:{window}"
+
+
+def _shared_key(destination_id, window):
+    return f"throttle:shared:{destination_id}:{window}"
+
+
+def _debit_window(db, key, amount, debits):
+    # INCRBY the window counter and return the window's total BEFORE this
+    # debit. The expiry is set on the first increment of the window (whatever
+    # its size), covering two windows so a straggler INCR never resurrects an
+    # expired key. The debit is added to debits, for _defer to give back.
+    count = db.incr(key, amount)
+    debits.append((key, amount))
+    if count == amount:
+        db.expire(key, 120)
+    return count - amount
+
+
+def _held_back(db, destination_id, window, total_cap):
+    # Unused reserve of every priority family that is active, i.e. saw
+    # traffic in this window or the previous one. One MGET for all of them.
+    shares = _reserved_shares()
+    keys = []
+    for family in shares:
+        keys.append(_rate_key(destination_id, family, window))
+        keys.append(_rate_key(destination_id, family, window - 1))
+    counts = [int(value or 0) for value in db.mget(keys)]
+    held = 0
+    for index, share in enumerate(shares.values()):
+        used, previous = counts[2 * index], counts[2 * index + 1]
+        if used or previous:
+            held += max(0, int(total_cap * share) - used)
+    return held
+
+
+def _defer(db, debits, reason, retry_after):
+    # A deferred message uses none of the budget it was debited: give it all
+    # back, or every deferral would eat into the window its redelivery (and
+    # everyone else) is admitted from.
+    for key, amount in debits:
+        db.decr(key, amount)
+    return 0, reason, retry_after
+
+
+def _shared_headroom(db, destination_id, family, amount, window, debits):
+    # Priority lanes: every family debits the destination-wide window, but
+    # only observations are gated by it. Priority families are bounded by
+    # their own caps alone, so under contention they are admitted ahead of a
+    # backfill instead of queueing behind it. Returns how many items the
+    # shared window still had room for (None when it doesn't gate this one).
+    total_cap = settings.THROTTLE_DESTINATION_MAX_DELIVERIES_PER_MINUTE
+    if total_cap <= 0:
+        return None
+    if family in _reserved_shares():
+        _debit_window(db, _shared_key(destination_id, window), amount, debits)
+        return None
+    limit = total_cap - _held_back(db, destination_id, window, total_cap)
+    prior_count = _debit_window(db, _shared_key(destination_id, window), amount, debits)
+    return limit - prior_count
+
+
+def _evaluate(destination_id, family, amount=1, size=0, partial=False):
+    # Returns (admitted_amount, reason, retry_after); admitted_amount is 0
+    # when deferred. Plain commands instead of a Lua script: INCR is atomic,
+    # and the check-then-increment race admits at most a few extra messages
+    # — acceptable for a kindness cap, and it keeps this module testable
+    # against the suite's MagicMock Redis.
     db = utils._cache_db
     for scope in (SITE_SCOPE, family):
         ttl = db.ttl(_cooldown_key(destination_id, scope))
@@ -80,57 +194,106 @@ def _evaluate(destination_id, family, amount=1):
         # setex keys; treated as no cooldown, failing open), 0 = expiring this
         # second - still honored so nothing leaks through the final second.
         if ttl is not None and ttl >= 0:
-            return False, "cooldown", ttl
+            return 0, "cooldown", ttl
     now = int(time.time())
-    rate_key = _rate_key(destination_id, family, now // 60)
-    count = db.incr(rate_key, amount)
-    if count == amount:
-        # First increment of this window (whatever its size).
-        # Two windows so a straggler INCR never resurrects an expired key
-        db.expire(rate_key, 120)
-    # Admit whenever there was headroom BEFORE this increment (count - amount
+    window = now // 60
+    retry_after = seconds_left_in_window(now)
+    rate_key = _rate_key(destination_id, family, window)
+    debits = []
+    prior_count = _debit_window(db, rate_key, amount, debits)
+    # Admit whenever there was headroom BEFORE this increment (prior_count
     # is the window's prior total), not whenever the post-increment total
     # fits under the cap. A batch larger than the cap (amount > cap) can
     # never satisfy `count <= cap`, so the old check deferred it forever -
     # every retry lands at the same over-cap count and it's never admitted,
     # until the message ages out and is silently dead-lettered. Admitting on
-    # prior headroom guarantees progress for any batch size, overshooting
-    # the cap by at most one batch, while single-item traffic (amount=1) is
-    # unaffected: count - 1 < cap is equivalent to count <= cap.
-    if count - amount < _cap_for_family(family):
-        return True, None, None
-    return False, "rate", 60 - (now % 60)
+    # prior headroom guarantees progress for any batch size, while
+    # single-item traffic (amount=1) is unaffected: count - 1 < cap is
+    # equivalent to count <= cap. Without partial admission the cap
+    # overshoots by at most one batch; with it, only the headroom is admitted.
+    cap = _cap_for_family(family)
+    if prior_count >= cap:
+        return _defer(db, debits, "rate", retry_after)
+    admitted = min(amount, cap - prior_count) if partial else amount
+    shared_headroom = _shared_headroom(db, destination_id, family, amount, window, debits)
+    if shared_headroom is not None:
+        if shared_headroom <= 0:
+            return _defer(db, debits, "shared", retry_after)
+        if partial:
+            admitted = min(admitted, shared_headroom)
+    byte_cap = settings.DEFAULT_MAX_DELIVERY_BYTES_PER_MINUTE
+    bytes_key = _bytes_key(destination_id, family, window)
+    if byte_cap > 0 and size > 0:
+        # Same prior-headroom rule as the item counter, so one envelope bigger
+        # than the whole byte budget still makes progress. A byte deferral
+        # gives back the item debits above along with its own.
+        prior_bytes = _debit_window(db, bytes_key, size, debits)
+        if prior_bytes >= byte_cap:
+            return _defer(db, debits, "bytes", retry_after)
+        if partial:
+            # Items are assumed to be of similar size within one envelope
+            admitted = min(admitted, max(1, amount * (byte_cap - prior_bytes) // size))
+    _window_utilization.record(
+        (prior_count + admitted) / cap if cap > 0 else 0.0,
+        _metric_attributes(destination_id, family),
+    )
+    if admitted < amount:
+        # Give back what this message won't use now, so the remainder's
+        # redelivery finds the budget the gate didn't actually hand out.
+        unused = amount - admitted
+        db.decr(rate_key, unused)
+        if shared_headroom is not None:
+            db.decr(_shared_key(destination_id, window), unused)
+        if byte_cap > 0 and size > 0:
+            db.decr(bytes_key, size - size * admitted // amount)
+    return admitted, None, None
 
 
-async def check_admission(destination_id, stream_type, amount=1):
-    # Raises ThrottledMessage when the message must be deferred (nacked).
+async def check_admission(destination_id, stream_type, amount=1, size=0, partial=False):
+    # Raises ThrottledMessage when the message must be deferred (nacked),
+    # otherwise returns how many of its items may be delivered now.
     # `amount` is the number of items the message carries (1 for classic
-    # single-observation messages, N for batch envelopes).
-    if not settings.THROTTLING_ENABLED or not destination_id:
-        return
+    # single-observation messages, N for batch envelopes). `size` is the
+    # message's payload size in bytes, debited against the optional byte
+    # budget (DEFAULT_MAX_DELIVERY_BYTES_PER_MINUTE). `partial` lets a batch
+    # envelope be admitted for just the window's headroom instead of all of
+    # its items (see THROTTLE_PARTIAL_ADMISSION_ENABLED); the caller delivers
+    # that many and nacks the rest.
     # Clamp so a malformed batch_count (0, negative, or non-int) can never
     # turn INCRBY into a no-op or a decrement that corrupts the rate counter.
     try:
         amount = max(1, int(amount))
     except (TypeError, ValueError):
         amount = 1
+    if not settings.THROTTLING_ENABLED or not destination_id:
+        return amount
+    # Same for size, except that 0 is legal: it skips the byte budget.
+    try:
+        size = max(0, int(size))
+    except (TypeError, ValueError):
+        size = 0
+    partial = partial and settings.THROTTLE_PARTIAL_ADMISSION_ENABLED
     family = get_family(stream_type)
+    attributes = _metric_attributes(destination_id, family)
     try:
-        admitted, reason, retry_after = _evaluate(destination_id, family, amount)
-        if admitted:
-            return
-        if reason == "rate" and retry_after <= settings.THROTTLE_GRACE_WAIT_MAX_SECONDS:
+        admitted, reason, retry_after = _evaluate(destination_id, family, amount, size, partial)
+        if not admitted and reason in WINDOW_REASONS and retry_after <= settings.THROTTLE_GRACE_WAIT_MAX_SECONDS:
             # The window opens soon: wait it out instead of paying a redelivery
             await asyncio.sleep(retry_after)
-            admitted, reason, retry_after = _evaluate(destination_id, family, amount)
-            if admitted:
-                return
+            _grace_wait.record(retry_after, attributes)
+            admitted, reason, retry_after = _evaluate(destination_id, family, amount, size, partial)
+        if admitted:
+            _admitted_items.add(admitted, attributes)
+            if admitted < amount:
+                _deferred_items.add(amount - admitted, {**attributes, "reason": "partial"})
+            return admitted
     except Exception as e:
         # Fail open on ANY gate malfunction (Redis errors or bugs): throttling
         # is a kindness, not a correctness requirement, and a broken gate must
         # never 500-loop the stream.
         logger.warning(f"Throttle gate unavailable, admitting message: {e}", exc_info=True)
-        return
+        return amount
+    _deferred_items.add(amount, {**attributes, "reason": reason})
     logger.info(
         f"Message deferred by throttle gate. destination_id={destination_id}, "
         f"family={family}, reason={reason}, retry_after={retry_after}"
@@ -195,6 +358,9 @@ def record_distress(destination_id, stream_type, status_code=None, error=None, r
                 settings.THROTTLE_COOLDOWN_MAX_SECONDS,
             )
         db.setex(_cooldown_key(destination_id, scope_key), ttl, scope_key)
+        attributes = _metric_attributes(destination_id, scope_key)
+        _cooldown_level.record(level, attributes)
+        _cooldown_seconds.add(ttl, attributes)
         # One notification per destination per notify window
         notify = db.set(
             f"throttle:notify:{destination_id}", "1",
@@ -2,22 +2,23 @@ from opentelemetry.propagators.cloud_trace_propagator import (
     CloudTraceFormatPropagator,
 )
 from opentelemetry.propagate import set_global_textmap
-from opentelemetry.instrumentation.requests import RequestsInstrumentor
-from opentelemetry.instrumentation.aiohttp_client import AioHttpClientInstrumentor
-from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
 from . import config
 from . import pubsub_instrumentation
+from . import payload_capture
+from . import sampling
 from core import settings
 
 if settings.TRACING_ENABLED:
+    # Imported here so deployments without tracing don't load the instrumentors
+    from opentelemetry.instrumentation.requests import RequestsInstrumentor
+    from opentelemetry.instrumentation.aiohttp_client import AioHttpClientInstrumentor
+    from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+
     # Capture requests (sync and async)
     RequestsInstrumentor().instrument()
     AioHttpClientInstrumentor().instrument()
     HTTPXClientInstrumentor().instrument()
-else:
-    RequestsInstrumentor().uninstrument()
-    AioHttpClientInstrumentor().uninstrument()
-    HTTPXClientInstrumentor().uninstrument()
 # Using the X-Cloud-Trace-Context header
 set_global_textmap(CloudTraceFormatPropagator())
 tracer = config.configure_tracer(name="er-dispatcher", version="0.1.0")
+meter = config.configure_meter(name="er-dispatcher", version="0.1.0")
@@ -1,27 +1,79 @@
 # Open telemetry metrics (Distributed Tracing)
-from opentelemetry import trace
+import logging
+
+from opentelemetry import metrics, trace
 from opentelemetry.sdk.resources import Resource
-from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from core import settings
+from .sampling import DispatcherSampler
+
+logger = logging.getLogger(__name__)
 
 
 def configure_tracer(name: str, version: str = ""):
     if settings.TRACING_ENABLED:
+        # Imported here so deployments without tracing don't load the exporter
+        from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
+
         resource = Resource.create(
             {
                 "service.name": name,
                 "service.version": version,
             }
         )
-        tracer_provider = TracerProvider(resource=resource)
-        cloud_trace_exporter = CloudTraceSpanExporter()
-        tracer_provider.add_span_processor(
-            # BatchSpanProcessor buffers spans and sends them in batches in a
-            # background thread. The default parameters are sensible, but can be
-            # tweaked to optimize your performance
-            BatchSpanProcessor(cloud_trace_exporter)
-        )
+        tracer_provider = TracerProvider(resource=resource, sampler=build_sampler())
+        tracer_provider.add_span_processor(build_span_processor(CloudTraceSpanExporter()))
         trace.set_tracer_provider(tracer_provider)
     return trace.get_tracer(name, version)
+
+
+def build_sampler():
+    # TraceIdRatioBased raises outside [0, 1], and this runs at import: a
+    # misconfigured ratio must not take the function down with it.
+    ratio = min(max(settings.TRACE_SAMPLE_RATIO, 0.0), 1.0)
+    if ratio != settings.TRACE_SAMPLE_RATIO:
+        logger.warning(f"TRACE_SAMPLE_RATIO {settings.TRACE_SAMPLE_RATIO} is outside [0, 1], using {ratio}.")
+    return DispatcherSampler(ratio=ratio)
+
+
+def build_span_processor(exporter):
+    # BatchSpanProcessor buffers spans and sends them in batches in a
+    # background thread. Spans are dropped once the queue is full.
+    return BatchSpanProcessor(
+        exporter,
+        max_queue_size=settings.TRACE_EXPORT_MAX_QUEUE_SIZE,
+        schedule_delay_millis=settings.TRACE_EXPORT_SCHEDULE_DELAY_MILLIS,
+        max_export_batch_size=settings.TRACE_EXPORT_MAX_BATCH_SIZE,
+        export_timeout_millis=settings.TRACE_EXPORT_TIMEOUT_MILLIS,
+    )
+
+
+def configure_meter(name: str, version: str = ""):
+    if settings.METRICS_ENABLED:
+        # Imported here so deployments without metrics don't load the exporter
+        from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+        from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+
+        # The reader exports in a background thread every interval; counters
+        # and histograms are aggregated in memory in between.
+        reader = PeriodicExportingMetricReader(
+            OTLPMetricExporter(),
+            export_interval_millis=settings.METRICS_EXPORT_INTERVAL_MILLIS,
+        )
+        metrics.set_meter_provider(build_meter_provider(name, version, reader))
+    # Without a provider this is a no-op meter, so instruments cost nothing
+    return metrics.get_meter(name, version)
+
+
+def build_meter_provider(name, version, reader):
+    from opentelemetry.sdk.metrics import MeterProvider
+
+    resource = Resource.create(
+        {
+            "service.name": name,
+            "service.version": version,
+            "deployment.environment": settings.TRACE_ENVIRONMENT,
+        }
+    )
+    return MeterProvider(resource=resource, metric_readers=[reader])
@@ -0,0 +1,76 @@
+import random
+
+from pydantic import BaseModel
+
+from core import settings
+
+CAPTURE_OFF = "off"
+CAPTURE_TRUNCATED = "truncated"
+CAPTURE_SAMPLED = "sampled"
+TRUNCATION_MARKER = "...[truncated]"
+
+
+def set_payload_attribute(span, key, payload):
+    """
+    Attach payload to span as a string, following TRACE_PAYLOAD_CAPTURE.
+
+    Nothing is built for spans that aren't recorded, or when the policy skips
+    this one. Otherwise only the first TRACE_PAYLOAD_MAX_BYTES of the payload's
+    repr are rendered: a batch envelope isn't stringified whole just for the
+    exporter to cut it.
+    """
+    if not span.is_recording():
+        return
+    policy = settings.TRACE_PAYLOAD_CAPTURE
+    if policy == CAPTURE_SAMPLED:
+        if random.random() >= settings.TRACE_PAYLOAD_SAMPLE_RATE:
+            return
+    elif policy != CAPTURE_TRUNCATED:  # "off", or a value we don't know
+        return
+    span.set_attribute(key, bounded_repr(payload, settings.TRACE_PAYLOAD_MAX_BYTES))
+
+
+def bounded_repr(value, max_bytes):
+    """repr() of value (models, dicts and lists walked lazily), cut at max_bytes."""
+    text = "".join(_take_chars(_repr_parts(value, max_bytes + 1), max_bytes + 1))
+    encoded = text.encode()
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode(errors="ignore") + TRUNCATION_MARKER
+
+
+def _take_chars(parts, limit):
+    # Parts until limit characters are covered (characters <= bytes)
+    taken = 0
+    for part in parts:
+        yield part
+        taken += len(part)
+        if taken >= limit:
+            return
+
+
+def _repr_parts(value, limit):
+    # The pieces of repr(value), rendered as they're consumed. Strings longer
+    # than limit only need their start rendered: the result is cut anyway.
+    if isinstance(value, (str, bytes)):
+        yield repr(value[:limit])
+    elif isinstance(value, BaseModel):
+        yield f"{type(value).__name__}("
+        yield from _joined(((f"{name}=", field_value) for name, field_value in value), limit)
+        yield ")"
+    elif isinstance(value, dict):
+        yield "{"
+        yield from _joined(((f"{key!r}: ", item) for key, item in value.items()), limit)
+        yield "}"
+    elif isinstance(value, (list, tuple)):
+        yield "[" if isinstance(value, list) else "("
+        yield from _joined((("", item) for item in value), limit)
+        yield "]" if isinstance(value, list) else ")"
+    else:
+        yield repr(value)
+
+
+def _joined(prefixed_items, limit):
+    for index, (prefix, item) in enumerate(prefixed_items):
+        yield f", {prefix}" if index else prefix
+        yield from _repr_parts(item, limit)
@@ -2,14 +2,15 @@ import json
 
 from opentelemetry import propagate, context
 
+from core import diagnostics
+
 
 def load_context_from_attributes(attributes):
-    print(f"[tracing.load_context_from_attributes]> attributes: {attributes}")
     carrier = json.loads(attributes.get("tracing_context", "{}"))
     ctx = propagate.extract(
         carrier=carrier
     )
-    print(f"[tracing.load_context_from_attributes]> ctx: {ctx}")
+    diagnostics.dump("Tracing context loaded", attributes=attributes, context=ctx)
     context.attach(ctx)
 
 
@@ -0,0 +1,58 @@
+from opentelemetry import trace
+from opentelemetry.sdk.trace.sampling import (
+    Decision,
+    ParentBased,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
+)
+
+# Span attribute asking for the span to be kept whatever the trace's sampling
+# decision. Set (at start) on spans recording errors and throttling decisions.
+ALWAYS_SAMPLE_ATTRIBUTE = "sampling.always"
+
+# Spans kept whatever the trace's sampling decision
+ALWAYS_SAMPLED_SPAN_NAMES = frozenset({
+    "send_message_to_dead_letter_topic",
+    "er_dispatcher.error_dispatching_observation",
+    "er_dispatcher.error_processing_event",
+    "er_dispatcher.throttle_deferred",
+})
+
+
+class DispatcherSampler(Sampler):
+    """
+    Parent-based ratio sampling, except for dead-letters, errors and throttling
+    decisions, which are always sampled. Sampling decisions are taken when a
+    span starts, so an error can only be kept in a span started once it's
+    known (see record_always_sampled). In a trace sampled out, that span is
+    exported without its ancestors.
+    """
+
+    def __init__(self, ratio):
+        self._ratio = ratio
+        self._default = ParentBased(TraceIdRatioBased(ratio))
+
+    def should_sample(
+        self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None
+    ):
+        if name in ALWAYS_SAMPLED_SPAN_NAMES or (attributes and attributes.get(ALWAYS_SAMPLE_ATTRIBUTE)):
+            parent_span_context = trace.get_current_span(parent_context).get_span_context()
+            parent_trace_state = parent_span_context.trace_state if parent_span_context.is_valid else None
+            return SamplingResult(Decision.RECORD_AND_SAMPLE, attributes, parent_trace_state)
+        return self._default.should_sample(
+            parent_context, trace_id, name, kind=kind, attributes=attributes, links=links, trace_state=trace_state
+        )
+
+    def get_description(self):
+        return f"DispatcherSampler{{ratio={self._ratio}}}"
+
+
+def record_always_sampled(tracer, name, error=None, **attributes):
+    """Record a short span that's sampled even when its trace isn't."""
+    with tracer.start_as_current_span(
+        name, attributes={ALWAYS_SAMPLE_ATTRIBUTE: True, **attributes}
+    ) as span:
+        if error is not None:
+            span.set_attribute("error", f"{type(error).__name__}: {error}")
+            span.set_status(trace.Status(trace.StatusCode.ERROR))
@@ -2,9 +2,10 @@
 import asyncio
 import base64
 import json
+import threading
+import time
 import aiohttp
 import logging
-import walrus
 import backoff
 import httpx
 from uuid import UUID
@@ -14,17 +15,19 @@ from gundi_core.schemas import v2 as gundi_schemas_v2
 from gundi_core.events import SystemEventBaseModel
 from gundi_client import PortalApi
 from gundi_client_v2 import GundiClient
-from pydantic import ValidationError
 from redis import exceptions as redis_exceptions
 from gcloud.aio import pubsub
-from . import settings
-from .errors import ReferenceDataError
+from . import cache_codec, diagnostics, portal_clients, redis_accounting, settings
+from .errors import IntegrationUnavailable, ReferenceDataError
 
 
 logger = logging.getLogger(__name__)
 
 
 def get_redis_db():
+    # Imported here, walrus isn't needed until the first Redis command
+    import walrus
+
     logger.debug(
         f"Connecting to REDIS DB :{settings.REDIS_DB} at {settings.REDIS_HOST}:{settings.REDIS_PORT}"
     )
@@ -33,8 +36,118 @@ def get_redis_db():
     )
 
 
+def get_counting_redis_db():
+    return redis_accounting.CountingRedis(get_redis_db())
+
+
+class LazyRedisDB:
+    """
+    Stands in for the database returned by connect, created on first use
+    rather than when the module is imported (on a cold start, before the
+    first request needs it).
+    """
+
+    def __init__(self, connect=get_counting_redis_db):
+        self._connect = connect
+        self._db = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    @property
+    def db(self):
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    self._db = self._connect()
+        return self._db
+
+
 _cache_ttl = settings.PORTAL_CONFIG_OBJECT_CACHE_TTL
-_cache_db = get_redis_db()
+_cache_db = LazyRedisDB()
+
+# Key prefixes of cached configuration objects. The version changes with the
+# layout of their entries (v2: cache_codec's msgpack, integration details
+# carrying their freshness and kept past it), so revisions writing different
+# layouts never read each other's entries, e.g. after a rollback.
+INTEGRATION_DETAILS_KEY_PREFIX = "integration_details.v2"
+OUTBOUND_DETAIL_KEY_PREFIX = "outbound_detail.v2"
+INBOUND_DETAIL_KEY_PREFIX = "inbound_detail.v2"
+
+# Destinations resolved recently by any instance (member: integration id,
+# score: last time an instance loaded its details). Read by core.warmup.
+RECENT_DESTINATIONS_KEY = "er_dispatcher.recent_destinations"
+# Each instance records a destination at most this often, whether or not its
+# details are kept in memory
+RECENT_DESTINATION_NOTE_INTERVAL_SECONDS = 60
+# integration_id -> when this instance last recorded it, as time.monotonic()
+_recent_destinations_noted = {}
+
+# integration_id -> (expires_at as time.monotonic(), Integration)
+_integration_details_memory = {}
+# Stale integration details being refreshed by this instance (integration ids)
+_detail_refreshes_in_flight = set()
+_detail_refreshes_guard = threading.Lock()
+# One instance refreshes a stale entry at a time. Not released on failure, so
+# it also spaces out retries while the portal is down.
+DETAIL_REFRESH_LOCK_TTL_SECONDS = 30
+
+
+def remember_integration_details(integration_id, integration):
+    # Marked as recently used for the next instance's warm-up, even with the
+    # in-process memory off
+    note_recent_destination(integration_id)
+    ttl = settings.INTEGRATION_DETAILS_MEMORY_TTL_SECONDS
+    if ttl <= 0:
+        return
+    _integration_details_memory[str(integration_id)] = (time.monotonic() + ttl, integration)
+
+
+def recall_integration_details(integration_id):
+    entry = _integration_details_memory.get(str(integration_id))
+    if not entry:
+        return None
+    expires_at, integration = entry
+    if expires_at <= time.monotonic():
+        _integration_details_memory.pop(str(integration_id), None)
+        return None
+    return integration
+
+
+def forget_integration_details(integration_id=None):
+    # Drops one in-process entry, or all of them when no id is given
+    if integration_id is None:
+        _integration_details_memory.clear()
+    else:
+        _integration_details_memory.pop(str(integration_id), None)
+
+
+def note_recent_destination(integration_id):
+    now = time.monotonic()
+    noted_at = _recent_destinations_noted.get(str(integration_id))
+    if noted_at is not None and now - noted_at < RECENT_DESTINATION_NOTE_INTERVAL_SECONDS:
+        return
+    _recent_destinations_noted[str(integration_id)] = now
+    try:
+        _cache_db.zadd(RECENT_DESTINATIONS_KEY, {str(integration_id): time.time()})
+    except Exception as e:
+        logger.warning(f"Error recording recently used destination: {e}")
+
+
+def get_recent_destinations(limit, window_seconds):
+    """Most recently used destination ids, newest first. Never raises."""
+    oldest = time.time() - window_seconds
+    try:
+        # Trim entries that fell out of the window so the set stays small
+        _cache_db.zremrangebyscore(RECENT_DESTINATIONS_KEY, "-inf", oldest)
+        members = _cache_db.zrevrangebyscore(
+            RECENT_DESTINATIONS_KEY, "+inf", oldest, start=0, num=limit
+        )
+    except Exception as e:
+        logger.warning(f"Error reading recently used destinations: {e}")
+        return []
+    return [m.decode() if isinstance(m, bytes) else str(m) for m in members]
 
 
 
@@ -55,9 +168,25 @@ def read_config_from_cache_safe(cache_key, extra_dict):
         return config
 
 
+def decode_config_safe(model_class, cached, extra_dict):
+    # None when there's no entry or it can't be read (the schema may have
+    # changed), so the configuration is fetched from the portal again
+    if not cached:
+        return None
+    try:
+        config, _ = cache_codec.loads(model_class, cached)
+    except (TypeError, ValueError) as e:
+        logger.warning(
+            f"Discarding unreadable cached integration configuration: {type(e).__name__} {e}",
+            extra={**extra_dict}
+        )
+        return None
+    return config
+
+
 def write_config_in_cache_safe(key, ttl, config, extra_dict):
     try:
-        _cache_db.setex(key, ttl, config.json())
+        _cache_db.setex(key, ttl, cache_codec.dumps(config))
     except redis_exceptions.ConnectionError as e:
         logger.warning(
             f"ConnectionError while writing integration configuration to Cache: {e}",
@@ -81,11 +210,11 @@ async def get_outbound_config_detail(
         ExtraKeys.OutboundIntId: str(outbound_id),
     }
 
-    cache_key = f"outbound_detail.{outbound_id}"
+    cache_key = f"{OUTBOUND_DETAIL_KEY_PREFIX}.{outbound_id}"
     cached = read_config_from_cache_safe(cache_key=cache_key, extra_dict=extra_dict)
+    config = decode_config_safe(gundi_schemas.OutboundConfiguration, cached, extra_dict)
 
-    if cached:
-        config = gundi_schemas.OutboundConfiguration.parse_raw(cached)
+    if config:
         logger.debug(
             "Using cached outbound integration detail",
             extra={
@@ -98,8 +227,7 @@ async def get_outbound_config_detail(
 
     # Retrieve outbound integration details from the portal
     logger.debug(f"Cache miss for outbound integration {outbound_id}.", extra={**extra_dict})
-    connect_timeout, read_timeout = settings.DEFAULT_REQUESTS_TIMEOUT
-    async with PortalApi(connect_timeout=connect_timeout, data_timeout=read_timeout) as portal:
+    async with portal_clients.portal_client(PortalApi) as portal:
         try:
             response = await portal.get_outbound_integration(integration_id=str(outbound_id))
         except httpx.HTTPStatusError as e:
@@ -167,11 +295,11 @@ async def get_inbound_integration_detail(
         ExtraKeys.InboundIntId: str(integration_id),
     }
 
-    cache_key = f"inbound_detail.{integration_id}"
+    cache_key = f"{INBOUND_DETAIL_KEY_PREFIX}.{integration_id}"
     cached = read_config_from_cache_safe(cache_key=cache_key, extra_dict=extra_dict)
+    config = decode_config_safe(gundi_schemas.IntegrationInformation, cached, extra_dict)
 
-    if cached:
-        config = gundi_schemas.IntegrationInformation.parse_raw(cached)
+    if config:
         logger.debug(
             "Using cached inbound integration detail",
             extra={**extra_dict, "integration_detail": config},
@@ -180,8 +308,7 @@ async def get_inbound_integration_detail(
 
     logger.debug(f"Cache miss for inbound integration {integration_id}", extra={**extra_dict})
 
-    connect_timeout, read_timeout = settings.DEFAULT_REQUESTS_TIMEOUT
-    async with PortalApi(connect_timeout=connect_timeout, data_timeout=read_timeout) as portal:
+    async with portal_clients.portal_client(PortalApi) as portal:
         try:
             response = await portal.get_inbound_integration(integration_id=str(integration_id))
         except httpx.HTTPStatusError as e:
@@ -251,33 +378,121 @@ async def get_integration_details(integration_id: str) -> gundi_schemas.v2.Integ
         ExtraKeys.OutboundIntId: str(integration_id),
     }
 
+    remembered = recall_integration_details(integration_id)
+    if remembered:
+        return remembered
+
     # Retrieve from cache if possible
-    cache_key = f"integration_details.{integration_id}"
+    cache_key = f"{INTEGRATION_DETAILS_KEY_PREFIX}.{integration_id}"
     cached = read_config_from_cache_safe(cache_key=cache_key, extra_dict=extra_dict)
 
     if cached:
-        try:
-            config = gundi_schemas.v2.Integration.parse_raw(cached)
-            logger.debug(
-                "Using cached integration details",
-                extra={
-                    **extra_dict,
-                    ExtraKeys.AttentionNeeded: False,
-                    "integration_detail": config,
-                },
-            )
+        config = use_cached_integration_details(integration_id, cached, extra_dict)
+        if config:
             return config
-        except ValidationError as e:
-            pass  # Schema may have changed, rebuild from the portal
 
     # Retrieve details from the portal
     logger.debug(f"Cache miss for integration details.", extra={**extra_dict})
-    connect_timeout, read_timeout = settings.DEFAULT_REQUESTS_TIMEOUT
-    async with GundiClient(
-        connect_timeout=connect_timeout, data_timeout=read_timeout
-    ) as portal_v2:
+    integration = await fetch_integration_details(integration_id, extra_dict=extra_dict)
+    if integration:  # don't cache empty response
+        cache_integration_details(integration_id, integration, extra_dict=extra_dict)
+        remember_integration_details(integration_id, integration)
+    return integration
+
+
+def use_cached_integration_details(integration_id, cached, extra_dict):
+    # Decodes a Redis entry and keeps it in process. Returns None when it
+    # can't be read (the schema may have changed) so it's rebuilt from the portal.
+    try:
+        config, fetched_at, fresh_until = decode_integration_details(cached)
+    except (KeyError, TypeError, ValueError):
+        return None
+    if fresh_until <= time.time():
+        # Past the soft TTL: serve it while it's refreshed in the background
+        logger.debug("Using stale cached integration details", extra={**extra_dict})
+        schedule_integration_details_refresh(integration_id, fetched_at)
+    else:
+        logger.debug(
+            "Using cached integration details",
+            extra={
+                **extra_dict,
+                ExtraKeys.AttentionNeeded: False,
+                "integration_detail": config,
+            },
+        )
+    remember_integration_details(integration_id, config)
+    return config
+
+
+async def get_many_integration_details(integration_ids, max_concurrency=None):
+    """
+    Resolve many integrations at once: in-process copies first, then a single
+    Redis MGET, then the portal for the rest, at most max_concurrency
+    (INTEGRATION_DETAILS_FETCH_CONCURRENCY by default) requests at a time.
+
+    Returns {integration_id: Integration} for the integrations found. Portal
+    errors are logged and the integration left out, so one broken
+    integration doesn't fail the others.
+    """
+    integration_ids = list(dict.fromkeys(str(i) for i in integration_ids if i))
+    found = {}
+    pending = []
+    for integration_id in integration_ids:
+        remembered = recall_integration_details(integration_id)
+        if remembered:
+            found[integration_id] = remembered
+        else:
+            pending.append(integration_id)
+
+    if pending:
+        try:
+            cached_values = _cache_db.mget([f"{INTEGRATION_DETAILS_KEY_PREFIX}.{i}" for i in pending])
+        except Exception as e:
+            logger.warning(f"Error while reading integration configurations from Cache: {e}")
+            cached_values = []
+        unavailable = set()
+        for integration_id, cached in zip(pending, cached_values):
+            if cached:
+                extra_dict = {ExtraKeys.OutboundIntId: integration_id}
+                try:
+                    config = use_cached_integration_details(integration_id, cached, extra_dict)
+                except IntegrationUnavailable:
+                    unavailable.add(integration_id)
+                    continue
+                if config:
+                    found[integration_id] = config
+        pending = [i for i in pending if i not in unavailable]
+
+    # The portal has no bulk endpoint for integration details: one request
+    # per miss, bounded
+    misses = [i for i in pending if i not in found]
+    if misses:
+        logger.debug(f"Cache miss for {len(misses)} integration details.")
+        if max_concurrency is None:
+            max_concurrency = settings.INTEGRATION_DETAILS_FETCH_CONCURRENCY
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def fetch_bounded(integration_id):
+            async with semaphore:
+                return await fetch_integration_details(integration_id)
+
+        fetched = await asyncio.gather(*(fetch_bounded(i) for i in misses), return_exceptions=True)
+        for integration_id, integration in zip(misses, fetched):
+            if isinstance(integration, Exception) or not integration:
+                continue  # logged by fetch_integration_details
+            cache_integration_details(integration_id, integration)
+            remember_integration_details(integration_id, integration)
+            found[integration_id] = integration
+
+    return {i: found[i] for i in integration_ids if i in found}
+
+
+async def fetch_integration_details(integration_id, extra_dict=None):
+    # Portal lookup behind get_integration_details, without any caching
+    extra_dict = extra_dict or {ExtraKeys.OutboundIntId: str(integration_id)}
+    async with portal_clients.portal_client(GundiClient) as portal_v2:
         try:
-            integration = await portal_v2.get_integration_details(
+            return await portal_v2.get_integration_details(
                 integration_id=integration_id
             )
         # ToDo: Catch more specific exceptions once the gundi client supports them
@@ -287,16 +502,137 @@ async def get_integration_details(integration_id: str) -> gundi_schemas.v2.Integ
                 error_msg,
                 extra=extra_dict,
             )
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 404:
+                mark_integration_unavailable(integration_id, reason=error_msg)
+                raise IntegrationUnavailable(error_msg)
             raise ReferenceDataError(error_msg)
-        else:
-            if integration:  # don't cache empty response
-                write_config_in_cache_safe(
-                    key=cache_key,
-                    ttl=_cache_ttl,
-                    config=integration,
-                    extra_dict=extra_dict
-                )
-            return integration
+
+
+def mark_integration_unavailable(integration_id, reason):
+    """
+    Remember for INTEGRATION_UNAVAILABLE_CACHE_TTL_SECONDS that an integration
+    was deleted (not found by the portal), in place of its cached details:
+    lookups then raise IntegrationUnavailable without asking the portal, until the entry
+    expires or a portal config change invalidates it. Never raises.
+    """
+    ttl = settings.INTEGRATION_UNAVAILABLE_CACHE_TTL_SECONDS
+    forget_integration_details(integration_id)
+    if ttl <= 0:
+        return
+    try:
+        _cache_db.setex(
+            f"{INTEGRATION_DETAILS_KEY_PREFIX}.{integration_id}", ttl, cache_codec.dumps_tombstone(unavailable=reason)
+        )
+    except Exception as e:
+        logger.warning(f"Error caching unavailable integration {integration_id}: {e}")
+
+
+def encode_integration_details(integration, fetched_at, fresh_until):
+    # Carries its freshness, so one GET tells whether the cached copy is past
+    # its soft TTL
+    return cache_codec.dumps(integration, fetched_at=fetched_at, fresh_until=fresh_until)
+
+
+def decode_integration_details(cached):
+    """
+    Returns (integration, fetched_at, fresh_until) from a cache entry.
+    Raises IntegrationUnavailable for entries left by
+    mark_integration_unavailable, and TypeError or ValueError (incl.
+    pydantic's ValidationError) for unreadable entries.
+    """
+    integration, meta = cache_codec.loads(gundi_schemas.v2.Integration, cached)
+    if integration is None:
+        raise IntegrationUnavailable(meta["unavailable"])
+    return integration, meta["fetched_at"], meta["fresh_until"]
+
+
+def cache_integration_details(integration_id, integration, extra_dict=None):
+    # Fresh for PORTAL_CONFIG_OBJECT_CACHE_TTL (the soft TTL), then kept for
+    # INTEGRATION_DETAILS_STALE_TTL_SECONDS more (the hard TTL) to be served
+    # while it's refreshed
+    now = time.time()
+    ttl = _cache_ttl + max(0, settings.INTEGRATION_DETAILS_STALE_TTL_SECONDS)
+    try:
+        _cache_db.setex(
+            f"{INTEGRATION_DETAILS_KEY_PREFIX}.{integration_id}",
+            ttl,
+            encode_integration_details(integration, fetched_at=now, fresh_until=now + _cache_ttl),
+        )
+    except Exception as e:
+        logger.warning(
+            f"Error while writing integration configuration to Cache: {e}",
+            extra={**(extra_dict or {})}
+        )
+
+
+def extend_stale_integration_details(integration_id, fetched_at):
+    # Called when a refresh fails: keeps serving the stale copy for another
+    # stale period, unless it's already INTEGRATION_DETAILS_MAX_STALE_SECONDS
+    # old. EXPIRE (not a rewrite) so an entry invalidated meanwhile stays gone.
+    if time.time() - fetched_at >= settings.INTEGRATION_DETAILS_MAX_STALE_SECONDS:
+        logger.warning(
+            f"Cached details of integration {integration_id} are too old to extend, "
+            f"they'll expire and be fetched again."
+        )
+        return
+    try:
+        _cache_db.expire(
+            f"{INTEGRATION_DETAILS_KEY_PREFIX}.{integration_id}",
+            settings.INTEGRATION_DETAILS_STALE_TTL_SECONDS,
+        )
+    except Exception as e:
+        logger.warning(f"Error extending stale integration details in Cache: {e}")
+
+
+def _run_integration_details_refresh(integration_id, fetched_at):
+    try:
+        integration = asyncio.run(
+            portal_clients.closing_clients(fetch_integration_details(integration_id))
+        )
+        if integration:
+            cache_integration_details(integration_id, integration)
+            remember_integration_details(integration_id, integration)
+    except IntegrationUnavailable as e:
+        # Its cached details were replaced by the unavailable marker
+        logger.warning(f"Integration {integration_id} is no longer available: {e}")
+    except Exception as e:
+        logger.warning(f"Background refresh of integration details {integration_id} failed: {e}")
+        extend_stale_integration_details(integration_id, fetched_at)
+    finally:
+        with _detail_refreshes_guard:
+            _detail_refreshes_in_flight.discard(integration_id)
+
+
+def schedule_integration_details_refresh(integration_id, fetched_at):
+    """Refresh stale integration details in a background thread. Never raises.
+
+    Like core.er_auth.schedule_token_refresh: a thread with its own event
+    loop, started only by the instance holding the refresh lock.
+    """
+    integration_id = str(integration_id)
+    if settings.INTEGRATION_DETAILS_STALE_TTL_SECONDS <= 0:
+        return
+    with _detail_refreshes_guard:
+        if integration_id in _detail_refreshes_in_flight:
+            return
+        _detail_refreshes_in_flight.add(integration_id)
+    started = False
+    try:
+        if _cache_db.set(
+            f"{INTEGRATION_DETAILS_KEY_PREFIX}.{integration_id}.refresh", "1",
+            nx=True, ex=DETAIL_REFRESH_LOCK_TTL_SECONDS,
+        ):
+            threading.Thread(
+                target=_run_integration_details_refresh, args=(integration_id, fetched_at),
+                name="integration-details-refresh", daemon=True,
+            ).start()
+            started = True
+    except Exception as e:
+        logger.warning(f"Could not start integration details refresh: {e}")
+    finally:
+        if not started:
+            with _detail_refreshes_guard:
+                _detail_refreshes_in_flight.discard(integration_id)
 
 
 async def get_dispatched_observation(gundi_id: str, destination_id: str) -> gundi_schemas_v2.DispatchedObservation:
@@ -318,10 +654,7 @@ async def get_dispatched_observation(gundi_id: str, destination_id: str) -> gund
         else:  # Try to rebuild the cache entry
             # Retrieve traces from the portal
             logger.debug(f"Cache miss for dispatched observation.", extra={**extra_dict})
-            connect_timeout, read_timeout = settings.DEFAULT_REQUESTS_TIMEOUT
-            async with GundiClient(
-                    connect_timeout=connect_timeout, data_timeout=read_timeout
-            ) as portal_v2:
+            async with portal_clients.portal_client(GundiClient) as portal_v2:
                 try:
                     filters = {
                         "object_id": gundi_id,
@@ -504,7 +837,7 @@ async def publish_event(event: SystemEventBaseModel, topic_name: str):
         # Prepare the payload
         binary_payload = json.dumps(event.dict(), default=str).encode("utf-8")
         messages = [pubsub.PubsubMessage(binary_payload)]
-        logger.debug(f"Sending event {event} to PubSub topic {topic_name}..")
+        diagnostics.dump("Publishing system event", topic=topic_name, event=event)
         try:  # Send to pubsub
             response = await client.publish(topic, messages)
         except Exception as e:
@@ -513,6 +846,6 @@ async def publish_event(event: SystemEventBaseModel, topic_name: str):
             )
             raise e
         else:
-            logger.debug(f"System event {event} published successfully.")
+            logger.debug(f"System event {type(event).__name__} published successfully.")
             logger.debug(f"GCP PubSub response: {response}")
 
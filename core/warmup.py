@@ -0,0 +1,79 @@
+import asyncio
+import logging
+
+from core import portal_clients, settings
+from core.dispatchers import ERDispatcherV2
+from core.utils import get_many_integration_details, get_recent_destinations
+
+logger = logging.getLogger(__name__)
+
+
+def hot_destination_ids():
+    # Configured destinations first, then the most recently used ones
+    destination_ids = list(dict.fromkeys(settings.WARMUP_DESTINATION_IDS))
+    if len(destination_ids) < settings.WARMUP_MAX_DESTINATIONS:
+        recent = get_recent_destinations(
+            limit=settings.WARMUP_MAX_DESTINATIONS,
+            window_seconds=settings.WARMUP_RECENT_WINDOW_SECONDS,
+        )
+        destination_ids.extend(d for d in recent if d not in destination_ids)
+    return destination_ids[:settings.WARMUP_MAX_DESTINATIONS]
+
+
+async def warm_up_destination(integration):
+    # Resolves the ER token the same way a delivery would (memory, Redis, or
+    # a login under the login lock), which leaves it in the in-process token
+    # cache.
+    er_client = ERDispatcherV2.make_er_client(integration=integration, provider="")
+    try:
+        if er_client.username:  # static-token clients have nothing to resolve
+            await er_client.auth_headers()
+    finally:
+        await er_client.close()
+
+
+async def warm_up(destination_ids=None):
+    """Warm the in-process caches for the given (or the hot) destinations.
+
+    Integration details are loaded in bulk (one Redis MGET, then the portal
+    for the misses), then the ER tokens. Returns how many destinations were
+    warmed. Failures are logged and skipped: the first real message for that
+    destination takes the cold path.
+    """
+    if destination_ids is None:
+        destination_ids = hot_destination_ids()
+    integrations = await get_many_integration_details(
+        destination_ids, max_concurrency=settings.WARMUP_CONCURRENCY
+    )
+    semaphore = asyncio.Semaphore(max(1, settings.WARMUP_CONCURRENCY))
+
+    async def warm_up_bounded(integration):
+        async with semaphore:
+            await warm_up_destination(integration)
+
+    results = await asyncio.gather(
+        *(warm_up_bounded(i) for i in integrations.values()), return_exceptions=True
+    )
+    for destination_id, result in zip(integrations, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Warm-up failed for destination {destination_id}: {result}")
+    warmed = sum(1 for r in results if not isinstance(r, Exception))
+    logger.info(f"Warm-up done: {warmed} of {len(destination_ids)} destinations warmed.")
+    return warmed
+
+
+def run():
+    # Called once at instance start (see main.py). Never raises and never
+    # takes longer than WARMUP_TIMEOUT_SECONDS: a failed warm-up only means
+    # the first messages take the cold path.
+    # Only the process-wide caches (integration details, ER tokens) outlive
+    # it. Portal and ER connections belong to an event loop, and requests are
+    # served on the server's worker threads, each with a loop of its own
+    # (main.run_on_thread_loop), so the clients opened here are closed with
+    # this loop rather than kept.
+    try:
+        asyncio.run(portal_clients.closing_clients(
+            asyncio.wait_for(warm_up(), timeout=settings.WARMUP_TIMEOUT_SECONDS)
+        ))
+    except Exception as e:
+        logger.warning(f"Warm-up aborted: {type(e).__name__} {e}")
@@ -1,22 +1,112 @@
 import asyncio
+import atexit
 import logging
+import sys
+import threading
+import weakref
 from functions_framework import http
-from core import tracing
+from core import config_invalidation, diagnostics, portal_clients, profiling, settings, tracing, warmup
 from core.services import process_request
 from core.throttling import ThrottledMessage
 
 logger = logging.getLogger(__name__)
+_thread_state = threading.local()
+# Every thread's loop, kept until they're closed at exit
+_thread_loops = set()
+
+if settings.CONFIG_INVALIDATION_LISTENER_ENABLED:
+    config_invalidation.start_listener()
+if settings.WARMUP_ENABLED:
+    # Runs once per instance, before it serves its first request
+    warmup.run()
+
+
+def run_on_thread_loop(coroutine):
+    # Each worker thread keeps its event loop across requests, instead of
+    # asyncio.run() per request, so the shared portal clients (and their
+    # keep-alive connections) outlive a single request. See core.portal_clients.
+    loop = getattr(_thread_state, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = _thread_state.loop = asyncio.new_event_loop()
+        _thread_loops.add(loop)
+    asyncio.set_event_loop(loop)
+    async_generators = weakref.WeakSet()
+    try:
+        return loop.run_until_complete(_tracking_async_generators(coroutine, async_generators))
+    finally:
+        _clean_up_after_request(loop, async_generators)
+
+
+async def _tracking_async_generators(coroutine, async_generators):
+    # Adds the async generators the request starts to async_generators, then
+    # hands them to the loop as usual. The hooks are the thread's, and
+    # run_until_complete puts back its own once it returns.
+    firstiter, finalizer = sys.get_asyncgen_hooks()
+
+    def track(agen):
+        async_generators.add(agen)
+        if firstiter is not None:
+            firstiter(agen)
+
+    sys.set_asyncgen_hooks(firstiter=track, finalizer=finalizer)
+    return await coroutine
+
+
+def _clean_up_after_request(loop, async_generators):
+    # What asyncio.run() does before closing its loop, minus the closing: tasks
+    # the request left behind (e.g. the rest of a gather() after one of its
+    # awaitables failed) are cancelled and awaited, and the async generators it
+    # left suspended are closed, so neither runs on into the next request.
+    leftovers = asyncio.all_tasks(loop)
+    for task in leftovers:
+        task.cancel()
+    if leftovers:
+        loop.run_until_complete(asyncio.gather(*leftovers, return_exceptions=True))
+    for task in leftovers:
+        if not task.cancelled() and task.exception() is not None:
+            loop.call_exception_handler({
+                "message": "unhandled exception in a task left behind by a request",
+                "exception": task.exception(),
+                "task": task,
+            })
+    suspended = list(async_generators)
+    if not suspended:
+        return
+    results = loop.run_until_complete(
+        asyncio.gather(*(agen.aclose() for agen in suspended), return_exceptions=True)
+    )
+    for agen, result in zip(suspended, results):
+        if isinstance(result, Exception):
+            loop.call_exception_handler({
+                "message": "error closing an async generator left behind by a request",
+                "exception": result,
+                "asyncgen": agen,
+            })
+
+
+@atexit.register
+def close_thread_loops():
+    """Close the portal clients and event loops of the threads that served requests."""
+    for loop in list(_thread_loops):
+        if loop.is_closed() or loop.is_running():
+            continue
+        try:
+            loop.run_until_complete(portal_clients.close_clients())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        except Exception as e:
+            logger.warning(f"Error closing a request event loop: {e}")
+        finally:
+            loop.close()
+            _thread_loops.discard(loop)
 
 
 @http
 def main(request):
     logger.info(f"Request received:\n{request}")
-    body = request.data
-    headers = request.headers
-    print(f"Message Received.\n RAW body: {body}\n headers: {headers}")
-    logger.debug(f"Request received:\n{request}")
+    diagnostics.dump("Request received", body=request.data, headers=request.headers)
     try:
-        asyncio.run(process_request(request))
+        with profiling.profiled(request):
+            run_on_thread_loop(process_request(request))
     except ThrottledMessage as e:
         # Deferral, not failure: 429 nacks the push message so PubSub
         # redelivers it later. Deliberately no failure event, no activity log.
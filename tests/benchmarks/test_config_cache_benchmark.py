@@ -0,0 +1,39 @@
+import time
+
+import pytest
+from gundi_core.schemas import v2 as schemas_v2
+
+from core import settings, utils
+
+from .timing import measure_async
+
+INTEGRATION_ID = "338225f3-91f9-4fe1-b013-353a229ce504"
+
+
+@pytest.mark.asyncio
+async def test_benchmark_get_integration_details_cache_hit(mocker, destination_integration_v2):
+    # Decoding a Redis hit (no in-process copy): JSON validated on every read,
+    # as entries were written before, vs the msgpack entries written now
+    mocker.patch.object(settings, "INTEGRATION_DETAILS_MEMORY_TTL_SECONDS", 0)
+    mock_cache = mocker.MagicMock()
+    mocker.patch("core.utils._cache_db", mock_cache)
+    json_entry = destination_integration_v2.json()
+    now = time.time()
+    msgpack_entry = utils.encode_integration_details(
+        destination_integration_v2, fetched_at=now, fresh_until=now + 3600
+    )
+
+    async def decode_json():
+        return schemas_v2.Integration.parse_raw(json_entry)
+
+    async def decode_msgpack():
+        return utils.decode_integration_details(msgpack_entry)
+
+    before = await measure_async("integration details cache hit, JSON + validation", decode_json)
+    after = await measure_async("integration details cache hit, msgpack + construct", decode_msgpack)
+
+    print(f"[benchmark] entry size: JSON {len(json_entry)} bytes, msgpack {len(msgpack_entry)} bytes")
+    print(f"[benchmark] msgpack/JSON mean ratio: {after['mean_us'] / before['mean_us']:.2f}")
+    mock_cache.get.return_value = msgpack_entry
+    assert (await utils.get_integration_details(integration_id=INTEGRATION_ID)).id == destination_integration_v2.id
+    assert len(msgpack_entry) < len(json_entry)
@@ -0,0 +1,59 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# Cumulative import time of `main`, with tracing disabled. Generous, so it
+# only catches a heavy import creeping back onto the cold start path; override
+# with BENCHMARK_IMPORT_BUDGET_MS on slow machines.
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("BENCHMARK_IMPORT_BUDGET_MS", 3000))
+
+# Loaded on first use, never by importing main
+DEFERRED_MODULES = (
+    "cdip_connector.core.cloudstorage",
+    "opentelemetry.exporter.cloud_trace",
+    "opentelemetry.instrumentation.requests",
+    "opentelemetry.instrumentation.aiohttp_client",
+    "opentelemetry.instrumentation.httpx",
+    "walrus",
+)
+
+_CHECK_COLD_IMPORT = """
+import sys
+import main
+from core import er_auth, utils
+print(",".join(name for name in {deferred!r} if name in sys.modules))
+print(utils._cache_db._db is None and er_auth._cache_db._db is None)
+"""
+
+
+def _import_main():
+    # A fresh interpreter: the test session has imported everything already
+    env = {**os.environ, "TRACING_ENABLED": "false"}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHECK_COLD_IMPORT.format(deferred=DEFERRED_MODULES)],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return completed.stdout.splitlines(), completed.stderr
+
+
+def _cumulative_us(importtime_log, module):
+    match = re.search(rf"^import time:\s+\d+ \|\s+(\d+) \| {re.escape(module)}$", importtime_log, re.MULTILINE)
+    return int(match.group(1))
+
+
+def test_benchmark_cold_import_of_main():
+    (loaded_deferred, redis_untouched), importtime_log = _import_main()
+
+    import_ms = _cumulative_us(importtime_log, "main") / 1000
+    print(f"\n[benchmark] import main (cold, tracing disabled): {import_ms:.0f}ms")
+    assert loaded_deferred == ""
+    assert redis_untouched == "True"
+    assert import_ms < IMPORT_TIME_BUDGET_MS
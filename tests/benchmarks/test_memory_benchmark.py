@@ -0,0 +1,59 @@
+import tracemalloc
+from datetime import datetime, timezone
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from core import settings, tracing
+from tools import replay
+
+from .workload import PushRequest, build_message
+
+BATCH_ITEMS = 2000
+# Peak memory of each stage per 1,000 items of a batch envelope, about twice
+# what decode and parse measure, to catch a stage copying the batch once more.
+# Serialize and post work on one ER_BULK_SIZE chunk at a time, so theirs
+# don't grow with the envelope.
+MEMORY_BUDGET_PER_1000_ITEMS = {
+    "decode": 4 * 1024 * 1024,
+    "parse": 5 * 1024 * 1024,
+    "serialize": 1024 * 1024,
+    "post": 1024 * 1024,
+}
+
+
+@pytest.fixture
+def memory_tracking_enabled(mocker):
+    mocker.patch.object(settings, "MEMORY_TRACKING_ENABLED", True)
+
+
+@pytest.fixture
+def exported_spans(mocker):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    mocker.patch.object(tracing, "tracer", provider.get_tracer("benchmark"))
+    return exporter
+
+
+def _push(items):
+    return replay.PushRequest(body=PushRequest(*build_message("batch", items)).get_json())
+
+
+def test_benchmark_batch_memory_per_stage(memory_tracking_enabled, exported_spans):
+    warmup, batch = _push(10), _push(BATCH_ITEMS)
+    with replay.LocalInstance([warmup, batch]) as instance:
+        # Unmeasured: logs in to ER and sets up the clients
+        instance.send(*replay.rewrite_timestamps(warmup, datetime.now(timezone.utc)))
+        exported_spans.clear()
+        status = instance.send(*replay.rewrite_timestamps(batch, datetime.now(timezone.utc)))
+
+    assert status == 200
+    (span,) = [s for s in exported_spans.get_finished_spans() if s.name == "er_dispatcher.process_event"]
+    for stage, budget in MEMORY_BUDGET_PER_1000_ITEMS.items():
+        per_1000_items = span.attributes[f"memory.peak_bytes.{stage}"] * 1000 / BATCH_ITEMS
+        print(f"\n[benchmark] batch memory peak, {stage}: {per_1000_items / 1024:.0f}KiB per 1000 items")
+        assert per_1000_items < budget, stage
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,17 @@
+from core.tracing.payload_capture import bounded_repr
+
+from .timing import measure
+from .workload import build_message
+
+MAX_BYTES = 2048
+
+
+def test_benchmark_batch_payload_attribute():
+    # A 500-item batch envelope, as process_transformer_event_v2 gets it
+    raw_event, _ = build_message("batch", items=500)
+
+    before = measure("batch payload attribute, str() then cut", lambda: str(raw_event)[:MAX_BYTES], iterations=200)
+    after = measure("batch payload attribute, bounded_repr()", lambda: bounded_repr(raw_event, MAX_BYTES), iterations=200)
+
+    print(f"[benchmark] bounded/str mean ratio: {after['mean_us'] / before['mean_us']:.3f}")
+    assert bounded_repr(raw_event, MAX_BYTES).startswith(str(raw_event)[:MAX_BYTES])
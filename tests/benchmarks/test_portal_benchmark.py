@@ -0,0 +1,62 @@
+import asyncio
+
+import httpx
+import pytest
+from gundi_client_v2 import GundiClient
+
+from core import portal_clients, settings
+
+from .timing import measure_async
+
+INTEGRATION_ID = "338225f3-91f9-4fe1-b013-353a229ce504"
+# Simulated network time per HTTP exchange. Connection and TLS setup aren't
+# simulated: the in-process transport has none, so the real savings are larger.
+ROUND_TRIP_SECONDS = 0.002
+
+
+class InProcessGundiClient(GundiClient):
+    # The real client, but answered in process: what's measured is client
+    # setup (incl. its SSL context) and the token exchange
+    requests = []
+    integration = None
+
+    def __init__(self, **kwargs):
+        super().__init__(
+            base_url="https://gundi-api.test", oauth_token_url="https://auth.test/token", **kwargs
+        )
+        self._session = httpx.AsyncClient(transport=httpx.MockTransport(self._handle))
+
+    async def _handle(self, request):
+        self.requests.append(request.url.path)
+        await asyncio.sleep(ROUND_TRIP_SECONDS)
+        if request.url.path == "/token":
+            return httpx.Response(200, json={
+                "access_token": "service-token", "refresh_token": "", "token_type": "Bearer",
+                "expires_in": 300, "refresh_expires_in": 0,
+            })
+        return httpx.Response(200, text=self.integration.json())
+
+
+@pytest.mark.asyncio
+async def test_benchmark_portal_miss(destination_integration_v2):
+    InProcessGundiClient.integration = destination_integration_v2
+    requests = InProcessGundiClient.requests = []
+
+    async def miss_with_new_client():
+        # As before: a client (and a token) per cache miss
+        connect_timeout, read_timeout = settings.DEFAULT_REQUESTS_TIMEOUT
+        async with InProcessGundiClient(connect_timeout=connect_timeout, data_timeout=read_timeout) as client:
+            await client.get_integration_details(integration_id=INTEGRATION_ID)
+
+    async def miss_with_shared_client():
+        async with portal_clients.portal_client(InProcessGundiClient) as client:
+            await client.get_integration_details(integration_id=INTEGRATION_ID)
+
+    before = await measure_async("portal miss, client per lookup", miss_with_new_client, iterations=50)
+    token_requests_before = requests.count("/token")
+    after = await measure_async("portal miss, shared client", miss_with_shared_client, iterations=200)
+    await portal_clients.close_clients()
+
+    print(f"[benchmark] shared/per-lookup mean ratio: {after['mean_us'] / before['mean_us']:.2f}")
+    assert token_requests_before == 50
+    assert requests.count("/token") - token_requests_before == 1
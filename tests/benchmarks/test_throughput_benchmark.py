@@ -0,0 +1,130 @@
+"""End-to-end throughput of the dispatcher, from push request to ER.
+
+Every scenario pushes its messages through main.main (or process_request)
+one after the other, against local stand-ins: ER is a real HTTP server on
+localhost answering instantly, Redis is in memory, PubSub and GCS are fakes.
+So what's measured is the dispatcher's own cost per message, plus a loopback
+round trip per ER call.
+
+Calls per message (Redis, ER, PubSub) are deterministic and checked against
+baselines.json; timings are only reported next to their baseline. After a
+change that's meant to move them, refresh the baselines with:
+
+    BENCHMARK_UPDATE_BASELINES=1 pytest tests/benchmarks/test_throughput_benchmark.py -s
+"""
+import asyncio
+import os
+
+import pytest
+from gundi_core.schemas import v2 as schemas_v2
+
+import main as main_module
+from core import settings, utils
+from core.services import process_request
+from tools import standins
+
+from .workload import (
+    CALL_METRICS, DATA_PROVIDER_ID, DELIVERED_EVENT_ER_ID, DELIVERED_EVENT_GUNDI_ID,
+    DESTINATION_ID, PushRequest, build_message, build_workload, load_baselines,
+    print_report, run_workload, save_baselines,
+)
+
+UPDATE_BASELINES = os.environ.get("BENCHMARK_UPDATE_BASELINES") == "1"
+# Calls per message over the baseline tolerated: a rate window rolling over
+# mid-run costs the throttle gate an extra EXPIRE or two
+CALLS_TOLERANCE = 0.05
+
+# (baseline name, scenario, messages, entry point, throttle gate on)
+RUNS = [
+    ("events", "events", 50, "main", False),
+    ("event_updates", "event_updates", 50, "main", False),
+    ("attachments", "attachments", 50, "main", False),
+    ("messages", "messages", 50, "main", False),
+    ("observations", "observations", 50, "main", False),
+    ("batches_of_10", "batches_of_10", 30, "main", False),
+    ("batches_of_500", "batches_of_500", 5, "main", False),
+    ("mixed", "mixed", 100, "main", False),
+    ("mixed[process_request]", "mixed", 100, "process_request", False),
+    ("mixed[throttle_gate]", "mixed", 100, "main", True),
+]
+
+
+@pytest.fixture
+def stand_ins(mocker, destination_integration_v2):
+    redis = standins.LocalRedis()
+    mocker.patch("core.utils._cache_db", redis)
+    mocker.patch("core.er_auth._cache_db", redis)
+    mocker.patch("gcloud.aio.pubsub.PublisherClient", standins.FakePublisher)
+    mocker.patch("core.dispatchers.get_cloud_storage", standins.FakeCloudStorage)
+    standins.FakePublisher.published.clear()
+
+    # The destination, logging in with username/password so the ER token
+    # path is part of the run, already in the shared cache
+    integration = destination_integration_v2.dict()
+    integration["base_url"] = "https://er-bench.test"
+    integration["configurations"][0]["data"] = {"username": "bench", "password": "bench-password"}
+    utils.cache_integration_details(DESTINATION_ID, schemas_v2.Integration.parse_obj(integration))
+    # The event that updates and attachments refer to
+    utils.cache_dispatched_observation(schemas_v2.DispatchedObservation(
+        gundi_id=DELIVERED_EVENT_GUNDI_ID,
+        related_to=None,
+        external_id=DELIVERED_EVENT_ER_ID,
+        data_provider_id=DATA_PROVIDER_ID,
+        destination_id=DESTINATION_ID,
+        delivered_at="2026-07-04T18:09:12+00:00",
+    ))
+
+    with standins.LocalER() as er, standins.redirect_er_clients(er):
+        yield standins.StandIns(redis, er)
+
+
+@pytest.fixture
+def throttle_gate_on(mocker):
+    # The gate's Redis work, with caps no benchmark run reaches
+    mocker.patch.object(settings, "THROTTLING_ENABLED", True)
+    for cap in ("EVENT", "OBSERVATION", "MESSAGE"):
+        mocker.patch.object(settings, f"DEFAULT_MAX_{cap}_DELIVERIES_PER_MINUTE", 1_000_000)
+
+
+def _process_request_on(loop):
+    def handle(request):
+        loop.run_until_complete(process_request(request))
+    return handle
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("name,scenario,messages,entry_point,throttled", RUNS, ids=[r[0] for r in RUNS])
+def test_benchmark_throughput(request, stand_ins, name, scenario, messages, entry_point, throttled):
+    if throttled:
+        request.getfixturevalue("throttle_gate_on")
+    loop = None
+    if entry_point == "main":
+        handle = main_module.main
+    else:
+        loop = asyncio.new_event_loop()
+        handle = _process_request_on(loop)
+    workload = build_workload(scenario, messages)
+    try:
+        # Unmeasured: the first message logs in to ER and fills the
+        # in-process caches, as on any instance after its first message
+        handle(PushRequest(*build_message("ev")))
+        report = run_workload(name, handle, workload, stand_ins)
+    finally:
+        if loop:
+            loop.close()
+
+    metrics = report.metrics()
+    baselines = load_baselines()
+    print_report(report, baselines.get(name))
+    assert report.messages == messages
+    assert report.http_calls >= messages  # every message reached ER
+    assert not stand_ins.er.requests[("POST", "oauth2/token")] > 1  # one login, then cached
+
+    if UPDATE_BASELINES:
+        baselines[name] = {metric: round(value, 3) for metric, value in metrics.items()}
+        save_baselines(baselines)
+    elif name in baselines:
+        for metric in CALL_METRICS:
+            assert metrics[metric] <= baselines[name][metric] + CALLS_TOLERANCE, (
+                f"{name}: {metric} went from {baselines[name][metric]} to {metrics[metric]:.3f}"
+            )
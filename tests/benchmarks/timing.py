@@ -0,0 +1,41 @@
+import statistics
+import time
+
+
+def _summarize(name, samples):
+    samples = sorted(samples)
+    result = {
+        "name": name,
+        "iterations": len(samples),
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p95_us": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e6,
+    }
+    # Shown with `pytest -s`; assertions on timings would be flaky on CI
+    print(
+        f"\n[benchmark] {name}: mean={result['mean_us']:.1f}us "
+        f"p50={result['p50_us']:.1f}us p95={result['p95_us']:.1f}us (n={len(samples)})"
+    )
+    return result
+
+
+def measure(name, func, iterations=1000, setup=None):
+    samples = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return _summarize(name, samples)
+
+
+async def measure_async(name, func, iterations=1000, setup=None):
+    samples = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - start)
+    return _summarize(name, samples)
@@ -0,0 +1,231 @@
+"""Push requests for the end-to-end benchmarks, and what a run measures.
+
+Messages are built the way the transformers publish them (base64 JSON
+envelope + attributes), wrapped in a PubSub push request.
+"""
+import base64
+import datetime
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import List
+
+DESTINATION_ID = "338225f3-91f9-4fe1-b013-353a229ce504"
+DATA_PROVIDER_ID = "ddd0946d-15b0-4308-b93d-e0470b6d33b6"
+PROVIDER_KEY = "gundi_bench_provider"
+# An event already delivered to ER, which updates and attachments refer to
+DELIVERED_EVENT_GUNDI_ID = "23ca4b15-18b6-4cf4-9da6-36dd69c6f638"
+DELIVERED_EVENT_ER_ID = "b2d3c9d4-0c3f-4b8a-8a53-3b3c4f0b9a11"
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+# Counted per message and compared with the baselines: deterministic
+CALL_METRICS = ("redis_calls_per_message", "http_calls_per_message", "pubsub_calls_per_message")
+# Reported against the baselines, never asserted: they depend on the machine
+TIMING_METRICS = ("messages_per_second", "items_per_second", "p50_ms", "p95_ms", "p99_ms")
+
+# Scenario -> ((message kind, items per message, weight), ...)
+SCENARIOS = {
+    "events": (("ev", 1, 1),),
+    "event_updates": (("evu", 1, 1),),
+    "attachments": (("att", 1, 1),),
+    "messages": (("txt", 1, 1),),
+    "observations": (("obv", 1, 1),),
+    "batches_of_10": (("batch", 10, 1),),
+    "batches_of_500": (("batch", 500, 1),),
+    # Roughly production's shape: mostly observations, some event traffic
+    "mixed": (
+        ("obv", 1, 40), ("batch", 10, 15), ("batch", 200, 5),
+        ("ev", 1, 20), ("evu", 1, 10), ("att", 1, 5), ("txt", 1, 5),
+    ),
+}
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _envelope(event_type, payload):
+    return {
+        "event_id": str(uuid.uuid4()),
+        "timestamp": str(_now()),
+        "schema_version": "v1",
+        "payload": payload,
+        "event_type": event_type,
+    }
+
+
+def _observation(manufacturer_id):
+    return {
+        "manufacturer_id": manufacturer_id,
+        "source_type": "tracking-device",
+        "subject_name": f"subject-{manufacturer_id}",
+        "recorded_at": str(_now()),
+        "location": {"lon": 35.43929, "lat": -1.59083},
+        "additional": {"speed_kmph": 10},
+    }
+
+
+def build_message(kind, items=1):
+    """(envelope, attributes) of one transformed message of the given kind."""
+    gundi_id = str(uuid.uuid4())
+    related_to = "None"
+    if kind == "ev":
+        envelope = _envelope("EventTransformedER", {
+            "title": "Animal Detected", "event_type": "wildlife_sighting_rep", "time": str(_now()),
+            "location": {"longitude": 13.783064, "latitude": 13.688635},
+            "event_details": {"species": "lion"},
+        })
+    elif kind == "evu":
+        gundi_id = DELIVERED_EVENT_GUNDI_ID
+        envelope = _envelope("EventUpdateTransformedER", {"changes": {"state": "resolved"}})
+    elif kind == "att":
+        related_to = DELIVERED_EVENT_GUNDI_ID
+        envelope = _envelope("AttachmentTransformedER", {"file_path": f"attachments/{gundi_id}_lion.svg"})
+    elif kind == "txt":
+        envelope = _envelope("MessageTransformedER", {
+            "message_type": "inbox", "manufacturer_id": "2075752244", "text": "Help!",
+            "message_time": str(_now()), "device_location": {"latitude": -51.69, "longitude": -72.71},
+            "additional": {"status": {"state": "PENDING"}},
+        })
+    elif kind == "obv":
+        envelope = _envelope("ObservationTransformedER", _observation("device-1"))
+    elif kind == "batch":
+        envelope = _envelope("ObservationsBatchTransformedER", {
+            "batch_id": str(uuid.uuid4()),
+            "data_provider_id": DATA_PROVIDER_ID,
+            "destination_id": DESTINATION_ID,
+            "provider_key": PROVIDER_KEY,
+            "items": [
+                {"gundi_id": str(uuid.uuid4()), "observation": _observation(f"device-{i}")}
+                for i in range(items)
+            ],
+        })
+    else:
+        raise ValueError(f"Unknown message kind {kind}")
+    attributes = {
+        "gundi_version": "v2",
+        "provider_key": PROVIDER_KEY,
+        "stream_type": "obv" if kind == "batch" else kind,
+        "destination_id": DESTINATION_ID,
+        "data_provider_id": DATA_PROVIDER_ID,
+        "tracing_context": "{}",
+    }
+    if kind == "batch":
+        attributes.update({"batch": "true", "batch_count": str(items)})
+    else:
+        attributes.update({"gundi_id": gundi_id, "related_to": related_to, "annotations": "{}"})
+    return envelope, attributes
+
+
+class PushRequest:
+    """What functions_framework hands main.main for a PubSub push."""
+
+    def __init__(self, envelope, attributes):
+        message_id = str(random.getrandbits(56))
+        self._json = {
+            "message": {
+                "data": base64.b64encode(json.dumps(envelope).encode()).decode(),
+                "attributes": attributes,
+                "messageId": message_id,
+                "message_id": message_id,
+                "publishTime": _now().strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                "publish_time": _now().strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            },
+            "subscription": "projects/bench/subscriptions/er-dispatcher",
+        }
+        self.data = json.dumps(self._json)
+        self.headers = {"Content-Type": "application/json"}
+
+    def get_json(self):
+        return self._json
+
+
+def build_workload(scenario, messages, seed=0):
+    """[(PushRequest, items)] for a scenario. Same seed, same mix."""
+    mix = SCENARIOS[scenario]
+    rng = random.Random(seed)
+    picks = rng.choices(mix, weights=[weight for _, _, weight in mix], k=messages)
+    return [(PushRequest(*build_message(kind, items)), items) for kind, items, _ in picks]
+
+
+def _percentile(sorted_samples, fraction):
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * fraction))]
+
+
+@dataclass
+class RunReport:
+    scenario: str
+    messages: int = 0
+    items: int = 0
+    duration: float = 0.0
+    redis_calls: int = 0
+    http_calls: int = 0
+    pubsub_calls: int = 0
+    latencies: List[float] = field(default_factory=list)
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        return {
+            "messages_per_second": self.messages / self.duration,
+            "items_per_second": self.items / self.duration,
+            "p50_ms": _percentile(latencies, 0.50) * 1e3,
+            "p95_ms": _percentile(latencies, 0.95) * 1e3,
+            "p99_ms": _percentile(latencies, 0.99) * 1e3,
+            "mean_ms": statistics.fmean(latencies) * 1e3,
+            "redis_calls_per_message": self.redis_calls / self.messages,
+            "http_calls_per_message": self.http_calls / self.messages,
+            "pubsub_calls_per_message": self.pubsub_calls / self.messages,
+        }
+
+
+def run_workload(scenario, handle, workload, stand_ins):
+    """
+    Feed every request to handle() (e.g. main.main) one after the other and
+    measure it. stand_ins counts the Redis, ER and PubSub calls made.
+    """
+    report = RunReport(scenario=scenario)
+    redis_before, http_before, pubsub_before = stand_ins.calls()
+    started = time.perf_counter()
+    for request, items in workload:
+        start = time.perf_counter()
+        handle(request)
+        report.latencies.append(time.perf_counter() - start)
+        report.messages += 1
+        report.items += items
+    report.duration = time.perf_counter() - started
+    redis_after, http_after, pubsub_after = stand_ins.calls()
+    report.redis_calls = redis_after - redis_before
+    report.http_calls = http_after - http_before
+    report.pubsub_calls = pubsub_after - pubsub_before
+    return report
+
+
+def load_baselines():
+    try:
+        with open(BASELINES_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(baselines):
+    with open(BASELINES_PATH, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def print_report(report, baseline=None):
+    # Shown with `pytest -s`, next to the baseline when there's one
+    metrics = report.metrics()
+    baseline = baseline or {}
+    lines = [f"\n[benchmark] e2e {report.scenario}: {report.messages} messages, {report.items} items"]
+    for name in TIMING_METRICS + CALL_METRICS:
+        line = f"    {name}: {metrics[name]:.2f}"
+        if baseline.get(name):
+            line += f" (baseline {baseline[name]:.2f}, {metrics[name] / baseline[name] - 1:+.0%})"
+        lines.append(line)
+    print("\n".join(lines))
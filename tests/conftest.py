@@ -17,6 +17,23 @@ from gcloud.aio import pubsub
 from core import settings
 
 
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "benchmark: end-to-end benchmarks, left out unless selected with -m benchmark"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    # Same as `-m "not benchmark"` when no -m is given; the repo has no pytest
+    # config file to put it in addopts.
+    if config.option.markexpr:
+        return
+    deselected = [item for item in items if item.get_closest_marker("benchmark")]
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = [item for item in items if not item.get_closest_marker("benchmark")]
+
+
 def async_return(result):
     f = asyncio.Future()
     f.set_result(result)
@@ -128,7 +145,9 @@ def mock_gundi_client_with_client_connect_error(
 ):
     mock_client = mocker.MagicMock()
     # Simulate a connection error
-    client_connector_error = httpx.ConnectError("Connection error")
+    client_connector_error = httpx.ConnectError(
+        "Connection error", request=httpx.Request("GET", "https://gundi-portal.test/api/v1.0")
+    )
     # Side effects to raise an exception when a method is called
     mock_client.get_inbound_integration.side_effect = client_connector_error
     mock_client.get_outbound_integration.side_effect = client_connector_error
@@ -154,8 +173,13 @@ def mock_gundi_client_with_500_error(
         device,
 ):
     mock_client = mocker.MagicMock()
-    # Simulate a connection error
-    client_connector_error = httpx.Response(status_code=500, text="Internal Server Error")
+    # Simulate a 500 response
+    request = httpx.Request("GET", "https://gundi-portal.test/api/v1.0")
+    client_connector_error = httpx.HTTPStatusError(
+        "Server error",
+        request=request,
+        response=httpx.Response(status_code=500, text="Internal Server Error", request=request),
+    )
     # Side effects to raise an exception when a method is called
     mock_client.get_inbound_integration.side_effect = client_connector_error
     mock_client.get_outbound_integration.side_effect = client_connector_error
@@ -1461,3 +1485,19 @@ def event_update_v2_as_pubsub_request_too_old(event_update_v2_as_pubsub_request)
 @pytest.fixture
 def position_as_request_too_old(position_as_request):
     return _make_request_too_old(position_as_request)
+
+
+@pytest.fixture(autouse=True)
+def clear_in_process_caches():
+    # Integration details, ER tokens and portal clients are kept per process; start
+    # every test cold so Redis/portal mocks see the lookups they expect
+    from core import er_auth, portal_clients, utils
+    utils.forget_integration_details()
+    utils._recent_destinations_noted.clear()
+    er_auth.forget_tokens()
+    portal_clients.forget_clients()
+    yield
+    utils.forget_integration_details()
+    utils._recent_destinations_noted.clear()
+    er_auth.forget_tokens()
+    portal_clients.forget_clients()
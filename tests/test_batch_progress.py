@@ -180,3 +180,15 @@ def test_write_progress_swallows_redis_error(mocker):
     mocker.patch("core.utils._cache_db", db)
 
     batch_progress.write_progress("b1", "d1", "pk", b"\x00" * 8, {0}, 3, ttl=90000)  # must not raise
+
+
+def test_failed_items_follow_in_a_second_bitmap():
+    items = [SimpleNamespace(gundi_id=g) for g in ("a", "b", "c")]
+    fp = batch_progress.fingerprint(items)
+    raw = batch_progress.encode(fp, {0}, 3, failed={2})
+    assert raw[8:] == bytes([0b00000001, 0b00000100])
+    assert batch_progress.decode(raw, fp, 3) == {0}
+    assert batch_progress.decode_failed(raw, fp, 3) == {2}
+    # Records without failures, or for another item list, have none
+    assert batch_progress.decode_failed(batch_progress.encode(fp, {0}, 3), fp, 3) == set()
+    assert batch_progress.decode_failed(raw, b"\x00" * 8, 3) == set()
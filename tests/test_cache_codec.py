@@ -0,0 +1,89 @@
+import msgpack
+import pytest
+from gundi_core import schemas
+from gundi_core.schemas import v2 as schemas_v2
+from pydantic import ValidationError
+from pydantic.networks import HttpUrl
+
+from core import cache_codec
+
+
+@pytest.fixture
+def outbound_config():
+    return schemas.OutboundConfiguration.parse_obj({
+        "id": "338225f3-91f9-4fe1-b013-353a229ce504",
+        "type": "45c66a61-71e4-4664-a7f2-30d465f87aa6",
+        "owner": "a91b400b-482a-4546-8fcb-ee42b01deeb6",
+        "endpoint": "https://gundi-load-testing.pamdas.org/api/v1.0",
+        "state": {},
+        "login": "",
+        "password": "",
+        "token": "fake-token",
+        "type_slug": "earth_ranger",
+        "inbound_type_slug": "gundi",
+    })
+
+
+def test_round_trip_rebuilds_nested_models(destination_integration_v2):
+    cached = cache_codec.dumps(destination_integration_v2, fetched_at=1.5)
+
+    integration, meta = cache_codec.loads(schemas_v2.Integration, cached)
+
+    assert meta == {"fetched_at": 1.5}
+    assert integration.dict() == destination_integration_v2.dict()
+    assert isinstance(integration.configurations[0].action, schemas_v2.IntegrationActionSummary)
+    assert integration.id == destination_integration_v2.id
+
+
+@pytest.mark.parametrize("version", [cache_codec.SCHEMA_VERSION, "0/gundi-core-0.0.1"])
+def test_round_trip_keeps_aliased_fields(version):
+    # action_schema and webhook_schema are both aliased "schema"
+    schema = {"type": "object", "properties": {"site": {"type": "string"}}}
+    integration_type = schemas_v2.IntegrationType.parse_obj({
+        "id": "45c66a61-71e4-4664-a7f2-30d465f87aa6",
+        "name": "EarthRanger",
+        "value": "earth_ranger",
+        "actions": [{
+            "id": "b0a0e7ed-d668-41b5-96d2-397f026c4ecb",
+            "type": "auth",
+            "name": "Authenticate",
+            "value": "auth",
+            "schema": schema,
+        }],
+        "webhook": {
+            "id": "a5fed1d4-b6b9-4a76-8d27-0c9d2ec8f4b5",
+            "name": "Webhook",
+            "value": "webhook",
+            "schema": schema,
+        },
+    })
+    _, data, meta = msgpack.unpackb(cache_codec.dumps(integration_type), ext_hook=cache_codec._decode_ext)
+    cached = msgpack.packb([version, data, meta], default=cache_codec._encode_ext)
+
+    decoded, _ = cache_codec.loads(schemas_v2.IntegrationType, cached)
+
+    assert decoded.actions[0].action_schema == schema
+    assert decoded.webhook.webhook_schema == schema
+    assert decoded == integration_type
+
+
+def test_fields_needing_validation_are_validated_on_the_fast_path(outbound_config):
+    config, _ = cache_codec.loads(schemas.OutboundConfiguration, cache_codec.dumps(outbound_config))
+
+    assert config == outbound_config
+    assert isinstance(config.endpoint, HttpUrl)
+    assert config.endpoint.host == "gundi-load-testing.pamdas.org"
+
+
+def test_json_entries_are_unreadable(outbound_config):
+    # Entries are only read under versioned keys, which never held JSON
+    with pytest.raises(ValueError):
+        cache_codec.loads(schemas.OutboundConfiguration, outbound_config.json().encode())
+
+
+def test_entries_of_another_version_are_fully_validated(outbound_config):
+    data = {**outbound_config.dict(), "id": "not-a-uuid"}
+    cached = msgpack.packb(["0/gundi-core-0.0.1", data, {}], default=cache_codec._encode_ext)
+
+    with pytest.raises(ValidationError):
+        cache_codec.loads(schemas.OutboundConfiguration, cached)
@@ -0,0 +1,131 @@
+import base64
+
+import pytest
+from gundi_core import events as system_events
+from gundi_core.schemas import v2 as schemas_v2
+from redis import exceptions as redis_exceptions
+
+from core import config_invalidation, settings, utils
+from core.services import process_request
+
+INTEGRATION_ID = "338225f3-91f9-4fe1-b013-353a229ce504"
+
+
+@pytest.fixture
+def mock_config_cache(mocker):
+    mock_cache = mocker.MagicMock()
+    mocker.patch("core.utils._cache_db", mock_cache)
+    return mock_cache
+
+
+def _as_pubsub_request(mocker, event):
+    mock_request = mocker.MagicMock()
+    mock_request.headers = {}
+    mock_request.get_json.return_value = {
+        "message": {
+            "data": base64.b64encode(event.json().encode()).decode(),
+            "attributes": {"tracing_context": "{}"},
+            "message_id": "11937923011474843",
+            "publish_time": "2020-01-01T00:00:00.000Z",  # old: still handled
+        },
+        "subscription": "projects/MY-PROJECT/subscriptions/MY-SUB",
+    }
+    return mock_request
+
+
+def _assert_invalidated(mock_cache, integration_id=INTEGRATION_ID):
+    mock_cache.delete.assert_called_once_with(
+        f"integration_details.v2.{integration_id}",
+        f"outbound_detail.v2.{integration_id}",
+        f"inbound_detail.v2.{integration_id}",
+    )
+    mock_cache.publish.assert_called_once_with(settings.CONFIG_INVALIDATION_CHANNEL, integration_id)
+
+
+@pytest.mark.asyncio
+async def test_integration_updated_event_invalidates_cached_config(
+        mocker, mock_config_cache, destination_integration_v2
+):
+    utils.remember_integration_details(INTEGRATION_ID, destination_integration_v2)
+    mock_dispatch = mocker.patch("core.services.process_transformer_event_v2")
+    event = system_events.IntegrationUpdated(
+        payload=schemas_v2.IntegrationConfigChanges(id=INTEGRATION_ID, changes={"base_url": "https://new"})
+    )
+
+    await process_request(_as_pubsub_request(mocker, event))
+
+    _assert_invalidated(mock_config_cache)
+    assert utils.recall_integration_details(INTEGRATION_ID) is None
+    mock_dispatch.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_action_config_event_invalidates_its_integration(mocker, mock_config_cache):
+    event = system_events.ActionConfigUpdated(
+        payload=schemas_v2.ActionConfigChanges(
+            id="e6b9b0a5-6e3f-4d8b-9f5b-7a1c1a2b3c4d", integration_id=INTEGRATION_ID,
+            changes={"data": {"password": "rotated"}},
+        )
+    )
+
+    await process_request(_as_pubsub_request(mocker, event))
+
+    _assert_invalidated(mock_config_cache)
+
+
+@pytest.mark.asyncio
+async def test_integration_deleted_event_invalidates_cached_config(mocker, mock_config_cache):
+    event = system_events.IntegrationDeleted(
+        payload=schemas_v2.IntegrationDeletionDetails(id=INTEGRATION_ID, alt_id=INTEGRATION_ID)
+    )
+
+    await process_request(_as_pubsub_request(mocker, event))
+
+    _assert_invalidated(mock_config_cache)
+
+
+@pytest.mark.asyncio
+async def test_invalidation_errors_propagate_so_the_event_is_redelivered(mocker, mock_config_cache):
+    mock_config_cache.delete.side_effect = redis_exceptions.ConnectionError("redis is down")
+    event = system_events.IntegrationUpdated(
+        payload=schemas_v2.IntegrationConfigChanges(id=INTEGRATION_ID)
+    )
+
+    with pytest.raises(redis_exceptions.ConnectionError):
+        await process_request(_as_pubsub_request(mocker, event))
+
+
+def test_config_event_without_integration_id_is_ignored(mock_config_cache):
+    config_invalidation.handle_config_event({"event_type": "IntegrationUpdated", "payload": {}})
+
+    mock_config_cache.delete.assert_not_called()
+
+
+def test_delivery_events_are_not_config_events():
+    assert not config_invalidation.is_config_event({"event_type": "EventTransformedER"})
+    assert not config_invalidation.is_config_event(None)
+    assert config_invalidation.is_config_event({"event_type": "IntegrationCreated"})
+
+
+def test_listener_message_drops_in_process_copies(mock_config_cache, destination_integration_v2):
+    utils.remember_integration_details(INTEGRATION_ID, destination_integration_v2)
+    utils.remember_integration_details("other-integration", destination_integration_v2)
+
+    config_invalidation._on_invalidation_message({"type": "message", "data": INTEGRATION_ID.encode()})
+    assert utils.recall_integration_details(INTEGRATION_ID) is None
+    assert utils.recall_integration_details("other-integration") is not None
+
+    config_invalidation._on_invalidation_message({"type": "message", "data": b"*"})
+    assert utils.recall_integration_details("other-integration") is None
+
+
+def test_listener_starts_once(mocker):
+    mock_thread = mocker.patch("core.config_invalidation.threading.Thread")
+    mock_thread.return_value.is_alive.return_value = True
+    mocker.patch.object(config_invalidation, "_listener", None)
+
+    config_invalidation.start_listener()
+    config_invalidation.start_listener()
+
+    mock_thread.assert_called_once()
+    mock_thread.return_value.start.assert_called_once()
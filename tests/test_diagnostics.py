@@ -0,0 +1,65 @@
+import logging
+
+import pytest
+
+import main as main_module
+from core import diagnostics, settings
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def diagnostic_records():
+    handler = _Records()
+    diagnostics.logger.addHandler(handler)
+    yield handler.records
+    diagnostics.logger.removeHandler(handler)
+
+
+@pytest.fixture
+def diagnostics_enabled():
+    level = diagnostics.logger.level
+    diagnostics.logger.setLevel(logging.DEBUG)
+    yield
+    diagnostics.logger.setLevel(level)
+
+
+def test_dump_is_off_by_default_and_renders_nothing(mocker, diagnostic_records):
+    render = mocker.patch.object(diagnostics, "bounded_repr")
+
+    diagnostics.dump("Request received", body=b"{}")
+
+    assert diagnostic_records == []
+    render.assert_not_called()
+
+
+def test_dump_logs_capped_fields_when_enabled(mocker, diagnostics_enabled, diagnostic_records):
+    mocker.patch.object(settings, "DIAGNOSTICS_MAX_FIELD_BYTES", 16)
+
+    diagnostics.dump("Request received", body=b"x" * 1000, headers={"a": "b"})
+
+    (record,) = diagnostic_records
+    assert record.levelno == logging.DEBUG
+    assert record.diagnostic_title == "Request received"
+    assert record.diagnostic_fields == ["body", "headers"]
+    message = record.getMessage()
+    assert "body: b'xxxxxxxxxxxxxx...[truncated]" in message
+    assert "headers: {'a': 'b'}" in message
+
+
+def test_main_does_not_print_the_request(mocker, capsys):
+    mocker.patch.object(main_module, "process_request", mocker.AsyncMock())
+    request = mocker.MagicMock()
+    request.data = b'{"message": "secret-payload"}'
+    request.headers = {}
+
+    main_module.main(request)
+
+    assert "secret-payload" not in capsys.readouterr().out
@@ -16,6 +16,9 @@ from core.dispatchers import (
 from core.errors import DispatcherException
 from core.event_handlers import dispatch_transformed_observation_v2
 from gundi_core.schemas.v2 import ERObservation
+from tools import standins
+
+from .conftest import async_return
 
 
 async def _test_dispatcher_on_errors(
@@ -372,3 +375,33 @@ async def test_batch_dispatcher_posts_full_list_not_just_last_item(
     assert isinstance(posted, list)
     assert len(posted) == 3
     assert [o["manufacturer_id"] for o in posted] == ["device-0", "device-1", "device-2"]
+
+
+@pytest.mark.asyncio
+async def test_misconfigured_destination_reports_every_failed_delivery(
+        mocker,
+        event_v2_transformed_er,
+        event_v2_attributes,
+        mock_gundi_client_v2,
+        mock_publish_event,
+        mock_get_cloud_storage,
+        destination_integration_v2,
+):
+    # No ER authentication settings: every delivery fails the same way, and
+    # each must still reach the portal as a failure event
+    misconfigured = destination_integration_v2.copy(update={"configurations": []})
+    mock_gundi_client_v2.get_integration_details.return_value = async_return(misconfigured)
+    mocker.patch("core.utils._cache_db", standins.LocalRedis())
+    mocker.patch("core.utils.GundiClient", mocker.MagicMock(return_value=mock_gundi_client_v2))
+    mocker.patch("core.event_handlers.publish_event", mock_publish_event)
+    mocker.patch("core.dispatchers.get_cloud_storage", mock_get_cloud_storage)
+
+    for _ in range(2):
+        with pytest.raises(DispatcherException):
+            await dispatch_transformed_observation_v2(
+                observation=event_v2_transformed_er,
+                attributes=event_v2_attributes
+            )
+
+    published = [c.kwargs["event"] for c in mock_publish_event.mock_calls]
+    assert [type(e) for e in published] == [dispatcher_events.ObservationDeliveryFailed] * 2
@@ -198,6 +198,59 @@ def test_cache_secret_mismatch_is_a_miss(mocker):
     assert er_auth.read_cached_token(TOKEN_URL, USERNAME, PASSWORD) is None
 
 
+def test_read_cached_token_remembers_the_token_in_process(mocker):
+    entry, expires_at = _cache_entry()
+    mock_cache = mocker.MagicMock()
+    mock_cache.get.return_value = entry
+    mocker.patch("core.er_auth._cache_db", mock_cache)
+
+    assert er_auth.read_cached_token(TOKEN_URL, USERNAME, PASSWORD) == ("cached-token", expires_at)
+    assert er_auth.read_cached_token(TOKEN_URL, USERNAME, PASSWORD) == ("cached-token", expires_at)
+
+    mock_cache.get.assert_called_once()
+    # A different password never sees the remembered token
+    assert er_auth.read_cached_token(TOKEN_URL, USERNAME, "wrong-password") is None
+
+
+def test_remembered_token_is_rechecked_against_the_cache(mocker):
+    entry, _ = _cache_entry()
+    mock_cache = mocker.MagicMock()
+    mock_cache.get.return_value = entry
+    mocker.patch("core.er_auth._cache_db", mock_cache)
+    er_auth.read_cached_token(TOKEN_URL, USERNAME, PASSWORD)
+
+    mocker.patch("core.er_auth.time.monotonic", return_value=10 ** 9)  # past the memory TTL
+    mock_cache.get.return_value = None  # invalidated by another instance
+    assert er_auth.read_cached_token(TOKEN_URL, USERNAME, PASSWORD) is None
+
+
+def test_invalidate_cached_token_forgets_the_remembered_token(mocker):
+    mock_cache = mocker.MagicMock()
+    mocker.patch("core.er_auth._cache_db", mock_cache)
+    expires_at = datetime.now(tz=timezone.utc) + timedelta(hours=47)
+    er_auth.write_cached_token(TOKEN_URL, USERNAME, PASSWORD, "rejected-token", expires_at)
+    mock_cache.get.return_value = None
+
+    er_auth.invalidate_cached_token(TOKEN_URL, USERNAME, PASSWORD)
+
+    assert er_auth.read_cached_token(TOKEN_URL, USERNAME, PASSWORD) is None
+
+
+def test_cache_key_and_cipher_are_derived_once_per_credential(mocker):
+    er_auth._derive_cache_entry_keys.cache_clear()
+    mock_fernet = mocker.patch("core.er_auth.Fernet", wraps=Fernet)
+
+    for _ in range(3):
+        assert er_auth._token_cache_key(TOKEN_URL, USERNAME, PASSWORD) == EXPECTED_CACHE_KEY
+        er_auth._entry_cipher(TOKEN_URL, USERNAME, PASSWORD)
+    er_auth._entry_cipher(TOKEN_URL, USERNAME, "other-password")
+    mocker.patch.object(er_auth.settings, "ER_TOKEN_CACHE_SECRET", "rotated-secret")
+    er_auth._entry_cipher(TOKEN_URL, USERNAME, PASSWORD)
+
+    assert mock_fernet.call_count == 3  # one per distinct (credentials, secret)
+    er_auth._derive_cache_entry_keys.cache_clear()
+
+
 def _make_client():
     return er_auth.TokenCachingAsyncERClient(
         service_root="https://fake-site.pamdas.org/api/v1.0",
@@ -363,6 +416,26 @@ async def test_auth_headers_treats_nearly_expired_cache_entry_as_miss(
     assert mock_post.await_count == 1
 
 
+@pytest.mark.asyncio
+async def test_auth_headers_reads_the_cache_past_a_remembered_token_near_expiry(
+    mocker, mock_token_cache
+):
+    # This instance remembers a token valid for 30s; another one already
+    # logged in and cached a fresh token
+    expires_at = datetime.now(tz=timezone.utc) + timedelta(seconds=30)
+    er_auth._remember_token(TOKEN_URL, USERNAME, PASSWORD, "nearly-expired", expires_at)
+    mock_token_cache.get.return_value, _ = _cache_entry(token="token-from-other-instance")
+    client = _make_client()
+    mock_post = mocker.AsyncMock(return_value=_token_response(200))
+    mocker.patch.object(client._http_session, "post", mock_post)
+
+    headers = await client.auth_headers()
+
+    assert headers["Authorization"] == "Bearer token-from-other-instance"
+    assert mock_token_cache.get.call_count == 1
+    mock_post.assert_not_awaited()
+
+
 @pytest.mark.asyncio
 async def test_auth_headers_reuses_in_memory_auth_without_touching_cache(
     mocker, mock_token_cache
@@ -378,6 +451,22 @@ async def test_auth_headers_reuses_in_memory_auth_without_touching_cache(
     assert mock_token_cache.get.call_count == 1
 
 
+@pytest.mark.asyncio
+async def test_auth_headers_times_token_resolution_only_when_it_resolves(
+    mocker, mock_token_cache
+):
+    stage_duration = mocker.patch.object(er_auth.stage_timing, "_stage_duration")
+    client = _make_client()
+    mock_post = mocker.AsyncMock(return_value=_token_response(200))
+    mocker.patch.object(client._http_session, "post", mock_post)
+
+    await client.auth_headers()  # logs in
+    await client.auth_headers()  # already valid: nothing to time
+
+    assert stage_duration.record.call_count == 1
+    assert stage_duration.record.call_args.args[1]["stage"] == "token_resolution"
+
+
 @pytest.mark.asyncio
 async def test_auth_headers_with_static_token_never_touches_cache(
     mocker, mock_token_cache
@@ -439,6 +528,198 @@ async def test_auth_headers_discards_cached_token_with_null_access_token(
     assert mock_post.await_count == 1
 
 
+@pytest.mark.asyncio
+async def test_auth_headers_schedules_refresh_for_token_near_expiry(mocker, mock_token_cache):
+    # Past the refresh threshold but well above the minimum remaining validity
+    entry, _ = _cache_entry(token="aging-token", expires_in_hours=0.5)
+    mock_token_cache.get.return_value = entry
+    mock_schedule = mocker.patch("core.er_auth.schedule_token_refresh")
+    client = _make_client()
+    mock_post = mocker.AsyncMock()
+    mocker.patch.object(client._http_session, "post", mock_post)
+
+    headers = await client.auth_headers()
+
+    assert headers["Authorization"] == "Bearer aging-token"  # still served meanwhile
+    mock_schedule.assert_called_once_with(client)
+    mock_post.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_auth_headers_does_not_refresh_fresh_or_when_disabled(mocker, mock_token_cache):
+    mock_schedule = mocker.patch("core.er_auth.schedule_token_refresh")
+    entry, _ = _cache_entry(expires_in_hours=47)
+    mock_token_cache.get.return_value = entry
+    await _make_client().auth_headers()
+
+    mocker.patch.object(er_auth.settings, "ER_TOKEN_REFRESH_AHEAD_SECONDS", 0)
+    entry, _ = _cache_entry(expires_in_hours=0.5)
+    mock_token_cache.get.return_value = entry
+    await _make_client().auth_headers()
+
+    mock_schedule.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_auth_headers_logs_in_under_login_lock_and_releases_it(mocker, mock_token_cache):
+    mock_token_cache.set.return_value = True
+    client = _make_client()
+    mock_post = mocker.AsyncMock(return_value=_token_response(200))
+    mocker.patch.object(client._http_session, "post", mock_post)
+
+    await client.auth_headers()
+
+    lock_key, lock_token = mock_token_cache.set.call_args.args
+    assert lock_key == f"{EXPECTED_CACHE_KEY}.login"
+    assert mock_token_cache.set.call_args.kwargs == {"ex": er_auth.LOGIN_LOCK_TTL_SECONDS, "nx": True}
+    mock_token_cache.eval.assert_called_once_with(
+        er_auth._RELEASE_LOCK_SCRIPT, 1, lock_key, lock_token
+    )
+    assert mock_post.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_auth_headers_waits_for_concurrent_login_instead_of_logging_in(
+    mocker, mock_token_cache, fast_backoff
+):
+    entry, _ = _cache_entry(token="token-from-other-instance")
+    # Miss, then two polls while the other instance is still logging in
+    mock_token_cache.get.side_effect = [None, None, None, entry]
+    mock_token_cache.set.return_value = None  # lock held elsewhere
+    client = _make_client()
+    mock_post = mocker.AsyncMock()
+    mocker.patch.object(client._http_session, "post", mock_post)
+
+    headers = await client.auth_headers()
+
+    assert headers["Authorization"] == "Bearer token-from-other-instance"
+    assert fast_backoff.await_count == 3
+    mock_post.assert_not_awaited()
+    mock_token_cache.eval.assert_not_called()  # never held the lock
+
+
+@pytest.mark.asyncio
+async def test_auth_headers_logs_in_after_bounded_wait_for_concurrent_login(
+    mocker, mock_token_cache, fast_backoff
+):
+    mock_token_cache.set.return_value = None  # lock held by an instance that died
+    client = _make_client()
+    mock_post = mocker.AsyncMock(return_value=_token_response(200))
+    mocker.patch.object(client._http_session, "post", mock_post)
+
+    headers = await client.auth_headers()
+
+    assert headers["Authorization"] == "Bearer new-token"
+    assert fast_backoff.await_count == er_auth.LOGIN_WAIT_MAX_SECONDS / er_auth.LOGIN_WAIT_POLL_SECONDS
+    assert mock_post.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_auth_headers_logs_in_when_login_lock_is_unavailable(mocker, mock_token_cache):
+    mock_token_cache.set.side_effect = redis_exceptions.ConnectionError("redis is down")
+    client = _make_client()
+    mock_post = mocker.AsyncMock(return_value=_token_response(200))
+    mocker.patch.object(client._http_session, "post", mock_post)
+
+    headers = await client.auth_headers()
+
+    assert headers["Authorization"] == "Bearer new-token"
+
+
+def _client_kwargs():
+    return {
+        "service_root": "https://fake-site.pamdas.org",
+        "username": USERNAME,
+        "password": PASSWORD,
+        "token_url": TOKEN_URL,
+        "client_id": "das_web_client",
+        "provider_key": "fake-provider",
+    }
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_logs_in_under_the_refresh_lock(mocker, mock_token_cache):
+    mock_token_cache.set.return_value = True
+    mock_login = mocker.patch.object(er_auth.TokenCachingAsyncERClient, "login")
+
+    await er_auth.refresh_token(_client_kwargs())
+
+    mock_token_cache.set.assert_any_call(
+        f"{EXPECTED_CACHE_KEY}.refresh", "1", ex=er_auth.REFRESH_LOCK_TTL_SECONDS, nx=True
+    )
+    # Also holds the login mutex, so it never races a request-path login
+    assert mock_token_cache.set.call_args.args[0] == f"{EXPECTED_CACHE_KEY}.login"
+    mock_token_cache.eval.assert_called_once()
+    mock_login.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_skips_login_while_a_login_is_in_progress(mocker, mock_token_cache):
+    mock_token_cache.set.side_effect = [True, None]  # refresh lock taken, login lock held
+    mock_login = mocker.patch.object(er_auth.TokenCachingAsyncERClient, "login")
+
+    await er_auth.refresh_token(_client_kwargs())
+
+    mock_login.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_skips_login_when_another_instance_holds_the_lock(
+    mocker, mock_token_cache
+):
+    mock_token_cache.set.return_value = None
+    mock_login = mocker.patch.object(er_auth.TokenCachingAsyncERClient, "login")
+
+    await er_auth.refresh_token(_client_kwargs())
+
+    mock_login.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_adopts_a_token_another_instance_already_refreshed(
+    mocker, mock_token_cache
+):
+    entry, expires_at = _cache_entry(token="refreshed-elsewhere", expires_in_hours=47)
+    mock_token_cache.get.return_value = entry
+    mock_login = mocker.patch.object(er_auth.TokenCachingAsyncERClient, "login")
+
+    await er_auth.refresh_token(_client_kwargs())
+
+    mock_login.assert_not_awaited()
+    mock_token_cache.set.assert_not_called()  # no lock taken
+    assert er_auth.read_cached_token(TOKEN_URL, USERNAME, PASSWORD) == ("refreshed-elsewhere", expires_at)
+
+
+def test_schedule_token_refresh_runs_once_per_credential_in_process(mocker):
+    mock_thread_class = mocker.patch("core.er_auth.threading.Thread")
+    client = _make_client()
+
+    er_auth.schedule_token_refresh(client)
+    er_auth.schedule_token_refresh(_make_client())  # same credentials, already in flight
+
+    mock_thread_class.assert_called_once()
+    target = mock_thread_class.call_args.kwargs["target"]
+    client_kwargs, cache_key = mock_thread_class.call_args.kwargs["args"]
+    assert cache_key == EXPECTED_CACHE_KEY
+    assert client_kwargs["token_url"] == TOKEN_URL
+
+    # Once the refresh finishes, a later threshold crossing may start another
+    mocker.patch("core.er_auth.refresh_token", mocker.AsyncMock())
+    target(client_kwargs, cache_key)
+    er_auth.schedule_token_refresh(client)
+    assert mock_thread_class.call_count == 2
+    er_auth._refreshes_in_flight.clear()
+
+
+def test_background_refresh_failure_is_swallowed(mocker):
+    mocker.patch("core.er_auth.refresh_token", mocker.AsyncMock(side_effect=httpx.ConnectError("down")))
+    er_auth._refreshes_in_flight.add(EXPECTED_CACHE_KEY)
+
+    er_auth._run_refresh(_client_kwargs(), EXPECTED_CACHE_KEY)  # must not raise
+
+    assert EXPECTED_CACHE_KEY not in er_auth._refreshes_in_flight
+
+
 def test_make_er_client_v1_returns_token_caching_client():
     config = SimpleNamespace(
         endpoint="https://fake-site.pamdas.org",
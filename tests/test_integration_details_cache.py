@@ -0,0 +1,291 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from redis import exceptions as redis_exceptions
+
+from core import settings, utils
+from core.errors import IntegrationUnavailable, ReferenceDataError
+
+INTEGRATION_ID = "338225f3-91f9-4fe1-b013-353a229ce504"
+CACHE_KEY = f"integration_details.v2.{INTEGRATION_ID}"
+
+
+@pytest.fixture
+def mock_config_cache(mocker):
+    mock_cache = mocker.MagicMock()
+    mocker.patch("core.utils._cache_db", mock_cache)
+    return mock_cache
+
+
+def _cache_entry(integration, fetched_ago, fresh_for):
+    now = time.time()
+    return utils.encode_integration_details(
+        integration, fetched_at=now - fetched_ago, fresh_until=now + fresh_for
+    )
+
+
+@pytest.mark.asyncio
+async def test_fresh_cached_details_are_served_without_refresh(
+        mocker, mock_config_cache, mock_gundi_client_v2_class, destination_integration_v2
+):
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mock_schedule = mocker.patch("core.utils.schedule_integration_details_refresh")
+    mock_config_cache.get.return_value = _cache_entry(destination_integration_v2, fetched_ago=10, fresh_for=50)
+
+    integration = await utils.get_integration_details(integration_id=INTEGRATION_ID)
+
+    assert integration.id == destination_integration_v2.id
+    mock_schedule.assert_not_called()
+    mock_gundi_client_v2_class.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_stale_cached_details_are_served_while_refreshed(
+        mocker, mock_config_cache, mock_gundi_client_v2_class, destination_integration_v2
+):
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mock_schedule = mocker.patch("core.utils.schedule_integration_details_refresh")
+    mock_config_cache.get.return_value = _cache_entry(destination_integration_v2, fetched_ago=90, fresh_for=-30)
+
+    integration = await utils.get_integration_details(integration_id=INTEGRATION_ID)
+
+    assert integration.id == destination_integration_v2.id
+    mock_schedule.assert_called_once()
+    assert mock_schedule.call_args.args[0] == INTEGRATION_ID
+    mock_gundi_client_v2_class.assert_not_called()  # nothing on the request path
+
+
+@pytest.mark.asyncio
+async def test_details_past_hard_ttl_are_fetched_and_cached_with_soft_ttl(
+        mocker, mock_config_cache, mock_gundi_client_v2_class, destination_integration_v2
+):
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("core.utils._cache_ttl", 60)
+    mocker.patch.object(settings, "INTEGRATION_DETAILS_STALE_TTL_SECONDS", 3600)
+    mock_config_cache.get.return_value = None  # expired from Redis
+
+    integration = await utils.get_integration_details(integration_id=INTEGRATION_ID)
+
+    assert integration.id == destination_integration_v2.id
+    key, ttl, value = mock_config_cache.setex.call_args.args
+    assert (key, ttl) == (CACHE_KEY, 3660)
+    cached, fetched_at, fresh_until = utils.decode_integration_details(value)
+    assert cached.id == destination_integration_v2.id
+    assert fresh_until - fetched_at == pytest.approx(60)
+
+
+@pytest.mark.asyncio
+async def test_details_are_cached_under_a_key_of_their_own_layout(
+        mocker, mock_config_cache, mock_gundi_client_v2_class, destination_integration_v2
+):
+    # Not integration_details.<id>, where earlier revisions keep bare JSON
+    # for 60s: neither reads the other's entries, whichever is rolled out
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mock_config_cache.get.return_value = None
+
+    await utils.get_integration_details(integration_id=INTEGRATION_ID)
+
+    mock_config_cache.get.assert_called_once_with(CACHE_KEY)
+    assert mock_config_cache.setex.call_args.args[0] == CACHE_KEY
+
+
+def test_refresh_starts_once_and_only_under_the_lock(mocker, mock_config_cache):
+    mock_thread_class = mocker.patch("core.utils.threading.Thread")
+    mock_config_cache.set.return_value = True
+
+    utils.schedule_integration_details_refresh(INTEGRATION_ID, fetched_at=0)
+    utils.schedule_integration_details_refresh(INTEGRATION_ID, fetched_at=0)  # already in flight
+
+    mock_config_cache.set.assert_called_once_with(
+        f"{CACHE_KEY}.refresh", "1", nx=True, ex=utils.DETAIL_REFRESH_LOCK_TTL_SECONDS
+    )
+    mock_thread_class.assert_called_once()
+    utils._detail_refreshes_in_flight.clear()
+
+
+def test_refresh_is_skipped_when_another_instance_holds_the_lock(mocker, mock_config_cache):
+    mock_thread_class = mocker.patch("core.utils.threading.Thread")
+    mock_config_cache.set.return_value = None
+
+    utils.schedule_integration_details_refresh(INTEGRATION_ID, fetched_at=0)
+
+    mock_thread_class.assert_not_called()
+    assert INTEGRATION_ID not in utils._detail_refreshes_in_flight
+
+
+def test_successful_refresh_replaces_the_stale_entry(
+        mocker, mock_config_cache, mock_gundi_client_v2_class, destination_integration_v2
+):
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+
+    utils._run_integration_details_refresh(INTEGRATION_ID, fetched_at=time.time() - 90)
+
+    assert mock_config_cache.setex.call_args.args[0] == CACHE_KEY
+    assert utils.recall_integration_details(INTEGRATION_ID).id == destination_integration_v2.id
+    mock_config_cache.expire.assert_not_called()
+
+
+def test_failed_refresh_extends_the_stale_entry(
+        mocker, mock_config_cache, mock_gundi_client_v2_class_with_internal_exception
+):
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class_with_internal_exception)
+    mocker.patch.object(settings, "INTEGRATION_DETAILS_STALE_TTL_SECONDS", 3600)
+
+    utils._run_integration_details_refresh(INTEGRATION_ID, fetched_at=time.time() - 90)
+
+    mock_config_cache.setex.assert_not_called()
+    mock_config_cache.expire.assert_called_once_with(CACHE_KEY, 3600)
+
+
+def test_failed_refresh_does_not_extend_entries_past_max_stale_age(mocker, mock_config_cache):
+    mocker.patch("core.utils.fetch_integration_details", side_effect=ReferenceDataError("portal down"))
+    mocker.patch.object(settings, "INTEGRATION_DETAILS_MAX_STALE_SECONDS", 86400)
+
+    utils._run_integration_details_refresh(INTEGRATION_ID, fetched_at=time.time() - 90000)
+
+    mock_config_cache.expire.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_many_integration_details_resolved_with_one_mget(
+        mocker, mock_config_cache, mock_gundi_client_v2_class, destination_integration_v2
+):
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    utils.remember_integration_details("in-memory", destination_integration_v2)
+    fresh_entry = _cache_entry(destination_integration_v2, fetched_ago=10, fresh_for=50)
+    mock_config_cache.mget.return_value = [fresh_entry, None]
+
+    found = await utils.get_many_integration_details(["in-memory", "cached", "missing", "cached"])
+
+    assert list(found) == ["in-memory", "cached", "missing"]
+    mock_config_cache.mget.assert_called_once_with(["integration_details.v2.cached", "integration_details.v2.missing"])
+    mock_config_cache.get.assert_not_called()
+    portal = mock_gundi_client_v2_class.return_value
+    assert [c.kwargs["integration_id"] for c in portal.get_integration_details.call_args_list] == ["missing"]
+    assert mock_config_cache.setex.call_args.args[0] == "integration_details.v2.missing"
+
+
+@pytest.mark.asyncio
+async def test_many_integration_details_leave_out_portal_failures(
+        mocker, mock_config_cache, destination_integration_v2
+):
+    mock_config_cache.mget.side_effect = redis_exceptions.ConnectionError("redis is down")
+    mocker.patch(
+        "core.utils.fetch_integration_details",
+        side_effect=[ReferenceDataError("not found"), destination_integration_v2],
+    )
+
+    found = await utils.get_many_integration_details(["deleted", "dest-a"])
+
+    assert list(found) == ["dest-a"]
+
+
+@pytest.mark.asyncio
+async def test_many_integration_details_bound_portal_concurrency(mocker, mock_config_cache):
+    mock_config_cache.mget.return_value = [None] * 6
+    in_flight = []
+    peak = 0
+
+    async def slow_fetch(integration_id):
+        nonlocal peak
+        in_flight.append(integration_id)
+        peak = max(peak, len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(integration_id)
+        return None
+
+    mocker.patch("core.utils.fetch_integration_details", slow_fetch)
+
+    await utils.get_many_integration_details([f"dest-{i}" for i in range(6)], max_concurrency=2)
+
+    assert peak == 2
+
+
+def _portal_not_found(mocker):
+    request = httpx.Request("GET", f"https://gundi-api.test/v2/integrations/{INTEGRATION_ID}/")
+    mock_client = mocker.MagicMock()
+    mock_client.get_integration_details.side_effect = httpx.HTTPStatusError(
+        "Not found", request=request, response=httpx.Response(404, request=request)
+    )
+    mocker.patch("core.utils.GundiClient", return_value=mock_client)
+    return mock_client
+
+
+@pytest.mark.asyncio
+async def test_deleted_integration_is_remembered_as_unavailable(mocker, mock_config_cache):
+    portal = _portal_not_found(mocker)
+    mocker.patch.object(settings, "INTEGRATION_UNAVAILABLE_CACHE_TTL_SECONDS", 300)
+    mock_config_cache.get.return_value = None
+
+    with pytest.raises(IntegrationUnavailable):
+        await utils.get_integration_details(integration_id=INTEGRATION_ID)
+
+    key, ttl, tombstone = mock_config_cache.setex.call_args.args
+    assert (key, ttl) == (CACHE_KEY, 300)
+    # Later messages fail without asking the portal again
+    mock_config_cache.get.return_value = tombstone
+    with pytest.raises(IntegrationUnavailable, match="Not found"):
+        await utils.get_integration_details(integration_id=INTEGRATION_ID)
+    assert portal.get_integration_details.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_portal_errors_other_than_not_found_are_not_remembered(
+        mocker, mock_config_cache, mock_gundi_client_v2_class_with_internal_exception
+):
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class_with_internal_exception)
+    mock_config_cache.get.return_value = None
+
+    with pytest.raises(ReferenceDataError) as e_info:
+        await utils.get_integration_details(integration_id=INTEGRATION_ID)
+
+    assert e_info.type == ReferenceDataError
+    mock_config_cache.setex.assert_not_called()
+
+
+def test_unavailable_integrations_are_not_remembered_with_zero_ttl(mocker, mock_config_cache):
+    mocker.patch.object(settings, "INTEGRATION_UNAVAILABLE_CACHE_TTL_SECONDS", 0)
+
+    utils.mark_integration_unavailable(INTEGRATION_ID, reason="deleted")
+
+    mock_config_cache.setex.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_many_integration_details_skip_unavailable_integrations(mocker, mock_config_cache):
+    mock_fetch = mocker.patch("core.utils.fetch_integration_details")
+    tombstone = utils.cache_codec.dumps_tombstone(unavailable="deleted")
+    mock_config_cache.mget.return_value = [tombstone]
+
+    assert await utils.get_many_integration_details([INTEGRATION_ID]) == {}
+    mock_fetch.assert_not_called()
+
+
+def test_refresh_of_a_deleted_integration_does_not_extend_it(mocker, mock_config_cache):
+    _portal_not_found(mocker)
+
+    utils._run_integration_details_refresh(INTEGRATION_ID, fetched_at=time.time() - 90)
+
+    assert mock_config_cache.setex.call_args.args[0] == CACHE_KEY  # the unavailable marker
+    mock_config_cache.expire.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("reader,portal_method,key_prefix", [
+    (utils.get_outbound_config_detail, "get_outbound_integration", "outbound_detail.v2"),
+    (utils.get_inbound_integration_detail, "get_inbound_integration", "inbound_detail.v2"),
+])
+async def test_unreadable_cached_config_is_fetched_again(
+        mocker, mock_config_cache, mock_gundi_client_class, reader, portal_method, key_prefix
+):
+    mocker.patch("core.utils.PortalApi", mock_gundi_client_class)
+    mock_config_cache.get.return_value = b"\x93\x01"  # truncated msgpack
+
+    config = await reader(INTEGRATION_ID)
+
+    assert config
+    mock_config_cache.get.assert_called_once_with(f"{key_prefix}.{INTEGRATION_ID}")
+    assert getattr(mock_gundi_client_class.return_value, portal_method).call_count == 1
+    assert mock_config_cache.setex.call_args.args[0] == f"{key_prefix}.{INTEGRATION_ID}"
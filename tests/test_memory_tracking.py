@@ -0,0 +1,85 @@
+import tracemalloc
+
+import pytest
+
+from core import memory_tracking, settings
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def tracking_enabled(mocker):
+    mocker.patch.object(settings, "MEMORY_TRACKING_ENABLED", True)
+
+
+@pytest.fixture
+def recording_span(mocker):
+    span = mocker.MagicMock()
+    span.is_recording.return_value = True
+    return span
+
+
+def _peaks(span):
+    return {c.args[0]: c.args[1] for c in span.set_attribute.call_args_list}
+
+
+def test_nothing_is_traced_when_disabled(recording_span):
+    with memory_tracking.message(is_batch=True), memory_tracking.per_message(recording_span):
+        with memory_tracking.tracked("parse") as stage:
+            assert not tracemalloc.is_tracing()
+
+    assert stage is None
+    recording_span.set_attribute.assert_not_called()
+
+
+def test_peaks_of_batch_stages(tracking_enabled, recording_span):
+    with memory_tracking.message(is_batch=True), memory_tracking.per_message(recording_span):
+        with memory_tracking.tracked("serialize"):
+            assert tracemalloc.is_tracing()
+            held = bytearray(1 * MB)
+            transient = bytearray(2 * MB)
+            del transient
+        assert not tracemalloc.is_tracing()
+        with memory_tracking.tracked("parse"):
+            pass
+    del held
+
+    peaks = _peaks(recording_span)
+    assert 3 * MB <= peaks["memory.peak_bytes.serialize"] < 3.5 * MB
+    assert peaks["memory.peak_bytes.parse"] < 0.5 * MB
+    assert not tracemalloc.is_tracing()
+
+
+def test_a_repeated_stage_keeps_its_highest_peak(tracking_enabled, recording_span):
+    with memory_tracking.message(is_batch=True), memory_tracking.per_message(recording_span):
+        for size in (3 * MB, 1 * MB):
+            with memory_tracking.tracked("post"):
+                bytearray(size)
+
+    assert 3 * MB <= _peaks(recording_span)["memory.peak_bytes.post"] < 3.5 * MB
+
+
+def test_only_batch_envelopes_are_tracked(tracking_enabled, recording_span):
+    with memory_tracking.message(is_batch=False), memory_tracking.per_message(recording_span):
+        with memory_tracking.tracked("parse") as stage:
+            assert not tracemalloc.is_tracing()
+
+    assert stage is None
+    recording_span.set_attribute.assert_not_called()
+
+
+def test_stages_overlapping_another_message_are_left_out(tracking_enabled, recording_span):
+    with memory_tracking.message(is_batch=True), memory_tracking.per_message(recording_span):
+        with memory_tracking.message(is_batch=False):
+            with memory_tracking.tracked("parse"):
+                assert not tracemalloc.is_tracing()
+        with memory_tracking.tracked("serialize"):
+            # Another message comes and goes while the stage is traced
+            with memory_tracking.message(is_batch=False):
+                pass
+        with memory_tracking.tracked("post"):
+            with memory_tracking.tracked("nested"):
+                pass
+
+    assert set(_peaks(recording_span)) == {"memory.peak_bytes.post"}
+    assert not tracemalloc.is_tracing()
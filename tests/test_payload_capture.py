@@ -0,0 +1,109 @@
+import datetime
+
+import pytest
+from gundi_core.schemas import v2 as schemas_v2
+
+from core import settings
+from core.tracing import payload_capture
+from core.tracing.payload_capture import TRUNCATION_MARKER, bounded_repr, set_payload_attribute
+
+
+@pytest.fixture
+def recording_span(mocker):
+    span = mocker.MagicMock()
+    span.is_recording.return_value = True
+    return span
+
+
+@pytest.fixture
+def er_event():
+    return schemas_v2.EREvent(
+        title="Animal Detected",
+        event_type="wildlife_sighting_rep",
+        time=datetime.datetime(2024, 7, 4, 18, 9, 12, tzinfo=datetime.timezone.utc),
+        location={"longitude": 13.783064, "latitude": 13.688635},
+        event_details={"species": "lion", "count": [1, 2]},
+    )
+
+
+def test_bounded_repr_matches_repr_when_under_the_cap(er_event):
+    raw = {"event_type": "EventTransformedER", "payload": {"ids": (1, "a"), "ok": None}}
+
+    assert bounded_repr(er_event, 10_000) == repr(er_event)
+    assert bounded_repr(raw, 10_000) == repr(raw)
+
+
+def test_bounded_repr_cuts_at_the_byte_cap():
+    text = bounded_repr({"items": list(range(10_000))}, 100)
+
+    assert text.endswith(TRUNCATION_MARKER)
+    assert len(text.encode()) == 100 + len(TRUNCATION_MARKER)
+    assert text.startswith("{'items': [0, 1, 2")
+
+
+def test_bounded_repr_never_splits_a_character():
+    text = bounded_repr("ñ" * 100, 10)
+
+    assert text == "'" + "ñ" * 4 + TRUNCATION_MARKER
+
+
+def test_bounded_repr_only_renders_what_it_keeps():
+    rendered = []
+
+    class Item:
+        def __repr__(self):
+            rendered.append(self)
+            return "item"
+
+    bounded_repr([Item() for _ in range(5000)], 100)
+
+    assert len(rendered) < 30
+
+
+def test_nothing_is_built_for_spans_not_recorded(mocker):
+    span = mocker.MagicMock()
+    span.is_recording.return_value = False
+    render = mocker.patch.object(payload_capture, "bounded_repr")
+
+    set_payload_attribute(span, "payload", {"a": 1})
+
+    render.assert_not_called()
+    span.set_attribute.assert_not_called()
+
+
+def test_truncated_policy_attaches_the_capped_payload(mocker, recording_span):
+    mocker.patch.object(settings, "TRACE_PAYLOAD_CAPTURE", "truncated")
+    mocker.patch.object(settings, "TRACE_PAYLOAD_MAX_BYTES", 20)
+
+    set_payload_attribute(recording_span, "payload", {"items": list(range(100))})
+
+    recording_span.set_attribute.assert_called_once_with(
+        "payload", "{'items': [0, 1, 2, " + TRUNCATION_MARKER
+    )
+
+
+@pytest.mark.parametrize("policy", ["off", "unknown"])
+def test_off_policy_attaches_nothing(mocker, recording_span, policy):
+    mocker.patch.object(settings, "TRACE_PAYLOAD_CAPTURE", policy)
+
+    set_payload_attribute(recording_span, "payload", {"a": 1})
+
+    recording_span.set_attribute.assert_not_called()
+
+
+@pytest.mark.parametrize("draw,attached", [(0.005, True), (0.5, False)])
+def test_sampled_policy_attaches_a_share_of_payloads(mocker, recording_span, draw, attached):
+    mocker.patch.object(settings, "TRACE_PAYLOAD_CAPTURE", "sampled")
+    mocker.patch.object(settings, "TRACE_PAYLOAD_SAMPLE_RATE", 0.01)
+    mocker.patch.object(payload_capture.random, "random", return_value=draw)
+
+    set_payload_attribute(recording_span, "payload", {"a": 1})
+
+    assert recording_span.set_attribute.called is attached
+
+
+def test_bounded_repr_cuts_long_strings_and_bytes():
+    body = b"x" * 10_000_000
+
+    assert bounded_repr(body, 10) == "b'xxxxxxxx" + TRUNCATION_MARKER
+    assert bounded_repr({"text": "y" * 10_000_000}, 12) == "{'text': 'yy" + TRUNCATION_MARKER
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import warnings
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import main as main_module
+from core import portal_clients
+
+
+class FakePortalClient:
+    oauth_token_url = "https://auth.test/token"
+    client_id = "er-dispatcher"
+    audience = "gundi"
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.cached_token = None
+        self.cached_token_expires_at = datetime.min.replace(tzinfo=timezone.utc)
+        self.closed = False
+
+    def login(self):
+        self.cached_token = object()
+        self.cached_token_expires_at = datetime.now(tz=timezone.utc) + timedelta(minutes=5)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_client_is_reused_on_the_same_loop():
+    async with portal_clients.portal_client(FakePortalClient) as first:
+        pass
+    async with portal_clients.portal_client(FakePortalClient) as second:
+        pass
+
+    assert first is second
+    assert first.kwargs == {"connect_timeout": 10, "data_timeout": 20}
+
+
+def test_service_token_is_shared_across_loops():
+    async def login():
+        async with portal_clients.portal_client(FakePortalClient) as client:
+            client.login()
+            return client
+
+    async def reuse():
+        async with portal_clients.portal_client(FakePortalClient) as client:
+            return client
+
+    first = asyncio.run(portal_clients.closing_clients(login()))
+    second = asyncio.run(portal_clients.closing_clients(reuse()))
+
+    assert first is not second
+    assert first.closed and second.closed
+    assert second.cached_token is first.cached_token
+
+
+def test_expired_service_token_is_not_adopted():
+    async def login_expired():
+        async with portal_clients.portal_client(FakePortalClient) as client:
+            client.login()
+            client.cached_token_expires_at = datetime.now(tz=timezone.utc) - timedelta(seconds=1)
+
+    async def reuse():
+        async with portal_clients.portal_client(FakePortalClient) as client:
+            return client
+
+    asyncio.run(portal_clients.closing_clients(login_expired()))
+    client = asyncio.run(portal_clients.closing_clients(reuse()))
+
+    assert client.cached_token is None
+
+
+def test_requests_on_a_thread_share_its_event_loop():
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    first = main_module.run_on_thread_loop(current_loop())
+    second = main_module.run_on_thread_loop(current_loop())
+
+    assert first is second and not first.is_closed()
+
+
+def test_requests_leave_no_tasks_or_async_generators_behind():
+    finalized = []
+    suspended = []  # kept referenced, so only the loop can finalize them
+
+    async def forever(name):
+        try:
+            await asyncio.sleep(3600)
+        finally:
+            finalized.append(name)
+
+    async def numbers():
+        try:
+            yield 1
+            yield 2
+        finally:
+            finalized.append("generator")
+
+    async def request(fail):
+        asyncio.get_running_loop().create_task(forever("task"))
+        suspended.append(numbers())
+        async for _ in suspended[-1]:
+            break
+        await asyncio.sleep(0)
+        if fail:
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        main_module.run_on_thread_loop(request(fail=True))
+    assert sorted(finalized) == ["generator", "task"]
+
+    finalized.clear()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # the loop is still fit for async generators
+        main_module.run_on_thread_loop(request(fail=False))
+    assert sorted(finalized) == ["generator", "task"]
+    loop = main_module._thread_state.loop
+    assert not asyncio.all_tasks(loop) and not loop.is_closed()
+
+
+def test_thread_loops_and_their_clients_are_closed_at_exit():
+    async def lookup():
+        async with portal_clients.portal_client(FakePortalClient) as client:
+            return client, asyncio.get_running_loop()
+
+    results = []
+    worker = threading.Thread(target=lambda: results.append(main_module.run_on_thread_loop(lookup())))
+    worker.start()
+    worker.join()
+    (client, loop), = results
+
+    main_module.close_thread_loops()
+
+    assert client.closed and loop.is_closed()
@@ -5,6 +5,7 @@ import json
 import pytest
 
 from core import settings
+from core.errors import DispatcherException
 from core.services import process_request
 from erclient import ERClientException
 
@@ -29,7 +30,7 @@ def _progress_setex_calls(mock_cache):
     ]
 
 
-def _progress_value(items_count, delivered, gundi_ids=None):
+def _progress_value(items_count, delivered, gundi_ids=None, failed=()):
     """Build a record matching what _make_batch_request's items fingerprint to."""
     from types import SimpleNamespace
 
@@ -37,7 +38,7 @@ def _progress_value(items_count, delivered, gundi_ids=None):
 
     ids = gundi_ids or [f"23ca4b15-18b6-4cf4-9da6-36dd69c6f63{i}" for i in range(items_count)]
     items = [SimpleNamespace(gundi_id=g) for g in ids]
-    return batch_progress.encode(batch_progress.fingerprint(items), delivered, items_count)
+    return batch_progress.encode(batch_progress.fingerprint(items), delivered, items_count, failed)
 
 
 def _make_batch_request(mocker, items_count=3, provider_key="gundi_movebank_abc123"):
@@ -239,10 +240,43 @@ async def test_batch_400_falls_back_to_per_item_and_acks(
     assert item_post_mock.call_count == 3
     assert _dispatched_observation_setex_calls(mock_cache_empty) == []
     # Items 0 and 2 succeeded individually; item 1 failed and keeps its bit
-    # unset in the progress record.
+    # unset in the progress record, set in the failed bitmap instead.
     progress_calls = _progress_setex_calls(mock_cache_empty)
     assert len(progress_calls) == 1
-    assert progress_calls[-1].kwargs["value"][8:] == bytes([0b00000101])
+    assert progress_calls[-1].kwargs["value"][8:] == bytes([0b00000101, 0b00000010])
+
+
+@pytest.mark.asyncio
+async def test_batch_fallback_nacks_on_a_transient_item_error(
+    mocker,
+    mock_cache_empty,
+    mock_gundi_client_v2_class,
+    mock_erclient_class,
+    mock_pubsub_client,
+):
+    mocker.patch("core.utils._cache_db", mock_cache_empty)
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("core.dispatchers.TokenCachingAsyncERClient", mock_erclient_class)
+    mocker.patch("core.utils.pubsub", mock_pubsub_client)
+    mock_failed = mocker.patch("core.event_handlers._publish_item_delivery_failed")
+
+    from tests.conftest import async_return
+    bulk_err = ERClientException("ER error ON POST: bad payload")
+    bulk_err.status_code = 400
+    mock_erclient_class.return_value._post.side_effect = bulk_err
+    item_err = ERClientException("ER error ON POST: service unavailable")
+    item_err.status_code = 503
+    item_post_mock = mock_erclient_class.return_value.post_sensor_observation
+    item_post_mock.side_effect = [async_return(None), item_err, async_return(None)]
+
+    with pytest.raises(DispatcherException):
+        await process_request(_make_batch_request(mocker, items_count=3))
+
+    # Item 1 isn't failed for good: only item 0 is recorded, and the
+    # redelivered envelope posts items 1 and 2 again
+    assert item_post_mock.call_count == 2
+    mock_failed.assert_not_called()
+    assert _progress_setex_calls(mock_cache_empty)[-1].kwargs["value"] == _progress_value(3, {0})
 
 
 class _CloseOnceERClient:
@@ -824,13 +858,11 @@ async def test_batch_permanent_error_marks_only_individually_delivered_items(
 
     await process_request(_make_batch_request(mocker, items_count=3))
 
-    # Items 0 and 2 succeeded individually; item 1 failed and keeps its bit
-    # unset. It is NOT retried on redelivery: the 4xx fallback path acks the
-    # envelope and publishes ObservationDeliveryFailed for item 1 instead of
-    # raising, so there is no redelivery to retry it on. The bit stays unset
-    # simply because it was never delivered - correct bookkeeping, not a
-    # signal that a retry is coming.
-    assert _progress_setex_calls(mock_cache_empty)[-1].kwargs["value"][8:] == bytes([0b00000101])
+    # Items 0 and 2 succeeded individually; item 1 failed and keeps its
+    # delivered bit unset. It is recorded in the failed bitmap instead, so an
+    # envelope redelivered anyway (partial admission, a transient error in a
+    # later chunk) doesn't post and report it again.
+    assert _progress_setex_calls(mock_cache_empty)[-1].kwargs["value"][8:] == bytes([0b00000101, 0b00000010])
 
 
 @pytest.mark.asyncio
@@ -901,3 +933,165 @@ async def test_batch_delivers_normally_when_cache_read_and_write_fail(
 
     posted = mock_erclient_class.return_value._post.call_args.kwargs["payload"]
     assert len(posted) == 3
+
+
+@pytest.mark.asyncio
+async def test_partially_admitted_batch_delivers_admitted_items_and_nacks_the_rest(
+    mocker,
+    mock_cache_empty,
+    mock_gundi_client_v2_class,
+    mock_erclient_class,
+    mock_pubsub_client,
+):
+    from core.throttling import ThrottledMessage
+
+    mocker.patch("core.utils._cache_db", mock_cache_empty)
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("core.dispatchers.TokenCachingAsyncERClient", mock_erclient_class)
+    mocker.patch("core.utils.pubsub", mock_pubsub_client)
+    mocker.patch.object(settings, "BATCH_DEDUP_LEGACY_FALLBACK_ENABLED", False)
+    # The gate only had room for 2 of the 3 items
+    mock_check = mocker.patch("core.throttling.check_admission", return_value=2)
+
+    with pytest.raises(ThrottledMessage) as exc_info:
+        await process_request(_make_batch_request(mocker, items_count=3))
+
+    assert exc_info.value.reason == "partial"
+    assert 0 < exc_info.value.retry_after <= 60
+    assert mock_check.call_args.kwargs["partial"] is True
+    posted = mock_erclient_class.return_value._post.call_args.kwargs["payload"]
+    assert len(posted) == 2
+    # The admitted part is recorded so the redelivery skips it
+    calls = _progress_setex_calls(mock_cache_empty)
+    assert calls[-1].kwargs["value"][8:] == bytes([0b00000011])
+
+
+@pytest.mark.asyncio
+async def test_partial_admission_on_redelivery_applies_to_pending_items_only(
+    mocker,
+    mock_gundi_client_v2_class,
+    mock_erclient_class,
+    mock_pubsub_client,
+):
+    # Items 0 and 1 were delivered by the previous (partial) attempt; the
+    # gate admits 2 - more than the one item still pending - so nothing is
+    # deferred and the envelope is acked.
+    mock_cache = mocker.MagicMock()
+    mock_cache.get.side_effect = (None, _progress_value(3, {0, 1}))
+    mocker.patch("core.utils._cache_db", mock_cache)
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("core.dispatchers.TokenCachingAsyncERClient", mock_erclient_class)
+    mocker.patch("core.utils.pubsub", mock_pubsub_client)
+    mocker.patch("core.throttling.check_admission", return_value=2)
+
+    await process_request(_make_batch_request(mocker, items_count=3))  # must not raise
+
+    posted = mock_erclient_class.return_value._post.call_args.kwargs["payload"]
+    assert len(posted) == 1
+
+
+@pytest.mark.asyncio
+async def test_redelivered_batch_charges_the_gate_for_pending_items_only(
+    mocker,
+    mock_gundi_client_v2_class,
+    mock_erclient_class,
+    mock_pubsub_client,
+):
+    # Items 0 and 1 were delivered by a previous attempt: only item 2 is
+    # charged, with its share of the envelope's size, and the record read
+    # before admission serves the dispatcher too.
+    progress = _progress_value(3, {0, 1})
+    mock_cache = mocker.MagicMock()
+    mock_cache.get.side_effect = lambda key: progress if key.startswith("batch_progress.") else None
+    mocker.patch("core.utils._cache_db", mock_cache)
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("core.dispatchers.TokenCachingAsyncERClient", mock_erclient_class)
+    mocker.patch("core.utils.pubsub", mock_pubsub_client)
+    mocker.patch.object(settings, "THROTTLING_ENABLED", True)
+    mock_check = mocker.patch("core.throttling.check_admission", return_value=1)
+    request = _make_batch_request(mocker, items_count=3)
+
+    await process_request(request)
+
+    size = len(request.get_json()["message"]["data"])
+    assert mock_check.call_args.kwargs["amount"] == 1
+    assert mock_check.call_args.kwargs["size"] == size // 3
+    progress_reads = [c for c in mock_cache.get.call_args_list if c.args[0].startswith("batch_progress.")]
+    assert len(progress_reads) == 1
+    posted = mock_erclient_class.return_value._post.call_args.kwargs["payload"]
+    assert len(posted) == 1
+
+
+@pytest.mark.asyncio
+async def test_fully_delivered_batch_skips_the_gate(
+    mocker,
+    mock_gundi_client_v2_class,
+    mock_erclient_class,
+    mock_pubsub_client,
+):
+    progress = _progress_value(3, {0, 1, 2})
+    mock_cache = mocker.MagicMock()
+    mock_cache.get.side_effect = lambda key: progress if key.startswith("batch_progress.") else None
+    mocker.patch("core.utils._cache_db", mock_cache)
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("core.dispatchers.TokenCachingAsyncERClient", mock_erclient_class)
+    mocker.patch("core.utils.pubsub", mock_pubsub_client)
+    mocker.patch.object(settings, "THROTTLING_ENABLED", True)
+    mock_check = mocker.patch("core.throttling.check_admission")
+
+    await process_request(_make_batch_request(mocker, items_count=3))
+
+    mock_check.assert_not_called()
+    mock_erclient_class.return_value._post.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_redelivery_skips_items_that_failed_permanently(
+    mocker,
+    mock_gundi_client_v2_class,
+    mock_erclient_class,
+    mock_pubsub_client,
+):
+    # Item 0 was rejected by ER on its own in a previous (partial) attempt.
+    # With room for 1 item, the redelivery posts item 1 - not item 0 again,
+    # which would keep it reported as failed and the envelope from progressing.
+    mock_cache = mocker.MagicMock()
+    mock_cache.get.side_effect = (None, _progress_value(3, set(), failed={0}))
+    mocker.patch("core.utils._cache_db", mock_cache)
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("core.dispatchers.TokenCachingAsyncERClient", mock_erclient_class)
+    mocker.patch("core.utils.pubsub", mock_pubsub_client)
+    mocker.patch("core.throttling.check_admission", return_value=1)
+    mock_failed = mocker.patch("core.event_handlers._publish_item_delivery_failed")
+
+    from core.throttling import ThrottledMessage
+    with pytest.raises(ThrottledMessage):
+        await process_request(_make_batch_request(mocker, items_count=3))
+
+    posted = mock_erclient_class.return_value._post.call_args.kwargs["payload"]
+    assert [o["manufacturer_id"] for o in posted] == ["device-1"]
+    mock_failed.assert_not_called()
+    value = _progress_setex_calls(mock_cache)[-1].kwargs["value"]
+    assert value[8:] == bytes([0b00000010, 0b00000001])
+
+
+@pytest.mark.asyncio
+async def test_fully_admitted_batch_has_no_admitted_count_attribute(
+    mocker,
+    mock_cache_empty,
+    mock_gundi_client_v2_class,
+    mock_erclient_class,
+    mock_pubsub_client,
+):
+    mocker.patch("core.utils._cache_db", mock_cache_empty)
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("core.dispatchers.TokenCachingAsyncERClient", mock_erclient_class)
+    mocker.patch("core.utils.pubsub", mock_pubsub_client)
+    mocker.patch("core.throttling.check_admission", return_value=3)
+    mock_dispatch = mocker.patch(
+        "core.event_handlers.dispatch_observations_batch_v2", return_value=None
+    )
+
+    await process_request(_make_batch_request(mocker, items_count=3))
+
+    assert "admitted_count" not in mock_dispatch.call_args.kwargs["attributes"]
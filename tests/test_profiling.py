@@ -0,0 +1,109 @@
+import logging
+import pstats
+import time
+
+import pytest
+
+import main as main_module
+from core import profiling, settings
+
+
+class Request:
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+
+
+def _busy(seconds=0.03):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+@pytest.fixture(autouse=True)
+def profiling_budget(mocker):
+    mocker.patch.object(profiling, "_profiled", 0)
+    mocker.patch.object(settings, "PROFILING_MAX_REQUESTS", 2)
+    mocker.patch.object(settings, "PROFILING_SAMPLE_INTERVAL_MILLIS", 1)
+
+
+@pytest.fixture
+def output_dir(mocker, tmp_path):
+    mocker.patch.object(settings, "PROFILING_OUTPUT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _profile(request):
+    with profiling.profiled(request):
+        _busy()
+
+
+def test_off_by_default_and_free(mocker):
+    sampler = mocker.patch.object(profiling, "_StackSampler")
+
+    context = profiling.profiled(Request({profiling.PROFILE_HEADER: "anything"}))
+
+    assert context is profiling._NOT_PROFILED
+    sampler.assert_not_called()
+
+
+def test_enabled_profiles_requests_up_to_the_budget(mocker, output_dir):
+    mocker.patch.object(settings, "PROFILING_ENABLED", True)
+
+    for _ in range(3):
+        _profile(Request())
+
+    profiles = sorted(output_dir.glob("profile-*.collapsed"))
+    assert len(profiles) == 2
+    stacks = profiles[0].read_text().splitlines()
+    assert any("tests.test_profiling._busy" in line for line in stacks)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+
+
+@pytest.mark.parametrize("header,profiled", [("s3cret", True), ("wrong", False), (None, False)])
+def test_secret_header_asks_for_a_profile(mocker, output_dir, header, profiled):
+    mocker.patch.object(settings, "PROFILING_SECRET", "s3cret")
+
+    _profile(Request({profiling.PROFILE_HEADER: header} if header else {}))
+
+    assert bool(list(output_dir.glob("profile-*"))) is profiled
+
+
+def test_pstats_format(mocker, output_dir):
+    mocker.patch.object(settings, "PROFILING_ENABLED", True)
+    mocker.patch.object(settings, "PROFILING_FORMAT", "pstats")
+
+    _profile(Request())
+
+    (profile,) = output_dir.glob("profile-*.pstats")
+    functions = {name for _, _, name in pstats.Stats(str(profile)).stats}
+    assert "_busy" in functions
+
+
+def test_profile_is_logged_without_an_output_dir(mocker, caplog):
+    mocker.patch.object(settings, "PROFILING_ENABLED", True)
+
+    with caplog.at_level(logging.INFO, logger="core.profiling"):
+        _profile(Request())
+
+    assert "tests.test_profiling._busy" in caplog.text
+
+
+def test_main_profiles_requests_that_fail(mocker, output_dir):
+    mocker.patch.object(settings, "PROFILING_ENABLED", True)
+    mocker.patch.object(main_module, "process_request", mocker.AsyncMock(side_effect=RuntimeError("boom")))
+
+    with pytest.raises(RuntimeError):
+        main_module.main(mocker.MagicMock())
+
+    assert len(list(output_dir.glob("profile-*.collapsed"))) == 1
+
+
+def test_sampling_errors_are_logged(mocker, output_dir, caplog):
+    mocker.patch.object(settings, "PROFILING_ENABLED", True)
+    mocker.patch.object(profiling, "_stack_of", side_effect=RuntimeError("boom"))
+
+    with caplog.at_level(logging.WARNING, logger="core.profiling"):
+        _profile(Request())
+
+    assert "Error sampling stacks" in caplog.text
+    assert len(list(output_dir.glob("profile-*.collapsed"))) == 1
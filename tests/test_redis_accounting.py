@@ -0,0 +1,97 @@
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from core import redis_accounting, stage_timing, tracing
+from core.redis_accounting import CountingRedis
+from core.services import process_request
+from core.utils import LazyRedisDB
+
+
+@pytest.fixture
+def recording_span(mocker):
+    span = mocker.MagicMock()
+    span.is_recording.return_value = True
+    return span
+
+
+def _attributes(span):
+    return {c.args[0]: c.args[1] for c in span.set_attribute.call_args_list}
+
+
+def test_commands_are_totalled_per_operation(mocker, recording_span):
+    db = CountingRedis(mocker.MagicMock())
+
+    with redis_accounting.per_message(recording_span):
+        db.get("a")
+        with stage_timing.timed("config_lookup"):
+            db.get("b")
+            db.setex("b", 60, "value")
+            with stage_timing.timed("token_resolution"):
+                db.get("c")
+
+    attributes = _attributes(recording_span)
+    assert attributes["redis.commands"] == 4
+    assert attributes["redis.commands.unstaged"] == 1
+    assert attributes["redis.commands.config_lookup"] == 2
+    assert attributes["redis.commands.token_resolution"] == 1
+    assert attributes["redis.time_ms"] >= 0
+
+
+def test_failed_commands_are_counted(mocker, recording_span):
+    db = CountingRedis(mocker.MagicMock())
+    db._db.incr.side_effect = ConnectionError("down")
+
+    with redis_accounting.per_message(recording_span):
+        with pytest.raises(ConnectionError):
+            db.incr("counter")
+
+    assert _attributes(recording_span)["redis.commands"] == 1
+
+
+def test_helpers_are_not_counted_as_commands(mocker, recording_span):
+    client = mocker.MagicMock()
+    db = CountingRedis(client)
+
+    with redis_accounting.per_message(recording_span):
+        assert db.pubsub() is client.pubsub.return_value
+
+    assert _attributes(recording_span)["redis.commands"] == 0
+
+
+def test_commands_are_exported_as_metrics(mocker):
+    commands = mocker.patch.object(redis_accounting, "_commands")
+    db = CountingRedis(mocker.MagicMock())
+
+    with stage_timing.timed("throttle_gate"):
+        db.incr("counter")
+
+    commands.add.assert_called_once_with(1, {"operation": "throttle_gate", "command": "incr"})
+
+
+@pytest.mark.asyncio
+async def test_request_span_carries_the_redis_totals(
+    mocker,
+    mock_cache_empty,
+    mock_gundi_client_v2_class,
+    mock_erclient_class,
+    mock_pubsub_client,
+    event_v2_as_pubsub_request,
+):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    mocker.patch.object(tracing, "tracer", provider.get_tracer("test"))
+    mocker.patch("core.utils._cache_db", LazyRedisDB(connect=lambda: CountingRedis(mock_cache_empty)))
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("core.dispatchers.TokenCachingAsyncERClient", mock_erclient_class)
+    mocker.patch("core.utils.pubsub", mock_pubsub_client)
+
+    await process_request(event_v2_as_pubsub_request)
+
+    (request_span,) = [span for span in exporter.get_finished_spans() if span.name == "er_dispatcher.process_event"]
+    sent = len(mock_cache_empty.method_calls)
+    assert request_span.attributes["redis.commands"] == sent > 0
+    assert request_span.attributes["redis.commands.config_lookup"] >= 1
+    assert request_span.attributes["redis.commands.cache_write"] >= 1
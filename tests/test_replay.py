@@ -0,0 +1,72 @@
+import json
+from datetime import datetime, timezone
+
+from core.services import is_too_old
+from tools import replay
+
+from .benchmarks.workload import build_workload
+
+
+def _recorded(scenario, messages):
+    recorded = []
+    for push, _ in build_workload(scenario, messages):
+        body = push.get_json()
+        body["message"]["publish_time"] = body["message"]["publishTime"] = "2024-07-24T12:51:01.789Z"
+        recorded.append(replay.PushRequest(body=body))
+    return recorded
+
+
+def test_load_requests_reads_bare_and_wrapped_bodies(tmp_path):
+    (push,) = _recorded("events", 1)
+    path = tmp_path / "captured.jsonl"
+    path.write_text(
+        json.dumps(push.body) + "\n\n" + json.dumps({"headers": {"ce-time": "2024-07-24T12:51:01Z"}, "body": push.body})
+    )
+
+    bare, wrapped = replay.load_requests(path)
+
+    assert bare.body == wrapped.body == push.body
+    assert bare.headers == {}
+    assert wrapped.headers == {"ce-time": "2024-07-24T12:51:01Z"}
+
+
+def test_rewritten_requests_are_not_too_old():
+    (push,) = _recorded("events", 1)
+    push.headers = {"ce-time": "2024-07-24T12:51:01.789Z"}
+
+    body, headers = replay.rewrite_timestamps(push, datetime.now(timezone.utc))
+
+    assert not is_too_old(body["message"]["publish_time"])
+    assert not is_too_old(body["message"]["publishTime"])
+    assert not is_too_old(headers["ce-time"])
+    assert push.body["message"]["publish_time"] == "2024-07-24T12:51:01.789Z"
+
+
+def test_replay_delivers_through_the_local_stand_ins():
+    recorded = _recorded("observations", 5)
+
+    with replay.LocalInstance(recorded) as instance:
+        report = replay.replay(recorded, instance, concurrency=2, repeat=2)
+
+    summary = report.summary()
+    assert summary["requests"] == 10
+    assert summary["statuses"] == {"200": 10}
+    assert summary["er_requests"]["POST oauth2/token"] == 1
+    assert summary["latency_p50_ms"] > 0
+    assert summary["redis_commands"]
+
+
+def test_replay_keeps_to_the_rate():
+    recorded = _recorded("events", 1)
+
+    class Instant:
+        def send(self, body, headers):
+            return 200
+
+        def calls(self):
+            return {}
+
+    report = replay.replay(recorded, Instant(), rate=50, repeat=5)
+
+    assert report.requests == 5
+    assert report.duration >= 4 / 50
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from core import stage_timing
+from core.services import process_request
+from erclient import ERClientException
+
+from .conftest import async_return
+from .test_process_observation_batches_v2 import _make_batch_request
+
+DESTINATION_ID = "338225f3-91f9-4fe1-b013-353a229ce504"
+
+
+@pytest.fixture
+def stage_duration(mocker):
+    return mocker.patch.object(stage_timing, "_stage_duration")
+
+
+def _recorded_stages(stage_duration):
+    return [c.args[1] for c in stage_duration.record.call_args_list]
+
+
+@pytest.mark.asyncio
+async def test_timed_records_stage_with_delivery_labels_even_on_error(stage_duration):
+    async def deliver():
+        stage_timing.set_delivery_labels(stream_type="ev", destination_id="dest-1")
+        with pytest.raises(ValueError):
+            with stage_timing.timed("er_post"):
+                raise ValueError("boom")
+
+    await asyncio.create_task(deliver())
+
+    seconds, labels = stage_duration.record.call_args.args
+    assert seconds >= 0
+    assert labels == {"stream_type": "ev", "destination_id": "dest-1", "stage": "er_post"}
+
+
+@pytest.mark.asyncio
+async def test_delivery_labels_stay_in_their_task(stage_duration):
+    async def deliver():
+        stage_timing.set_delivery_labels(stream_type="obv", destination_id="dest-1")
+
+    await asyncio.create_task(deliver())
+    with stage_timing.timed("decode"):
+        pass
+
+    assert _recorded_stages(stage_duration) == [
+        {"stream_type": "unknown", "destination_id": "unknown", "stage": "decode"}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_event_delivery_records_each_stage(
+    mocker,
+    stage_duration,
+    mock_cache_empty,
+    mock_gundi_client_v2_class,
+    mock_erclient_class,
+    mock_pubsub_client,
+    event_v2_as_pubsub_request,
+):
+    mocker.patch("core.utils._cache_db", mock_cache_empty)
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("core.dispatchers.TokenCachingAsyncERClient", mock_erclient_class)
+    mocker.patch("core.utils.pubsub", mock_pubsub_client)
+
+    await process_request(event_v2_as_pubsub_request)
+
+    recorded = _recorded_stages(stage_duration)
+    assert [labels["stage"] for labels in recorded] == [
+        "decode", "throttle_gate", "parse", "config_lookup", "er_post", "cache_write", "event_publish",
+    ]
+    assert all(
+        labels["stream_type"] == "ev" and labels["destination_id"] == DESTINATION_ID
+        for labels in recorded
+    )
+
+
+@pytest.mark.asyncio
+async def test_batch_delivery_records_each_stage(
+    mocker,
+    stage_duration,
+    mock_cache_empty,
+    mock_gundi_client_v2_class,
+    mock_erclient_class,
+    mock_pubsub_client,
+):
+    mocker.patch("core.utils._cache_db", mock_cache_empty)
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("core.dispatchers.TokenCachingAsyncERClient", mock_erclient_class)
+    mocker.patch("core.utils.pubsub", mock_pubsub_client)
+
+    await process_request(_make_batch_request(mocker, items_count=3))
+
+    recorded = _recorded_stages(stage_duration)
+    assert [labels["stage"] for labels in recorded] == [
+        "decode", "throttle_gate", "parse", "config_lookup", "progress_read",
+        "er_post", "progress_flush", "event_publish",
+    ]
+    assert {labels["stream_type"] for labels in recorded} == {"obv"}
+
+
+@pytest.mark.asyncio
+async def test_per_item_fallback_posts_are_timed(
+    mocker,
+    stage_duration,
+    mock_cache_empty,
+    mock_gundi_client_v2_class,
+    mock_erclient_class,
+    mock_pubsub_client,
+):
+    mocker.patch("core.utils._cache_db", mock_cache_empty)
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("core.dispatchers.TokenCachingAsyncERClient", mock_erclient_class)
+    mocker.patch("core.utils.pubsub", mock_pubsub_client)
+    bulk_err = ERClientException("ER error ON POST: bad payload")
+    bulk_err.status_code = 400
+    mock_erclient_class.return_value._post.side_effect = bulk_err
+    mock_erclient_class.return_value.post_sensor_observation.side_effect = [async_return(None) for _ in range(3)]
+
+    await process_request(_make_batch_request(mocker, items_count=3))
+
+    stages = [labels["stage"] for labels in _recorded_stages(stage_duration)]
+    assert stages.count("er_post") == 4  # the rejected bulk post, then one per item
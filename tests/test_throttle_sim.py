@@ -0,0 +1,121 @@
+import json
+
+from core import settings
+from tools import throttle_sim
+from tools.throttle_sim import ERModel, FakeClock, InMemoryRedis, SimMessage, simulate
+
+
+def test_in_memory_redis_expires_keys_on_the_fake_clock():
+    clock = FakeClock()
+    db = InMemoryRedis(clock)
+
+    db.setex("cooldown", 30, "site")
+    assert db.ttl("cooldown") == 30
+    clock.now += 29.5
+    assert db.ttl("cooldown") == 1
+    clock.now += 0.5
+    assert db.ttl("cooldown") == -2
+    assert db.get("cooldown") is None
+
+
+def test_in_memory_redis_incr_keeps_expiry_and_set_nx_respects_existing_keys():
+    clock = FakeClock()
+    db = InMemoryRedis(clock)
+
+    assert db.incr("rate", 5) == 5
+    db.expire("rate", 120)
+    assert db.incr("rate", 2) == 7
+    assert db.ttl("rate") == 120
+    assert db.decr("rate", 3) == 4
+    assert db.mget(["rate", "missing"]) == [b"4", None]
+    assert db.set("notify", "1", ex=300, nx=True) is True
+    assert db.set("notify", "1", ex=300, nx=True) is None
+    assert db.ttl("no-such-key") == -2
+
+
+def test_simulation_is_deterministic():
+    traffic, er_model = throttle_sim.steady_scenario(seed=7)
+    first = simulate(traffic, er_model=er_model).summary()
+    traffic, er_model = throttle_sim.steady_scenario(seed=7)
+    second = simulate(traffic, er_model=er_model).summary()
+
+    assert first == second
+
+
+def test_simulation_defers_over_cap_traffic_and_eventually_delivers_it():
+    traffic = throttle_sim.steady_traffic(
+        per_minute=settings.DEFAULT_MAX_EVENT_DELIVERIES_PER_MINUTE * 2, minutes=3
+    )
+
+    report = simulate(traffic)
+
+    assert report.deferrals["rate"] > 0
+    assert report.delivered_items == report.items
+    assert report.attempts > report.messages  # deferrals are paid in redeliveries
+    assert report.summary()["redelivery_amplification"] > 1
+
+
+def test_simulation_models_er_outage_as_site_cooldown():
+    traffic = throttle_sim.steady_traffic(per_minute=30, minutes=10)
+
+    report = simulate(traffic, er_model=ERModel(outages=[(60, 240)]))
+
+    assert report.er_responses[503] > 0
+    assert report.deferrals["cooldown"] > 0
+    assert report.notifications == 1  # one notice per notify window
+
+
+def test_simulation_honors_er_retry_after():
+    # ER accepts 10 events/min and asks for a 120s pause; the cooldown must
+    # hold deliveries back for that long instead of the 30s exponential base
+    traffic = [SimMessage(arrival=i, destination_id="dest-1", stream_type="ev") for i in range(20)]
+
+    report = simulate(traffic, er_model=ERModel(items_per_minute={"events": 10}, retry_after=120))
+
+    assert report.er_responses[429] >= 1
+    assert max(report.latencies) >= 120
+
+
+def test_simulation_partially_admits_large_batches():
+    cap = settings.DEFAULT_MAX_OBSERVATION_DELIVERIES_PER_MINUTE
+    traffic = [SimMessage(arrival=0, destination_id="dest-1", stream_type="obv", amount=cap + 100)]
+
+    report = simulate(traffic)
+
+    assert report.deferrals["partial"] == 1
+    assert report.delivered_items == cap + 100
+    assert report.er_responses[200] == 2
+
+
+def test_simulation_applies_setting_overrides_and_restores_them():
+    traffic = throttle_sim.steady_traffic(per_minute=100, minutes=2)
+    original = settings.DEFAULT_MAX_EVENT_DELIVERIES_PER_MINUTE
+
+    relaxed = simulate(traffic, overrides={"DEFAULT_MAX_EVENT_DELIVERIES_PER_MINUTE": "1000"})
+
+    assert relaxed.deferrals["rate"] == 0
+    assert settings.DEFAULT_MAX_EVENT_DELIVERIES_PER_MINUTE == original
+    assert settings.THROTTLING_ENABLED is False
+
+
+def test_load_traffic_reads_recorded_jsonl(tmp_path):
+    recorded = tmp_path / "traffic.jsonl"
+    recorded.write_text(
+        json.dumps({"t": 1.5, "destination_id": "dest-9", "stream_type": "obv", "batch_count": 50, "size": 9000})
+        + "\n\n"
+        + json.dumps({"t": 3})
+        + "\n"
+    )
+
+    messages = throttle_sim.load_traffic(str(recorded))
+
+    assert [(m.arrival, m.destination_id, m.stream_type, m.amount, m.size) for m in messages] == [
+        (1.5, "dest-9", "obv", 50, 9000),
+        (3.0, "dest-1", "ev", 1, 0),
+    ]
+
+
+def test_percentile_uses_nearest_rank():
+    assert throttle_sim.percentile([], 50) is None
+    assert throttle_sim.percentile([5, 1, 3, 2, 4], 50) == 3
+    assert throttle_sim.percentile(list(range(1, 101)), 99) == 99
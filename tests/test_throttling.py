@@ -1,3 +1,5 @@
+from types import SimpleNamespace
+
 import pytest
 from redis import exceptions as redis_exceptions
 
@@ -5,6 +7,7 @@ from core import settings, throttling
 from core.services import process_request
 from core.throttling import ThrottledMessage, check_admission
 import main as main_module
+from tools.throttle_sim import FakeClock, InMemoryRedis
 
 from .conftest import async_return
 
@@ -47,7 +50,9 @@ async def test_admits_message_under_cap(mock_throttle_db, throttling_enabled):
 
 
 @pytest.mark.asyncio
-async def test_defers_message_over_cap(mock_throttle_db, throttling_enabled):
+async def test_defers_message_over_cap(mocker, mock_throttle_db, throttling_enabled):
+    # Deferred at once, rather than evaluated again past a window ending soon
+    mocker.patch.object(settings, "THROTTLE_GRACE_WAIT_MAX_SECONDS", 0)
     mock_throttle_db.incr.return_value = settings.DEFAULT_MAX_EVENT_DELIVERIES_PER_MINUTE + 1
 
     with pytest.raises(ThrottledMessage) as exc_info:
@@ -56,6 +61,7 @@ async def test_defers_message_over_cap(mock_throttle_db, throttling_enabled):
     assert exc_info.value.reason == "rate"
     assert exc_info.value.family == "events"
     assert exc_info.value.destination_id == "dest-1"
+    mock_throttle_db.decr.assert_called_once_with(mock_throttle_db.incr.call_args.args[0], 1)
 
 
 @pytest.mark.asyncio
@@ -638,3 +644,390 @@ async def test_amount_one_admission_behavior_is_unchanged(
     mock_throttle_db.incr.return_value = cap + 1
     with pytest.raises(ThrottledMessage):
         await check_admission(destination_id="dest-1", stream_type="obv", amount=1)  # rejected just above
+
+
+@pytest.fixture
+def byte_budget(mocker):
+    mocker.patch.object(settings, "DEFAULT_MAX_DELIVERY_BYTES_PER_MINUTE", 10_000)
+    mocker.patch.object(settings, "THROTTLE_GRACE_WAIT_MAX_SECONDS", 0)
+    return 10_000
+
+
+@pytest.mark.asyncio
+async def test_byte_budget_is_ignored_when_disabled(mock_throttle_db, throttling_enabled):
+    # DEFAULT_MAX_DELIVERY_BYTES_PER_MINUTE defaults to 0: only the item counter
+    await check_admission(destination_id="dest-1", stream_type="obv", amount=1, size=50_000)
+
+    rate_keys = [c.args[0] for c in mock_throttle_db.incr.call_args_list]
+    assert len(rate_keys) == 1
+    assert rate_keys[0].startswith("throttle:rate:dest-1:observations:")
+
+
+@pytest.mark.asyncio
+async def test_byte_budget_debits_payload_size_next_to_item_counter(
+        mock_throttle_db, throttling_enabled, byte_budget
+):
+    mock_throttle_db.incr.side_effect = [1, 2_000]  # items, then bytes
+
+    await check_admission(destination_id="dest-1", stream_type="obv", amount=1, size=2_000)
+
+    (rate_call, bytes_call) = mock_throttle_db.incr.call_args_list
+    assert rate_call.args[0].startswith("throttle:rate:dest-1:observations:")
+    assert bytes_call.args[0].startswith("throttle:bytes:dest-1:observations:")
+    assert bytes_call.args[1] == 2_000
+    assert mock_throttle_db.expire.call_count == 2  # both windows opened here
+
+
+@pytest.mark.asyncio
+async def test_byte_budget_defers_when_window_bytes_exhausted(
+        mock_throttle_db, throttling_enabled, byte_budget
+):
+    # Items well under cap, but the window already carried the whole byte budget
+    mock_throttle_db.incr.side_effect = [5, byte_budget + 3_000]
+
+    with pytest.raises(ThrottledMessage) as exc_info:
+        await check_admission(destination_id="dest-1", stream_type="obv", amount=1, size=3_000)
+
+    assert exc_info.value.reason == "bytes"
+    assert exc_info.value.family == "observations"
+    # Nothing was delivered: the item and byte debits are both given back
+    (rate_refund, bytes_refund) = mock_throttle_db.decr.call_args_list
+    assert rate_refund.args[0].startswith("throttle:rate:dest-1:observations:")
+    assert rate_refund.args[1] == 1
+    assert bytes_refund.args[0].startswith("throttle:bytes:dest-1:observations:")
+    assert bytes_refund.args[1] == 3_000
+
+
+@pytest.mark.asyncio
+async def test_byte_budget_admits_envelope_larger_than_budget_on_fresh_window(
+        mock_throttle_db, throttling_enabled, byte_budget
+):
+    # Same prior-headroom rule as items: an oversized envelope still progresses
+    mock_throttle_db.incr.side_effect = [200, 4 * byte_budget]
+
+    await check_admission(
+        destination_id="dest-1", stream_type="obv", amount=200, size=4 * byte_budget
+    )  # must not raise
+
+
+@pytest.mark.asyncio
+async def test_byte_budget_skipped_for_zero_or_malformed_size(
+        mock_throttle_db, throttling_enabled, byte_budget
+):
+    for size in (0, -10, "garbage", None):
+        mock_throttle_db.reset_mock()
+        mock_throttle_db.ttl.return_value = -2
+        mock_throttle_db.incr.return_value = 1
+
+        await check_admission(destination_id="dest-1", stream_type="obv", size=size)
+
+        assert mock_throttle_db.incr.call_count == 1  # item counter only
+
+
+@pytest.mark.asyncio
+async def test_process_request_debits_encoded_payload_size(
+        mocker, throttling_enabled, event_v2_as_pubsub_request
+):
+    mock_check = mocker.patch("core.throttling.check_admission", side_effect=ThrottledMessage(
+        destination_id="dest-1", family="events", reason="bytes", retry_after=10
+    ))
+
+    with pytest.raises(ThrottledMessage):
+        await process_request(event_v2_as_pubsub_request)
+
+    encoded = event_v2_as_pubsub_request.get_json()["message"]["data"]
+    assert mock_check.call_args.kwargs["size"] == len(encoded)
+
+
+@pytest.fixture
+def priority_lanes(mocker):
+    # 1000/min shared by all families; events reserve 300, messages 100
+    mocker.patch.object(settings, "THROTTLE_DESTINATION_MAX_DELIVERIES_PER_MINUTE", 1000)
+    mocker.patch.object(settings, "THROTTLE_EVENTS_RESERVED_SHARE", 0.3)
+    mocker.patch.object(settings, "THROTTLE_MESSAGES_RESERVED_SHARE", 0.1)
+    mocker.patch.object(settings, "DEFAULT_MAX_OBSERVATION_DELIVERIES_PER_MINUTE", 5000)
+    mocker.patch.object(settings, "THROTTLE_GRACE_WAIT_MAX_SECONDS", 0)
+    return 1000
+
+
+@pytest.mark.asyncio
+async def test_priority_lanes_disabled_by_default(mock_throttle_db, throttling_enabled):
+    await check_admission(destination_id="dest-1", stream_type="obv")
+
+    mock_throttle_db.mget.assert_not_called()
+    assert len(mock_throttle_db.incr.call_args_list) == 1
+
+
+@pytest.mark.asyncio
+async def test_events_debit_shared_budget_but_are_never_gated_by_it(
+        mock_throttle_db, throttling_enabled, priority_lanes
+):
+    # Shared window is far past the destination budget (a backfill ate it)
+    mock_throttle_db.incr.side_effect = [1, 5_000]
+
+    await check_admission(destination_id="dest-1", stream_type="ev")  # must not raise
+
+    shared_call = mock_throttle_db.incr.call_args_list[1]
+    assert shared_call.args[0].startswith("throttle:shared:dest-1:")
+    mock_throttle_db.mget.assert_not_called()  # no reserve math for priority families
+
+
+@pytest.mark.asyncio
+async def test_observations_borrow_everything_when_priority_families_idle(
+        mock_throttle_db, throttling_enabled, priority_lanes
+):
+    mock_throttle_db.mget.return_value = [None, None, None, None]
+    # Shared window already at 999 before this item: still under the full budget
+    mock_throttle_db.incr.side_effect = [1, 1000]
+
+    await check_admission(destination_id="dest-1", stream_type="obv")  # must not raise
+
+
+@pytest.mark.asyncio
+async def test_observations_leave_unused_reserve_to_active_events(
+        mock_throttle_db, throttling_enabled, priority_lanes
+):
+    # Events active (50 this window) -> 250 of their 300 held back; messages idle
+    mock_throttle_db.mget.return_value = [b"50", b"40", None, None]
+    # 760 already used: beyond the 1000 - 250 = 750 observations may use
+    mock_throttle_db.incr.side_effect = [1, 761]
+
+    with pytest.raises(ThrottledMessage) as exc_info:
+        await check_admission(destination_id="dest-1", stream_type="obv")
+
+    assert exc_info.value.reason == "shared"
+    assert exc_info.value.family == "observations"
+    mget_keys = mock_throttle_db.mget.call_args.args[0]
+    assert mget_keys[0].startswith("throttle:rate:dest-1:events:")
+    assert mget_keys[2].startswith("throttle:rate:dest-1:messages:")
+
+
+@pytest.mark.asyncio
+async def test_priority_family_active_in_previous_window_keeps_its_reserve(
+        mock_throttle_db, throttling_enabled, priority_lanes
+):
+    # Messages seen last window only: the whole 100 stays reserved
+    mock_throttle_db.mget.return_value = [None, None, None, b"3"]
+    mock_throttle_db.incr.side_effect = [1, 901]  # prior 900 >= 1000 - 100
+
+    with pytest.raises(ThrottledMessage):
+        await check_admission(destination_id="dest-1", stream_type="obv")
+
+
+@pytest.mark.asyncio
+async def test_exhausted_reserve_is_not_held_back(
+        mock_throttle_db, throttling_enabled, priority_lanes
+):
+    # Events already used more than their reserve: nothing left to hold back
+    mock_throttle_db.mget.return_value = [b"400", None, None, None]
+    mock_throttle_db.incr.side_effect = [1, 950]
+
+    await check_admission(destination_id="dest-1", stream_type="obv")  # must not raise
+
+
+@pytest.mark.asyncio
+async def test_partial_admission_returns_window_headroom_and_refunds_the_rest(
+        mock_throttle_db, throttling_enabled
+):
+    cap = settings.DEFAULT_MAX_OBSERVATION_DELIVERIES_PER_MINUTE
+    # 50 slots left before this 500-item envelope
+    mock_throttle_db.incr.return_value = cap - 50 + 500
+
+    admitted = await check_admission(
+        destination_id="dest-1", stream_type="obv", amount=500, partial=True
+    )
+
+    assert admitted == 50
+    rate_key = mock_throttle_db.incr.call_args.args[0]
+    mock_throttle_db.decr.assert_called_once_with(rate_key, 450)
+
+
+@pytest.mark.asyncio
+async def test_partial_admission_admits_everything_when_it_fits(
+        mock_throttle_db, throttling_enabled
+):
+    mock_throttle_db.incr.return_value = 100
+
+    admitted = await check_admission(
+        destination_id="dest-1", stream_type="obv", amount=100, partial=True
+    )
+
+    assert admitted == 100
+    mock_throttle_db.decr.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_partial_admission_still_defers_on_a_full_window(
+        mocker, mock_throttle_db, throttling_enabled
+):
+    mocker.patch.object(settings, "THROTTLE_GRACE_WAIT_MAX_SECONDS", 0)
+    cap = settings.DEFAULT_MAX_OBSERVATION_DELIVERIES_PER_MINUTE
+    mock_throttle_db.incr.return_value = cap + 500
+
+    with pytest.raises(ThrottledMessage):
+        await check_admission(destination_id="dest-1", stream_type="obv", amount=500, partial=True)
+
+
+@pytest.mark.asyncio
+async def test_partial_admission_disabled_admits_whole_batch(
+        mocker, mock_throttle_db, throttling_enabled
+):
+    mocker.patch.object(settings, "THROTTLE_PARTIAL_ADMISSION_ENABLED", False)
+    cap = settings.DEFAULT_MAX_OBSERVATION_DELIVERIES_PER_MINUTE
+    mock_throttle_db.incr.return_value = cap - 50 + 500
+
+    admitted = await check_admission(
+        destination_id="dest-1", stream_type="obv", amount=500, partial=True
+    )
+
+    assert admitted == 500  # the old overshoot-by-one-batch behavior
+
+
+@pytest.mark.asyncio
+async def test_partial_admission_is_bounded_by_shared_lane(
+        mock_throttle_db, throttling_enabled, priority_lanes
+):
+    mock_throttle_db.mget.return_value = [None, None, None, None]
+    # Family window empty; shared window has 30 slots left out of 1000
+    mock_throttle_db.incr.side_effect = [100, 970 + 100]
+
+    admitted = await check_admission(
+        destination_id="dest-1", stream_type="obv", amount=100, partial=True
+    )
+
+    assert admitted == 30
+    refunded = {c.args[0].split(":")[1]: c.args[1] for c in mock_throttle_db.decr.call_args_list}
+    assert refunded == {"rate": 70, "shared": 70}
+
+
+@pytest.mark.asyncio
+async def test_repeated_deferrals_leave_the_windows_to_admitted_traffic(mocker, throttling_enabled):
+    # Real counters: every deferral has to give back all it was debited
+    clock = FakeClock()
+    db = InMemoryRedis(clock)
+    mocker.patch("core.utils._cache_db", db)
+    mocker.patch.object(throttling, "time", SimpleNamespace(time=clock.time))
+    mocker.patch.object(settings, "THROTTLE_DESTINATION_MAX_DELIVERIES_PER_MINUTE", 1000)
+    mocker.patch.object(settings, "THROTTLE_EVENTS_RESERVED_SHARE", 0)
+    mocker.patch.object(settings, "THROTTLE_MESSAGES_RESERVED_SHARE", 0)
+    mocker.patch.object(settings, "DEFAULT_MAX_OBSERVATION_DELIVERIES_PER_MINUTE", 2000)
+    mocker.patch.object(settings, "DEFAULT_MAX_DELIVERY_BYTES_PER_MINUTE", 10_000)
+    mocker.patch.object(settings, "THROTTLE_GRACE_WAIT_MAX_SECONDS", 0)
+    window = int(clock.time()) // 60
+
+    async def deliver(amount, size):
+        return await check_admission(destination_id="dest-1", stream_type="obv", amount=amount, size=size)
+
+    assert await deliver(600, 10_000) == 600
+    for _ in range(10):
+        with pytest.raises(ThrottledMessage, match="bytes"):
+            await deliver(50, 100)
+    # Room left in both item windows, whatever the byte deferrals debited
+    assert await deliver(400, 0) == 400
+    for _ in range(10):
+        with pytest.raises(ThrottledMessage, match="shared"):
+            await deliver(50, 0)
+
+    assert int(db.get(throttling._rate_key("dest-1", "observations", window))) == 1000
+    assert int(db.get(throttling._shared_key("dest-1", window))) == 1000
+    assert int(db.get(throttling._bytes_key("dest-1", "observations", window))) == 10_000
+
+
+@pytest.mark.asyncio
+async def test_gate_returns_amount_when_disabled_or_failing_open(
+        mock_throttle_db, throttling_enabled
+):
+    mock_throttle_db.ttl.side_effect = redis_exceptions.ConnectionError("boom")
+
+    assert await check_admission(destination_id="dest-1", stream_type="obv", amount=7, partial=True) == 7
+
+
+@pytest.fixture
+def gate_metrics(mocker):
+    return {
+        name: mocker.patch.object(throttling, f"_{name}")
+        for name in (
+            "admitted_items", "deferred_items", "grace_wait",
+            "window_utilization", "cooldown_level", "cooldown_seconds",
+        )
+    }
+
+
+@pytest.mark.asyncio
+async def test_metrics_count_admitted_items_and_window_utilization(
+        mock_throttle_db, throttling_enabled, gate_metrics
+):
+    cap = settings.DEFAULT_MAX_OBSERVATION_DELIVERIES_PER_MINUTE
+    mock_throttle_db.incr.return_value = cap // 2
+
+    await check_admission(destination_id="dest-1", stream_type="obv", amount=cap // 2)
+
+    labels = {"destination_id": "dest-1", "family": "observations"}
+    gate_metrics["admitted_items"].add.assert_called_once_with(cap // 2, labels)
+    gate_metrics["window_utilization"].record.assert_called_once_with(0.5, labels)
+    gate_metrics["deferred_items"].add.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_metrics_count_deferred_items_by_reason(
+        mocker, mock_throttle_db, throttling_enabled, gate_metrics
+):
+    mocker.patch.object(settings, "THROTTLE_GRACE_WAIT_MAX_SECONDS", 0)
+    mock_throttle_db.incr.return_value = settings.DEFAULT_MAX_OBSERVATION_DELIVERIES_PER_MINUTE + 10
+
+    with pytest.raises(ThrottledMessage):
+        await check_admission(destination_id="dest-1", stream_type="obv", amount=10)
+
+    gate_metrics["deferred_items"].add.assert_called_once_with(
+        10, {"destination_id": "dest-1", "family": "observations", "reason": "rate"}
+    )
+    gate_metrics["admitted_items"].add.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_metrics_split_partial_admission_into_admitted_and_deferred(
+        mock_throttle_db, throttling_enabled, gate_metrics
+):
+    cap = settings.DEFAULT_MAX_OBSERVATION_DELIVERIES_PER_MINUTE
+    mock_throttle_db.incr.return_value = cap - 50 + 500
+
+    await check_admission(destination_id="dest-1", stream_type="obv", amount=500, partial=True)
+
+    gate_metrics["admitted_items"].add.assert_called_once_with(
+        50, {"destination_id": "dest-1", "family": "observations"}
+    )
+    gate_metrics["deferred_items"].add.assert_called_once_with(
+        450, {"destination_id": "dest-1", "family": "observations", "reason": "partial"}
+    )
+    gate_metrics["window_utilization"].record.assert_called_once_with(
+        1.0, {"destination_id": "dest-1", "family": "observations"}
+    )
+
+
+@pytest.mark.asyncio
+async def test_metrics_record_grace_wait(mocker, mock_throttle_db, throttling_enabled, gate_metrics):
+    mocker.patch("core.throttling.time").time.return_value = 119  # 59s into the minute
+    mocker.patch("core.throttling.asyncio.sleep")
+    mock_throttle_db.incr.side_effect = [settings.DEFAULT_MAX_EVENT_DELIVERIES_PER_MINUTE + 1, 1]
+
+    await check_admission(destination_id="dest-1", stream_type="ev")
+
+    gate_metrics["grace_wait"].record.assert_called_once_with(
+        1, {"destination_id": "dest-1", "family": "events"}
+    )
+    gate_metrics["admitted_items"].add.assert_called_once()
+
+
+def test_metrics_record_cooldown_level_and_scheduled_seconds(
+        mock_throttle_db, throttling_enabled, gate_metrics
+):
+    mock_throttle_db.incr.return_value = 3
+    mock_throttle_db.set.return_value = None
+
+    throttling.record_distress(destination_id="dest-1", stream_type="ev", status_code=503)
+
+    labels = {"destination_id": "dest-1", "family": "site"}
+    gate_metrics["cooldown_level"].record.assert_called_once_with(3, labels)
+    gate_metrics["cooldown_seconds"].add.assert_called_once_with(
+        min(settings.THROTTLE_COOLDOWN_BASE_SECONDS * 4, settings.THROTTLE_COOLDOWN_MAX_SECONDS), labels
+    )
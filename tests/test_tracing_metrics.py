@@ -0,0 +1,37 @@
+from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from core import settings
+from core.tracing import config
+
+
+def test_meter_provider_records_dispatcher_metrics():
+    reader = InMemoryMetricReader()
+    provider = config.build_meter_provider("er-dispatcher", "0.1.0", reader)
+    try:
+        meter = provider.get_meter("er-dispatcher", "0.1.0")
+        meter.create_counter("dispatcher.redis_commands").add(2, {"operation": "config_lookup"})
+        meter.create_histogram("dispatcher.stage_duration", unit="s").record(0.25, {"stage": "er_post"})
+
+        (resource_metrics,) = reader.get_metrics_data().resource_metrics
+        assert resource_metrics.resource.attributes["service.name"] == "er-dispatcher"
+        (scope_metrics,) = resource_metrics.scope_metrics
+        recorded = {metric.name: metric.data.data_points[0] for metric in scope_metrics.metrics}
+        assert recorded["dispatcher.redis_commands"].value == 2
+        assert recorded["dispatcher.stage_duration"].sum == 0.25
+    finally:
+        provider.shutdown()
+
+
+def test_metrics_enabled_sets_up_the_otlp_exporter(mocker):
+    mocker.patch.object(settings, "METRICS_ENABLED", True)
+    set_meter_provider = mocker.patch.object(config.metrics, "set_meter_provider")
+
+    config.configure_meter(name="er-dispatcher", version="0.1.0")
+
+    (provider,), _ = set_meter_provider.call_args
+    try:
+        (reader,) = provider._sdk_config.metric_readers
+        assert isinstance(reader._exporter, OTLPMetricExporter)
+    finally:
+        provider.shutdown(timeout_millis=100)
@@ -0,0 +1,134 @@
+import logging
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import StatusCode
+
+from core import settings, tracing
+from core.services import process_request
+from core.throttling import ThrottledMessage
+from core.tracing import config
+from core.tracing.sampling import ALWAYS_SAMPLE_ATTRIBUTE, DispatcherSampler, record_always_sampled
+
+
+@pytest.fixture
+def exported_spans():
+    return InMemorySpanExporter()
+
+
+def _tracer(exporter, ratio):
+    provider = TracerProvider(sampler=DispatcherSampler(ratio=ratio))
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    return provider.get_tracer("test")
+
+
+def _exported_names(exporter):
+    return [span.name for span in exporter.get_finished_spans()]
+
+
+def test_sampler_drops_ordinary_spans_at_ratio_zero(exported_spans):
+    tracer = _tracer(exported_spans, ratio=0.0)
+
+    with tracer.start_as_current_span("er_dispatcher.process_event"):
+        with tracer.start_as_current_span("er_dispatcher.handle_er_event"):
+            pass
+
+    assert _exported_names(exported_spans) == []
+
+
+def test_sampler_keeps_every_span_at_ratio_one(exported_spans):
+    tracer = _tracer(exported_spans, ratio=1.0)
+
+    with tracer.start_as_current_span("er_dispatcher.process_event"):
+        with tracer.start_as_current_span("er_dispatcher.handle_er_event"):
+            pass
+
+    assert _exported_names(exported_spans) == ["er_dispatcher.handle_er_event", "er_dispatcher.process_event"]
+
+
+def test_sampler_always_keeps_dead_letters_and_flagged_spans(exported_spans):
+    tracer = _tracer(exported_spans, ratio=0.0)
+
+    with tracer.start_as_current_span("er_dispatcher.process_event"):
+        with tracer.start_as_current_span("send_message_to_dead_letter_topic"):
+            pass
+        with tracer.start_as_current_span("anything", attributes={ALWAYS_SAMPLE_ATTRIBUTE: True}):
+            pass
+
+    assert _exported_names(exported_spans) == ["send_message_to_dead_letter_topic", "anything"]
+
+
+def test_record_always_sampled_marks_the_error(exported_spans):
+    tracer = _tracer(exported_spans, ratio=0.0)
+
+    with tracer.start_as_current_span("er_dispatcher.process_event"):
+        record_always_sampled(
+            tracer, "er_dispatcher.error_processing_event", error=ValueError("boom"), destination_id="dest-1"
+        )
+
+    (span,) = exported_spans.get_finished_spans()
+    assert span.status.status_code == StatusCode.ERROR
+    assert span.attributes["error"] == "ValueError: boom"
+    assert span.attributes["destination_id"] == "dest-1"
+
+
+@pytest.mark.parametrize("configured,expected", [(1.5, 1.0), (-0.2, 0.0)])
+def test_sample_ratio_out_of_range_is_clamped(mocker, caplog, configured, expected):
+    mocker.patch.object(settings, "TRACE_SAMPLE_RATIO", configured)
+
+    with caplog.at_level(logging.WARNING, logger="core.tracing.config"):
+        sampler = config.build_sampler()
+
+    assert sampler._ratio == expected
+    assert "TRACE_SAMPLE_RATIO" in caplog.text
+
+
+def test_span_processor_uses_export_settings(mocker, exported_spans):
+    mocker.patch.object(settings, "TRACE_EXPORT_MAX_QUEUE_SIZE", 100)
+    mocker.patch.object(settings, "TRACE_EXPORT_MAX_BATCH_SIZE", 10)
+    mocker.patch.object(settings, "TRACE_EXPORT_SCHEDULE_DELAY_MILLIS", 250)
+    mocker.patch.object(settings, "TRACE_EXPORT_TIMEOUT_MILLIS", 1000)
+
+    processor = config.build_span_processor(exported_spans)
+    try:
+        assert processor.max_queue_size == 100
+        assert processor.max_export_batch_size == 10
+        assert processor.schedule_delay_millis == 250
+        assert processor.export_timeout_millis == 1000
+    finally:
+        processor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_throttled_message_is_traced_even_when_sampled_out(
+    mocker, exported_spans, event_v2_as_pubsub_request
+):
+    mocker.patch.object(tracing, "tracer", _tracer(exported_spans, ratio=0.0))
+    mocker.patch(
+        "core.services.throttling.check_admission",
+        side_effect=ThrottledMessage(destination_id="dest-1", family="events", reason="rate", retry_after=30),
+    )
+
+    with pytest.raises(ThrottledMessage):
+        await process_request(event_v2_as_pubsub_request)
+
+    (span,) = exported_spans.get_finished_spans()
+    assert span.name == "er_dispatcher.throttle_deferred"
+    assert span.attributes["reason"] == "rate"
+
+
+@pytest.mark.asyncio
+async def test_failed_delivery_is_traced_even_when_sampled_out(
+    mocker, exported_spans, mock_cache_empty, event_v2_as_pubsub_request
+):
+    mocker.patch.object(tracing, "tracer", _tracer(exported_spans, ratio=0.0))
+    mocker.patch("core.services.process_transformer_event_v2", side_effect=RuntimeError("boom"))
+
+    with pytest.raises(RuntimeError):
+        await process_request(event_v2_as_pubsub_request)
+
+    (span,) = exported_spans.get_finished_spans()
+    assert span.name == "er_dispatcher.error_processing_event"
+    assert span.attributes["stream_type"] == "ev"
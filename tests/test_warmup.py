@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+from redis import exceptions as redis_exceptions
+
+from core import settings, utils, warmup
+from core.utils import get_integration_details
+
+
+@pytest.fixture
+def mock_portal(mocker, mock_cache_empty, mock_gundi_client_v2_class):
+    mocker.patch("core.utils._cache_db", mock_cache_empty)
+    mocker.patch("core.utils.GundiClient", mock_gundi_client_v2_class)
+    return mock_gundi_client_v2_class.return_value
+
+
+@pytest.mark.asyncio
+async def test_integration_details_are_remembered_in_process(
+        mock_portal, mock_cache_empty, destination_integration_v2
+):
+    integration_id = str(destination_integration_v2.id)
+
+    first = await get_integration_details(integration_id=integration_id)
+    second = await get_integration_details(integration_id=integration_id)
+
+    assert first == second == destination_integration_v2
+    assert mock_portal.get_integration_details.call_count == 1
+    assert mock_cache_empty.get.call_count == 1  # the second lookup skips Redis
+    # Marked as recently used for the next instance's warm-up
+    key, members = mock_cache_empty.zadd.call_args.args
+    assert key == utils.RECENT_DESTINATIONS_KEY
+    assert list(members) == [integration_id]
+
+
+@pytest.mark.asyncio
+async def test_remembered_integration_details_expire(
+        mocker, mock_portal, mock_cache_empty, destination_integration_v2
+):
+    integration_id = str(destination_integration_v2.id)
+    await get_integration_details(integration_id=integration_id)
+
+    clock = mocker.patch("core.utils.time.monotonic")
+    clock.return_value = 10 ** 9  # far past the memory TTL
+    await get_integration_details(integration_id=integration_id)
+
+    assert mock_portal.get_integration_details.call_count == 2
+    assert mock_cache_empty.zadd.call_count == 2  # noted again after the interval
+
+
+@pytest.mark.asyncio
+async def test_integration_details_memory_disabled_with_zero_ttl(
+        mocker, mock_portal, mock_cache_empty, destination_integration_v2
+):
+    mocker.patch.object(settings, "INTEGRATION_DETAILS_MEMORY_TTL_SECONDS", 0)
+    integration_id = str(destination_integration_v2.id)
+
+    await get_integration_details(integration_id=integration_id)
+    await get_integration_details(integration_id=integration_id)
+
+    assert mock_cache_empty.get.call_count == 2
+    # Still marked as recently used, once per interval rather than per lookup
+    mock_cache_empty.zadd.assert_called_once()
+    key, members = mock_cache_empty.zadd.call_args.args
+    assert key == utils.RECENT_DESTINATIONS_KEY
+    assert list(members) == [integration_id]
+
+
+def test_hot_destinations_merge_configured_and_recent(mocker, mock_cache_empty):
+    mocker.patch("core.utils._cache_db", mock_cache_empty)
+    mocker.patch.object(settings, "WARMUP_DESTINATION_IDS", ["dest-a", "dest-b"])
+    mocker.patch.object(settings, "WARMUP_MAX_DESTINATIONS", 3)
+    mock_cache_empty.zrevrangebyscore.return_value = [b"dest-b", b"dest-c", b"dest-d"]
+
+    assert warmup.hot_destination_ids() == ["dest-a", "dest-b", "dest-c"]
+    mock_cache_empty.zremrangebyscore.assert_called_once()  # old entries trimmed
+
+
+def test_hot_destinations_survive_redis_errors(mocker, mock_cache_with_connection_error):
+    mocker.patch("core.utils._cache_db", mock_cache_with_connection_error)
+    mock_cache_with_connection_error.zremrangebyscore.side_effect = redis_exceptions.ConnectionError("down")
+    mocker.patch.object(settings, "WARMUP_DESTINATION_IDS", ["dest-a"])
+
+    assert warmup.hot_destination_ids() == ["dest-a"]
+
+
+@pytest.mark.asyncio
+async def test_warm_up_resolves_details_and_tokens(mocker, destination_integration_v2):
+    mock_get_details = mocker.patch(
+        "core.warmup.get_many_integration_details",
+        return_value={"dest-a": destination_integration_v2, "dest-b": destination_integration_v2},
+    )
+    er_client = mocker.MagicMock()
+    er_client.username = "gundi_serviceaccount"
+    er_client.auth_headers = mocker.AsyncMock()
+    er_client.close = mocker.AsyncMock()
+    mocker.patch("core.warmup.ERDispatcherV2.make_er_client", return_value=er_client)
+
+    warmed = await warmup.warm_up(["dest-a", "dest-b"])
+
+    assert warmed == 2
+    mock_get_details.assert_called_once_with(["dest-a", "dest-b"], max_concurrency=settings.WARMUP_CONCURRENCY)
+    assert er_client.auth_headers.await_count == 2
+    assert er_client.close.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_warm_up_skips_failing_destinations(mocker, destination_integration_v2):
+    # "missing" wasn't resolved, "broken" has no usable auth settings
+    mocker.patch(
+        "core.warmup.get_many_integration_details",
+        return_value={"broken": destination_integration_v2, "dest-a": destination_integration_v2},
+    )
+    mocker.patch(
+        "core.warmup.ERDispatcherV2.make_er_client",
+        side_effect=[ValueError("Authentication settings are missing"), mocker.MagicMock(
+            username="", close=mocker.AsyncMock()
+        )],
+    )
+
+    assert await warmup.warm_up(["missing", "broken", "dest-a"]) == 1
+
+
+def test_run_never_raises(mocker):
+    async def slow_warm_up():
+        await asyncio.sleep(1)
+
+    mocker.patch("core.warmup.warm_up", slow_warm_up)
+    mocker.patch.object(settings, "WARMUP_TIMEOUT_SECONDS", 0.01)
+
+    warmup.run()  # times out quietly
@@ -0,0 +1,328 @@
+"""Replay recorded push requests against a local dispatcher.
+
+Fires recorded PubSub push requests at the dispatcher, at a set rate or
+concurrency, and prints a throughput and latency report, so production bursts
+can be reproduced on a laptop:
+
+    python -m tools.replay captured.jsonl --concurrency 8
+    python -m tools.replay captured.jsonl --rate 200 --repeat 10
+    python -m tools.replay captured.jsonl --url http://localhost:8080 --rate 50
+
+Recorded requests are JSONL, one push request body per line, as PubSub posts
+it (see test_local.sh):
+    {"message": {"data": "...", "attributes": {...}, "message_id": "...", "publish_time": "..."}, "subscription": "..."}
+or wrapped together with the request headers:
+    {"headers": {"ce-time": "..."}, "body": {"message": {...}, "subscription": "..."}}
+
+Publish times (and ce-time) are rewritten to when each request is sent, so
+old recordings aren't dead-lettered as too old (see services.is_too_old).
+
+By default requests go through main.main in this process, on worker threads as
+under functions_framework, against local stand-ins (tools.standins): ER is an
+HTTP server on localhost, Redis is in memory, PubSub and GCS are fakes. Each v2
+destination in the traffic is set up in the cache as an ER site served by the
+local ER. With --url, requests are posted to a running instance instead,
+which uses whatever services it's configured with.
+
+With --rate, requests are sent on a fixed schedule whatever the response times
+(with up to --concurrency in flight), and latency is counted from the scheduled
+send time, so queueing shows in it. Without it, --concurrency workers send the
+requests back to back.
+"""
+import argparse
+import collections
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List
+from unittest import mock
+
+from tools import standins
+from tools.throttle_sim import percentile
+
+# Cached destination details stay fresh for the whole replay, so nothing
+# tries to refresh them from the portal
+LOCAL_CONFIG_CACHE_TTL = 7 * 24 * 3600
+LOCAL_ER_BASE_URL = "https://er-replay.test"
+
+
+@dataclass
+class PushRequest:
+    body: dict
+    headers: dict = field(default_factory=dict)
+
+    @property
+    def attributes(self):
+        return self.body.get("message", {}).get("attributes") or {}
+
+    @property
+    def items(self):
+        try:
+            return max(1, int(self.attributes.get("batch_count") or 1))
+        except (TypeError, ValueError):
+            return 1
+
+
+@dataclass
+class ReplayReport:
+    duration: float = 0.0
+    requests: int = 0
+    items: int = 0
+    statuses: collections.Counter = field(default_factory=collections.Counter)
+    latencies: List[float] = field(default_factory=list)
+    stand_ins: dict = field(default_factory=dict)
+
+    def record(self, push, status, seconds):
+        self.requests += 1
+        self.items += push.items
+        self.statuses[status] += 1
+        self.latencies.append(seconds * 1000)
+
+    def summary(self):
+        return {
+            "duration_seconds": round(self.duration, 2),
+            "requests": self.requests,
+            "items": self.items,
+            "statuses": {str(status): count for status, count in self.statuses.items()},
+            "throughput_requests_per_second": round(self.requests / self.duration, 1) if self.duration else 0.0,
+            "throughput_items_per_second": round(self.items / self.duration, 1) if self.duration else 0.0,
+            "latency_p50_ms": percentile(self.latencies, 50),
+            "latency_p95_ms": percentile(self.latencies, 95),
+            "latency_p99_ms": percentile(self.latencies, 99),
+            "latency_max_ms": round(max(self.latencies), 2) if self.latencies else None,
+            **self.stand_ins,
+        }
+
+
+def load_requests(path):
+    requests = []
+    with open(path) as recorded:
+        for line in recorded:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "body" in entry:
+                requests.append(PushRequest(body=entry["body"], headers=entry.get("headers") or {}))
+            else:
+                requests.append(PushRequest(body=entry))
+    return requests
+
+
+def rewrite_timestamps(push, now):
+    """The push request's body and headers, as if it were published at now."""
+    stamp = now.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    message = dict(push.body["message"])
+    timestamp_keys = [key for key in ("publish_time", "publishTime", "time") if key in message] or ["publish_time"]
+    for key in timestamp_keys:
+        message[key] = stamp
+    headers = dict(push.headers)
+    if "ce-time" in headers:
+        headers["ce-time"] = stamp
+    return {**push.body, "message": message}, headers
+
+
+class _SharedRedis:
+    # The in-memory Redis, used from several worker threads: one command at a time
+    def __init__(self, redis):
+        self._redis = redis
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self._redis, name)
+        if not callable(attribute):
+            return attribute
+
+        def command(*args, **kwargs):
+            with self._lock:
+                return attribute(*args, **kwargs)
+
+        return command
+
+
+class _Request:
+    # What functions_framework hands main.main
+    def __init__(self, body, headers):
+        self._json = body
+        self.data = json.dumps(body)
+        self.headers = headers
+
+    def get_json(self):
+        return self._json
+
+
+def local_er_integration(destination_id, base_url=LOCAL_ER_BASE_URL):
+    """An ER site logging in with username/password, for the local ER."""
+    actions = {
+        "auth": "43ec4163-2f40-43fc-af62-bca1db77c06b",
+        "push_events": "9286bb71-9aca-425a-881f-7fe0b2dba4f4",
+        "push_positions": "aae0cf50-fbc7-4810-84fd-53fb75020a43",
+    }
+    action_types = {"auth": "auth", "push_events": "push", "push_positions": "push"}
+    return {
+        "id": destination_id, "name": "ER Replay", "base_url": base_url, "enabled": True,
+        "type": {
+            "id": "45c66a61-71e4-4664-a7f2-30d465f87aa6", "name": "EarthRanger", "value": "earth_ranger",
+            "description": "", "actions": [
+                {"id": action_id, "type": action_types[value], "name": value, "value": value, "description": "",
+                 "schema": {}}
+                for value, action_id in actions.items()
+            ],
+        },
+        "owner": {"id": "e2d1b0fc-69fe-408b-afc5-7f54872730c0", "name": "Replay", "description": ""},
+        "configurations": [
+            {"id": "013ea7ce-4944-4f7e-8a2f-e5338b3741ce", "integration": destination_id,
+             "action": {"id": actions["auth"], "type": "auth", "name": "auth", "value": "auth"},
+             "data": {"username": "replay", "password": "replay-password"}},
+            {"id": "5de91c7b-f28a-4ce7-8137-273ac10674d2", "integration": destination_id,
+             "action": {"id": actions["push_positions"], "type": "push", "name": "push_positions",
+                        "value": "push_positions"},
+             "data": {"endpoint": "api/v1/positions"}},
+        ],
+        "additional": {}, "default_route": None, "status": "healthy",
+    }
+
+
+class LocalInstance:
+    """
+    The dispatcher in this process, against the local stand-ins. A context
+    manager: stand-ins are set up on entry and torn down on exit.
+    """
+
+    def __init__(self, requests, er_latency_seconds=0.0):
+        self._destinations = {
+            push.attributes["destination_id"]
+            for push in requests
+            if push.attributes.get("gundi_version") == "v2" and push.attributes.get("destination_id")
+        }
+        self._er_latency_seconds = er_latency_seconds
+        self._stack = ExitStack()
+        self._main = None
+        self.redis = self.er = None
+
+    def __enter__(self):
+        from gundi_core.schemas import v2 as schemas_v2
+        from core import utils
+
+        stack = self._stack
+        self.redis = standins.LocalRedis()
+        shared_redis = _SharedRedis(self.redis)
+        stack.enter_context(mock.patch("core.utils._cache_db", shared_redis))
+        stack.enter_context(mock.patch("core.er_auth._cache_db", shared_redis))
+        stack.enter_context(mock.patch("core.utils._cache_ttl", LOCAL_CONFIG_CACHE_TTL))
+        stack.enter_context(mock.patch("gcloud.aio.pubsub.PublisherClient", standins.FakePublisher))
+        stack.enter_context(mock.patch("core.dispatchers.get_cloud_storage", standins.FakeCloudStorage))
+        standins.FakePublisher.published.clear()
+        self.er = stack.enter_context(standins.LocalER(latency_seconds=self._er_latency_seconds))
+        stack.enter_context(standins.redirect_er_clients(self.er))
+        for destination_id in self._destinations:
+            utils.cache_integration_details(
+                destination_id, schemas_v2.Integration.parse_obj(local_er_integration(destination_id))
+            )
+        # Imported once the stand-ins are in place: importing main may start
+        # the warmup or the config invalidation listener
+        import main
+
+        self._main = main
+        return self
+
+    def __exit__(self, *exc):
+        self._stack.close()
+
+    def send(self, body, headers):
+        try:
+            response = self._main.main(_Request(body, headers))
+        except Exception:
+            # functions_framework's answer to an unhandled error
+            return 500
+        return response[1] if isinstance(response, tuple) else 200
+
+    def calls(self):
+        return {
+            "redis_commands": dict(self.redis.commands),
+            "er_requests": {f"{method} {route}": count for (method, route), count in self.er.requests.items()},
+            "pubsub_published": sum(standins.FakePublisher.published.values()),
+        }
+
+
+class RemoteInstance:
+    """A running instance (functions-framework, a container...) at url."""
+
+    def __init__(self, url, timeout_seconds=60):
+        import httpx
+
+        self._client = httpx.Client(base_url=url, timeout=timeout_seconds)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._client.close()
+
+    def send(self, body, headers):
+        try:
+            return self._client.post("/", json=body, headers=headers).status_code
+        except Exception as e:
+            return type(e).__name__
+
+    def calls(self):
+        return {}
+
+
+def replay(requests, instance, rate=None, concurrency=1, repeat=1):
+    """Send requests (repeat times over) to instance and return a ReplayReport."""
+    report = ReplayReport()
+    guard = threading.Lock()
+
+    def fire(push, scheduled_at):
+        start = time.perf_counter() if scheduled_at is None else scheduled_at
+        body, headers = rewrite_timestamps(push, datetime.now(timezone.utc))
+        status = instance.send(body, headers)
+        elapsed = time.perf_counter() - start
+        with guard:
+            report.record(push, status, elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="replay") as workers:
+        for sequence, push in enumerate(push for _ in range(repeat) for push in requests):
+            scheduled_at = None
+            if rate:
+                scheduled_at = started + sequence / rate
+                time.sleep(max(0.0, scheduled_at - time.perf_counter()))
+            workers.submit(fire, push, scheduled_at)
+    report.duration = time.perf_counter() - started
+    report.stand_ins = instance.calls()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("requests", help="recorded push requests (JSONL)")
+    parser.add_argument("--rate", type=float, default=None, help="requests per second (default: back to back)")
+    parser.add_argument("--concurrency", type=int, default=1, help="requests in flight at most")
+    parser.add_argument("--repeat", type=int, default=1, help="times to replay the whole recording")
+    parser.add_argument("--url", default=None, help="a running instance to send the requests to")
+    parser.add_argument("--er-latency", type=float, default=0.0, metavar="SECONDS",
+                        help="time the local ER takes to answer each request")
+    args = parser.parse_args(argv)
+
+    requests = load_requests(args.requests)
+    if args.url:
+        instance = RemoteInstance(args.url)
+    else:
+        instance = LocalInstance(requests, er_latency_seconds=args.er_latency)
+    with instance:
+        # The dispatcher logs every request at INFO; keep stdout for the report
+        logging.disable(logging.INFO)
+        report = replay(requests, instance, rate=args.rate, concurrency=args.concurrency, repeat=args.repeat)
+    json.dump(report.summary(), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
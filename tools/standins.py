@@ -0,0 +1,203 @@
+"""Local stand-ins for the services a delivery talks to, for end-to-end
+benchmarks and replays (tools.replay).
+
+- LocalRedis: in-memory Redis (the throttle simulator's, on the wall clock)
+  covering every command the dispatcher uses, counting calls.
+- LocalER: a real HTTP server on localhost answering the ER endpoints the
+  dispatchers post to. ER clients reach it through redirect_er_clients(),
+  since make_er_client always builds https URLs.
+- FakePublisher / FakeCloudStorage: PubSub and GCS without the network.
+"""
+import collections
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import httpx
+
+from tools.throttle_sim import InMemoryRedis
+
+ER_TOKEN_EXPIRES_IN = 172800
+
+
+class WallClock:
+    @property
+    def now(self):
+        return time.time()
+
+
+class LocalRedis(InMemoryRedis):
+    """InMemoryRedis plus the commands outside the throttle gate's subset."""
+
+    def __init__(self):
+        super().__init__(WallClock())
+        self._sorted_sets = collections.defaultdict(dict)
+
+    @property
+    def calls(self):
+        return sum(self.commands.values())
+
+    def eval(self, script, numkeys, *args):
+        # The only script in use: compare-and-delete of a lock (core.er_auth)
+        self.commands["eval"] += 1
+        key, token = args[0], args[numkeys]
+        if self._alive(key) and self._data[key] in (token, str(token).encode()):
+            del self._data[key]
+            self._expires_at.pop(key, None)
+            return 1
+        return 0
+
+    def zadd(self, key, mapping):
+        self.commands["zadd"] += 1
+        self._sorted_sets[key].update(mapping)
+        return len(mapping)
+
+    def zremrangebyscore(self, key, low, high):
+        self.commands["zremrangebyscore"] += 1
+        members = self._sorted_sets[key]
+        for member, score in list(members.items()):
+            if float(low) <= score <= float(high):
+                del members[member]
+
+    def zrevrangebyscore(self, key, high, low, start=0, num=None):
+        self.commands["zrevrangebyscore"] += 1
+        members = sorted(
+            (m for m, s in self._sorted_sets[key].items() if float(low) <= s <= float(high)),
+            key=lambda m: -self._sorted_sets[key][m],
+        )
+        return [m.encode() for m in members[start:None if num is None else start + num]]
+
+    def publish(self, channel, message):
+        self.commands["publish"] += 1
+        return 0
+
+
+class _ERHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like ER
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        server = self.server
+        with server.guard:
+            server.requests[(self.command, server.route(self.path))] += 1
+        if server.latency_seconds:
+            time.sleep(server.latency_seconds)
+        if self.path.startswith("/oauth2/token"):
+            return self._reply(200, {
+                "access_token": uuid.uuid4().hex, "expires_in": ER_TOKEN_EXPIRES_IN,
+                "token_type": "Bearer", "scope": "read write", "refresh_token": uuid.uuid4().hex,
+            })
+        return self._reply(201, {"data": {"id": str(uuid.uuid4())}, "status": {"code": 201}})
+
+    do_POST = _handle
+    do_PATCH = _handle
+
+
+class LocalER(ThreadingHTTPServer):
+    """ER on localhost. `requests` counts (method, route) pairs."""
+    daemon_threads = True
+
+    def __init__(self, latency_seconds=0.0):
+        super().__init__(("127.0.0.1", 0), _ERHandler)
+        self.latency_seconds = latency_seconds
+        self.requests = collections.Counter()
+        self.guard = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, name="local-er", daemon=True)
+
+    @staticmethod
+    def route(path):
+        # Ids stripped so counts group by endpoint
+        parts = path.split("?")[0].strip("/").split("/")
+        return "/".join("{id}" if len(p) >= 32 else p for p in parts)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def calls(self):
+        return sum(self.requests.values())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+_AsyncHTTPTransport = httpx.AsyncHTTPTransport
+
+
+class _RedirectingTransport(httpx.AsyncBaseTransport):
+    # Sends every request to the local ER over plain HTTP, keeping the path
+    def __init__(self, port, **kwargs):
+        self._port = port
+        self._transport = _AsyncHTTPTransport(**kwargs)
+
+    async def handle_async_request(self, request):
+        request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self._port)
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def redirect_er_clients(local_er):
+    # erclient builds its own httpx transport: swap the class it uses.
+    # A patcher, to be used as a context manager.
+    return mock.patch(
+        "erclient.client.httpx.AsyncHTTPTransport",
+        lambda **kwargs: _RedirectingTransport(local_er.port, **kwargs),
+    )
+
+
+class FakePublisher:
+    """gcloud.aio.pubsub.PublisherClient recording what's published."""
+    published = collections.Counter()
+
+    def __init__(self, session=None, **kwargs):
+        pass
+
+    @staticmethod
+    def topic_path(project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    async def publish(self, topic, messages, **kwargs):
+        FakePublisher.published[topic] += len(messages)
+        return {"messageIds": [str(i) for i in range(len(messages))]}
+
+
+class FakeCloudStorage:
+    def download(self, file_path):
+        return file_path.rsplit("/", 1)[-1], b"<svg xmlns='http://www.w3.org/2000/svg'/>"
+
+    def remove(self, file):
+        pass
+
+
+class StandIns:
+    def __init__(self, redis, er):
+        self.redis = redis
+        self.er = er
+
+    def calls(self):
+        # (Redis commands, ER requests, PubSub publishes) so far
+        return self.redis.calls, self.er.calls, sum(FakePublisher.published.values())
@@ -0,0 +1,429 @@
+"""Deterministic traffic simulation for the throttle gate.
+
+Replays synthetic or recorded traffic through core.throttling's
+check_admission / record_distress / record_success against an in-memory Redis
+and a fake clock, with a simple model of ER's responses (rate-limit 429s with
+Retry-After, 5xx outages) and of PubSub's redelivery backoff. Nothing touches
+the network, and the same inputs always produce the same report, so THROTTLE_*
+settings and limiter strategies can be compared offline:
+
+    python -m tools.throttle_sim --scenario backfill
+    python -m tools.throttle_sim --scenario outage --set THROTTLE_COOLDOWN_BASE_SECONDS=60
+    python -m tools.throttle_sim --traffic recorded.jsonl --er-limit observations=600
+
+Recorded traffic is JSONL, one message per line:
+    {"t": 12.5, "destination_id": "...", "stream_type": "obv", "batch_count": 200, "size": 81234}
+where `t` is the arrival time in seconds from the start of the run.
+
+The model has a single consumer (no concurrency) and ignores delivery
+latency: it measures what the gate admits and defers, not ER's response times.
+"""
+import argparse
+import asyncio
+import collections
+import heapq
+import json
+import logging
+import math
+import random
+import sys
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+from unittest import mock
+
+from core import settings, throttling, utils
+
+# Minute-aligned so rate windows line up with the simulated minutes
+SIMULATION_EPOCH = 1_700_000_040
+PUBSUB_MIN_BACKOFF_SECONDS = 10
+PUBSUB_MAX_BACKOFF_SECONDS = 600
+
+
+class FakeClock:
+    def __init__(self, start=SIMULATION_EPOCH):
+        self.start = start
+        self.now = float(start)
+
+    def time(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        # The gate's grace wait costs simulated time, not real time
+        self.now += max(0, seconds)
+
+    @property
+    def elapsed(self):
+        return self.now - self.start
+
+
+class InMemoryRedis:
+    """The subset of the Redis API the throttle gate uses, expiring on a FakeClock."""
+
+    def __init__(self, clock):
+        self._clock = clock
+        self._data = {}
+        self._expires_at = {}
+        self.commands = collections.Counter()
+
+    def _alive(self, key):
+        expires_at = self._expires_at.get(key)
+        if expires_at is not None and expires_at <= self._clock.now:
+            self._data.pop(key, None)
+            self._expires_at.pop(key, None)
+        return key in self._data
+
+    def get(self, key):
+        self.commands["get"] += 1
+        return self._data[key] if self._alive(key) else None
+
+    def mget(self, keys):
+        self.commands["mget"] += 1
+        return [self._data[key] if self._alive(key) else None for key in keys]
+
+    def set(self, key, value, ex=None, nx=False):
+        self.commands["set"] += 1
+        if nx and self._alive(key):
+            return None
+        self._data[key] = value
+        self._expires_at.pop(key, None)
+        if ex is not None:
+            self._expires_at[key] = self._clock.now + ex
+        return True
+
+    def setex(self, name, time, value):
+        self.commands["setex"] += 1
+        self._data[name] = value
+        self._expires_at[name] = self._clock.now + time
+        return True
+
+    def incr(self, key, amount=1):
+        self.commands["incr"] += 1
+        value = int(self._data[key]) + amount if self._alive(key) else amount
+        # Like Redis, INCR keeps the key's existing expiry
+        self._data[key] = str(value).encode()
+        return value
+
+    def decr(self, key, amount=1):
+        self.commands["decr"] += 1
+        value = int(self._data[key]) - amount if self._alive(key) else -amount
+        self._data[key] = str(value).encode()
+        return value
+
+    def expire(self, key, seconds):
+        self.commands["expire"] += 1
+        if not self._alive(key):
+            return False
+        self._expires_at[key] = self._clock.now + seconds
+        return True
+
+    def ttl(self, key):
+        self.commands["ttl"] += 1
+        if not self._alive(key):
+            return -2
+        expires_at = self._expires_at.get(key)
+        if expires_at is None:
+            return -1
+        return int(math.ceil(expires_at - self._clock.now))
+
+    def delete(self, *keys):
+        self.commands["delete"] += 1
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                del self._data[key]
+                self._expires_at.pop(key, None)
+                deleted += 1
+        return deleted
+
+
+@dataclass
+class ERModel:
+    """ER's side: its own per-minute limits and scheduled outages.
+
+    items_per_minute maps a family to the number of items ER accepts per
+    minute before answering 429 (families not listed are unlimited).
+    outages are (start, end) second offsets during which ER answers
+    outage_status.
+    """
+    items_per_minute: Dict[str, int] = field(default_factory=dict)
+    retry_after: Optional[int] = 30
+    outages: List[Tuple[float, float]] = field(default_factory=list)
+    outage_status: int = 503
+    _windows: Dict[Tuple[str, int], int] = field(default_factory=dict)
+
+    def respond(self, elapsed, family, amount):
+        # Returns (status_code, retry_after)
+        if any(start <= elapsed < end for start, end in self.outages):
+            return self.outage_status, None
+        limit = self.items_per_minute.get(family)
+        window = (family, int(elapsed // 60))
+        used = self._windows.get(window, 0)
+        if limit is not None and used + amount > limit:
+            return 429, self.retry_after
+        self._windows[window] = used + amount
+        return 200, None
+
+
+@dataclass
+class SimMessage:
+    arrival: float
+    destination_id: str
+    stream_type: str
+    amount: int = 1
+    size: int = 0
+    attempts: int = 0
+    remaining: int = None
+
+    def __post_init__(self):
+        if self.remaining is None:
+            self.remaining = self.amount
+
+
+@dataclass
+class SimReport:
+    duration: float = 0.0
+    messages: int = 0
+    items: int = 0
+    delivered_items: int = 0
+    completed: int = 0
+    attempts: int = 0
+    dead_lettered: int = 0
+    notifications: int = 0
+    deferrals: collections.Counter = field(default_factory=collections.Counter)
+    er_responses: collections.Counter = field(default_factory=collections.Counter)
+    redis_commands: collections.Counter = field(default_factory=collections.Counter)
+    latencies: List[float] = field(default_factory=list)
+
+    def summary(self):
+        minutes = self.duration / 60 if self.duration else 0
+        return {
+            "duration_seconds": round(self.duration, 1),
+            "messages": self.messages,
+            "items": self.items,
+            "delivered_items": self.delivered_items,
+            "completed_messages": self.completed,
+            "dead_lettered": self.dead_lettered,
+            "throughput_items_per_minute": round(self.delivered_items / minutes, 1) if minutes else 0.0,
+            "attempts": self.attempts,
+            "redelivery_amplification": round(self.attempts / self.messages, 2) if self.messages else 0.0,
+            "deferrals": dict(self.deferrals),
+            "er_responses": {str(status): count for status, count in self.er_responses.items()},
+            "cooldown_notifications": self.notifications,
+            "latency_p50_seconds": percentile(self.latencies, 50),
+            "latency_p95_seconds": percentile(self.latencies, 95),
+            "latency_p99_seconds": percentile(self.latencies, 99),
+            "redis_commands": dict(self.redis_commands),
+        }
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile; None when there is nothing to rank
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100 * len(ordered))))
+    return round(ordered[rank - 1], 2)
+
+
+def pubsub_backoff(attempts):
+    # PubSub's exponential retry policy as configured on the push subscriptions
+    return min(PUBSUB_MAX_BACKOFF_SECONDS, PUBSUB_MIN_BACKOFF_SECONDS * 2 ** (attempts - 1))
+
+
+def _coerce_setting(name, raw_value):
+    current = getattr(settings, name)
+    if isinstance(current, bool):
+        return str(raw_value).lower() in ("1", "true", "yes", "on")
+    if isinstance(current, int):
+        return int(raw_value)
+    if isinstance(current, float):
+        return float(raw_value)
+    return raw_value
+
+
+def simulate(traffic, er_model=None, overrides=None, max_duration=None):
+    """Run traffic (an iterable of SimMessage) through the gate and return a SimReport."""
+    er_model = er_model or ERModel()
+    clock = FakeClock()
+    db = InMemoryRedis(clock)
+    report = SimReport()
+    queue = []
+    for sequence, message in enumerate(traffic):
+        report.messages += 1
+        report.items += message.amount
+        heapq.heappush(queue, (message.arrival, sequence, message))
+    sequence = len(queue)
+    loop = asyncio.new_event_loop()
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(settings, "THROTTLING_ENABLED", True))
+        for name, value in (overrides or {}).items():
+            stack.enter_context(mock.patch.object(settings, name, _coerce_setting(name, value)))
+        stack.enter_context(mock.patch.object(utils, "_cache_db", db))
+        stack.enter_context(mock.patch.object(throttling, "time", SimpleNamespace(time=clock.time)))
+        stack.enter_context(mock.patch.object(throttling, "asyncio", SimpleNamespace(sleep=clock.sleep)))
+        try:
+            while queue:
+                due, _, message = heapq.heappop(queue)
+                if max_duration is not None and due > max_duration:
+                    break
+                # One consumer: a grace wait may have pushed the clock past `due`
+                clock.now = max(clock.now, clock.start + due)
+                if clock.elapsed - message.arrival > settings.MAX_EVENT_AGE_SECONDS:
+                    report.dead_lettered += 1
+                    continue
+                if _attempt(loop, clock, er_model, message, report):
+                    continue
+                sequence += 1
+                redelivery = clock.elapsed + pubsub_backoff(message.attempts)
+                heapq.heappush(queue, (redelivery, sequence, message))
+        finally:
+            loop.close()
+    report.duration = clock.elapsed
+    report.redis_commands = db.commands
+    return report
+
+
+def _attempt(loop, clock, er_model, message, report):
+    # One delivery attempt. Returns True when the message is done (acked).
+    message.attempts += 1
+    report.attempts += 1
+    family = throttling.get_family(message.stream_type)
+    # Charged like admit_and_process_v2 charges a batch envelope: the items
+    # earlier attempts left pending, and their share of its size
+    size = message.size * message.remaining // message.amount if message.amount else message.size
+    try:
+        admitted = loop.run_until_complete(throttling.check_admission(
+            destination_id=message.destination_id,
+            stream_type=message.stream_type,
+            amount=message.remaining,
+            size=size,
+            partial=message.amount > 1,
+        ))
+    except throttling.ThrottledMessage as e:
+        report.deferrals[e.reason] += 1
+        return False
+    status_code, retry_after = er_model.respond(clock.elapsed, family, admitted)
+    report.er_responses[status_code] += 1
+    if status_code != 200:
+        error = "ERClientException: ER error" if status_code else "Request to ER failed"
+        if throttling.record_distress(
+            destination_id=message.destination_id,
+            stream_type=message.stream_type,
+            status_code=status_code,
+            error=error,
+            retry_after=retry_after,
+        ):
+            report.notifications += 1
+        return False
+    throttling.record_success(destination_id=message.destination_id, stream_type=message.stream_type)
+    message.remaining -= admitted
+    report.delivered_items += admitted
+    if message.remaining > 0:
+        report.deferrals["partial"] += 1
+        return False
+    report.completed += 1
+    report.latencies.append(clock.elapsed - message.arrival)
+    return True
+
+
+def steady_traffic(per_minute, minutes, stream_type="ev", destination_id="dest-1",
+                   amount=1, size=512, seed=0):
+    """Poisson-ish arrivals at an average rate, deterministic for a given seed."""
+    rng = random.Random(seed)
+    messages = []
+    t = 0.0
+    end = minutes * 60
+    while True:
+        t += rng.expovariate(per_minute / 60)
+        if t >= end:
+            return messages
+        messages.append(SimMessage(
+            arrival=t, destination_id=destination_id, stream_type=stream_type,
+            amount=amount, size=size * amount,
+        ))
+
+
+def backfill_scenario(seed=0):
+    # A 30-minute observation backfill in 200-item envelopes, with a trickle
+    # of urgent events to the same destination.
+    traffic = steady_traffic(3, 30, stream_type="obv", amount=200, size=400, seed=seed)
+    traffic += steady_traffic(10, 30, stream_type="ev", seed=seed + 1)
+    return traffic, ERModel(items_per_minute={"observations": 1000, "events": 200})
+
+
+def outage_scenario(seed=0):
+    # Steady events with a 5-minute 503 burst starting at minute 5
+    traffic = steady_traffic(60, 20, stream_type="ev", seed=seed)
+    return traffic, ERModel(outages=[(300, 600)])
+
+
+def steady_scenario(seed=0):
+    traffic = steady_traffic(200, 10, stream_type="ev", seed=seed)
+    return traffic, ERModel(items_per_minute={"events": 150}, retry_after=20)
+
+
+SCENARIOS = {
+    "steady": steady_scenario,
+    "backfill": backfill_scenario,
+    "outage": outage_scenario,
+}
+
+
+def load_traffic(path):
+    messages = []
+    with open(path) as recorded:
+        for line in recorded:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            messages.append(SimMessage(
+                arrival=float(entry["t"]),
+                destination_id=entry.get("destination_id", "dest-1"),
+                stream_type=entry.get("stream_type", "ev"),
+                amount=max(1, int(entry.get("batch_count") or 1)),
+                size=int(entry.get("size") or 0),
+            ))
+    return messages
+
+
+def _parse_pairs(pairs):
+    parsed = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition("=")
+        parsed[key.strip()] = value.strip()
+    return parsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--scenario", choices=sorted(SCENARIOS), default="backfill")
+    source.add_argument("--traffic", help="recorded traffic (JSONL)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--set", action="append", metavar="SETTING=VALUE",
+                        help="override a core.settings value (repeatable)")
+    parser.add_argument("--er-limit", action="append", metavar="FAMILY=ITEMS",
+                        help="ER's own per-minute limit for a family (repeatable)")
+    parser.add_argument("--er-retry-after", type=int, default=None,
+                        help="Retry-After seconds ER sends with its 429s")
+    args = parser.parse_args(argv)
+    # The gate logs every deferral at INFO; keep stdout for the report
+    logging.getLogger("core").setLevel(logging.WARNING)
+
+    if args.traffic:
+        traffic, er_model = load_traffic(args.traffic), ERModel()
+    else:
+        traffic, er_model = SCENARIOS[args.scenario](seed=args.seed)
+    for family, limit in _parse_pairs(args.er_limit).items():
+        er_model.items_per_minute[family] = int(limit)
+    if args.er_retry_after is not None:
+        er_model.retry_after = args.er_retry_after
+    report = simulate(traffic, er_model=er_model, overrides=_parse_pairs(args.set))
+    json.dump(report.summary(), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()